@@ -73,8 +73,8 @@ class AlbumListBrowser( PlayableBrowser ):
     # start of the album (or at the track at the given index)
     #
     def play( self, trackIndex = 0 ): 
-        self.source.playObject( self.getCurrentObject(), trackIndex )
-        return PlaybackDisplay( self.client, self )
+        return self.playObject( self.getCurrentObject(), trackIndex ) or \
+            PlaybackDisplay( self.client, self )
 
     #
     # Show ratings editor for the album
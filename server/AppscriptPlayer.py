@@ -0,0 +1,290 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import appscript
+from iTunesXML import Track
+from PlayerBackend import PlayerBackend, PlayerError
+
+#
+# Obtain an AppleScript object that refers to the iTunes application
+#
+def GetApp():
+    return appscript.app( 'iTunes' )
+
+#
+# Obtain an AppleScript object that refers to the main iTunes library.
+# *** FIXME: make universal. I think this is only valid for US or
+# English-speaking countries.
+#
+def GetLibrary():
+    return GetApp().library_playlists[ 'Library' ]
+
+#
+# Implementation of PlayerBackend that controls iTunes through appscript.
+# Playlists are iTunes playlist objects. An appscript CommandError becomes a
+# PlayerError.
+#
+class AppscriptPlayer( PlayerBackend ):
+
+    #
+    # Mapping of iTunes player states to PlayerBackend.kStates values
+    #
+    kStateNames = { appscript.k.playing: 'playing',
+                    appscript.k.paused: 'paused',
+                    appscript.k.stopped: 'stopped',
+                    appscript.k.fast_forwarding: 'fast forwarding',
+                    appscript.k.rewinding: 'rewinding' }
+
+    #
+    # Mapping of iTunes repeat modes to PlayerBackend.kRepeatModes values, and
+    # back again.
+    #
+    kRepeatNames = { appscript.k.off: 'off',
+                     appscript.k.all: 'all',
+                     appscript.k.one: 'one' }
+    kRepeatValues = dict( [ ( name, value ) for value, name in
+                            kRepeatNames.items() ] )
+
+    def getPlayerState( self ):
+        try:
+            state = GetApp().player_state.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+        return self.kStateNames.get( state, str( state ) )
+
+    def getPlayerPosition( self ):
+        try:
+            return int( GetApp().player_position.get() )
+        except TypeError:
+            return 0
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    #
+    # Build a Track object from the attributes of the current iTunes track.
+    #
+    def getCurrentTrack( self ):
+        try:
+            track = GetApp().current_track.get()
+        except appscript.reference.CommandError:
+            return None
+        try:
+            return Track( { 'Name': track.name(),
+                            'Persistent ID': track.persistent_ID(),
+                            'Track Number': track.track_number(),
+                            'Artist': track.artist(),
+                            'Album': track.album(),
+                            'Total Time': int( track.duration() * 1000 ) } )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def getCurrentTrackID( self ):
+        try:
+            return str( GetApp().current_track.persistent_ID.get() )
+        except appscript.reference.CommandError:
+            return None
+
+    def getCurrentPlaylistName( self ):
+        try:
+            return GetApp().current_playlist.name.get()
+        except appscript.reference.CommandError:
+            return None
+
+    def getVolume( self ):
+        try:
+            return int( GetApp().sound_volume.get() )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def setVolume( self, value ):
+        try:
+            GetApp().sound_volume.set( value )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def getMute( self ):
+        try:
+            return GetApp().mute.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def setMute( self, value ):
+        try:
+            GetApp().mute.set( value )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    #
+    # Send the iTunes command NAME, such as 'play', with no arguments.
+    #
+    def sendCommand( self, name ):
+        try:
+            getattr( GetApp(), name )()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def play( self ): self.sendCommand( 'play' )
+    def pause( self ): self.sendCommand( 'pause' )
+    def stop( self ): self.sendCommand( 'stop' )
+    def backTrack( self ): self.sendCommand( 'back_track' )
+    def previousTrack( self ): self.sendCommand( 'previous_track' )
+    def nextTrack( self ): self.sendCommand( 'next_track' )
+    def rewind( self ): self.sendCommand( 'rewind' )
+    def fastForward( self ): self.sendCommand( 'fast_forward' )
+    def resume( self ): self.sendCommand( 'resume' )
+
+    #
+    # iTunes has its own copy of the playlist, so TRACKS is not used.
+    #
+    def findPlaylist( self, name, tracks ):
+        try:
+            return GetApp().user_playlists[ name ].get()
+        except appscript.reference.CommandError:
+            return None
+
+    def makePlaylist( self, name ):
+        try:
+            return GetApp().make(
+                new = appscript.k.user_playlist,
+                with_properties = { appscript.k.name: name } )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def deletePlaylist( self, playlist ):
+        try:
+            playlist.delete()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def clearPlaylist( self, playlist ):
+        try:
+            playlist.tracks.delete()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def addTrack( self, playlist, track ):
+        try:
+            GetLibrary().tracks[
+                appscript.its.persistent_ID == track.getID() ].duplicate(
+                to = playlist )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    #
+    # Duplicate all of TRACKS with one request, by handing iTunes a list of
+    # references to them. If iTunes rejects the list, fall back to adding
+    # the tracks one at a time.
+    #
+    def addTracks( self, playlist, tracks ):
+        library = GetLibrary()
+        references = [ library.tracks[ appscript.its.persistent_ID ==
+                                       track.getID() ] for track in tracks ]
+        try:
+            GetApp().duplicate( references, to = playlist )
+        except appscript.reference.CommandError:
+            PlayerBackend.addTracks( self, playlist, tracks )
+
+    def removeTrack( self, playlist, index ):
+        try:
+            playlist.tracks[ index + 1 ].delete()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def playPlaylist( self, playlist, index ):
+        try:
+            playlist.tracks[ index + 1 ].play()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def getShuffle( self, playlist ):
+        try:
+            return playlist.shuffle.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def setShuffle( self, playlist, value ):
+        try:
+            playlist.shuffle.set( value )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def getRepeat( self, playlist ):
+        try:
+            value = playlist.song_repeat.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+        name = self.kRepeatNames.get( value )
+        if name is None:
+            raise PlayerError, 'unknown repeat mode %r' % ( value, )
+        return name
+
+    def setRepeat( self, playlist, value ):
+        try:
+            playlist.song_repeat.set( self.kRepeatValues[ value ] )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    #
+    # Obtain the iTunes track object for the Track object TRACK.
+    #
+    def getTrackObject( self, track ):
+        return GetLibrary().tracks[
+            appscript.its.persistent_ID == track.getID() ]
+
+    def getTrackRating( self, track ):
+        try:
+            track = self.getTrackObject( track ).get()[ 0 ]
+
+            #
+            # If the user's track rating is 0, iTunes may return to us the
+            # rating value assigned to the track's album. We want to ignore
+            # such a rating for our purposes.
+            #
+            if repr( track.rating_kind.get() ) == 'k.computed':
+                return 0
+            return track.rating.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def setTrackRating( self, track, rating ):
+        try:
+            self.getTrackObject( track ).rating.set( rating )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def getAlbumRating( self, track ):
+        try:
+            track = self.getTrackObject( track ).get()[ 0 ]
+
+            #
+            # If the user's album rating is 0, iTunes may return to us a
+            # computed value based on ratings of the album's tracks. We want
+            # to ignore such a rating for our purposes.
+            #
+            if repr( track.album_rating_kind.get() ) == 'k.computed':
+                return 0
+            return track.album_rating.get()
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
+
+    def setAlbumRating( self, track, rating ):
+        try:
+            self.getTrackObject( track ).album_rating.set( rating )
+        except appscript.reference.CommandError, err:
+            raise PlayerError, err
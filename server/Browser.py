@@ -19,6 +19,7 @@
 
 from Display import DisplayGenerator
 from KeyProcessor import *
+from time import time
 
 #
 # Specialization of Display that supports scrolling through a collection of
@@ -43,9 +44,16 @@ class Browser( DisplayGenerator ):
                 'TUV',
                 'WXYZ' ]
 
+    #
+    # Number of seconds after a keypad character within which a different
+    # digit adds a character to the jump prefix instead of starting a new one.
+    #
+    kPrefixTimeout = 1.0
+
     def __init__( self, client, prevLevel = None, index = 0 ):
         DisplayGenerator.__init__( self, client, prevLevel )
         self.index = index      # Index of the current item to show
+        self.jumpTable = None   # JumpTable for the collection being browsed
         self.reset()            # Initialize to known state
 
     def reset( self ):
@@ -56,6 +64,8 @@ class Browser( DisplayGenerator ):
         self.lastDigit = None
         self.digitIndex = 0
         self.nextLevel = None
+        self.prefix = ''
+        self.lastTime = 0
 
     #
     # Install handlers for the arrow keys.
@@ -166,11 +176,40 @@ class Browser( DisplayGenerator ):
     def getKeyAtIndex( self, index ):
         return self.getCollection()[ index ].getKey()
 
+    #
+    # Determine if the collection being browsed is ordered by key, as
+    # getJumpTable() requires. Derived classes that show their items in some
+    # other order must override and return False.
+    #
+    def isSortedByKey( self ): return True
+
+    #
+    # Obtain the JumpTable for the collection being browsed. Collections of
+    # the library come with their own (see LibrarySnapshot.getJumpTable());
+    # others get one that is kept until the collection or the library
+    # generation changes.
+    #
+    def getJumpTable( self ):
+        collection = self.getCollection()
+        library = self.source.getLibrary()
+        generation = library.getGeneration()
+        table = self.jumpTable
+        if table is None or table.items is not collection or \
+                table.generation != generation or \
+                len( table.keys ) != len( collection ):
+            table = library.getJumpTable( collection )
+            self.jumpTable = table
+        return table
+
     #
     # Override of DisplayGenerator method. If there are 10 or less items, jump
     # to the exact index based on the 'digit' pressed. Otherwise, treat the
     # given digit as a telephone keypad (similar to TextEdit.py -- see the
-    # commentary there)
+    # commentary there). Pressing a different digit within kPrefixTimeout
+    # seconds of the last one adds its character to the prefix to jump to, so
+    # '2', '2', '6' goes to the first item that starts with 'BM' or after. If
+    # the collection is not ordered by key, go to the next item that starts
+    # with the prefix instead, if there is one.
     #
     def digit( self, digit ):
         maxIndex = self.getMaxIndex()
@@ -188,6 +227,7 @@ class Browser( DisplayGenerator ):
             # Get the list of characters that correspond to the pressed digit.
             #
             values = Browser.kDigits[ digit ]
+            now = time()
             if digit == self.lastDigit:
 
                 #
@@ -196,28 +236,45 @@ class Browser( DisplayGenerator ):
                 index = self.digitIndex + 1
                 if index == len( values ):
                     index = 0
+                prefix = self.prefix[ : -1 ]
             else:
                 index = 0
+                if now - self.lastTime <= self.kPrefixTimeout:
+                    prefix = self.prefix
+                else:
+                    prefix = ''
 
             #
-            # Look for the first item that starts with the keypad character
+            # Look for the first item that starts with the keypad characters
             #
-            value = values[ index ]
+            self.prefix = prefix + values[ index ]
             self.lastDigit = digit
             self.digitIndex = index
+            self.lastTime = now
+
+            if not self.isSortedByKey():
+                index = self.findPrefix( self.prefix )
+                if index is not None:
+                    self.setIndex( index )
+                return self
 
             #
-            # Use binary search to locate the first entry that starts with the
-            # value found above.
+            # If nothing starts with the prefix, this is the item that follows
+            # where it would be. Stay on the last item if there is none.
             #
-            lo = 0
-            hi = maxIndex
-            while lo < hi:
-                mid = ( lo + hi ) // 2
-                if self.getKeyAtIndex( mid )[ 0 ] < value:
-                    lo = mid + 1
-                else:
-                    hi = mid
-            self.setIndex( lo )
+            index = self.getJumpTable().getIndex( self.prefix )
+            self.setIndex( min( index, maxIndex - 1 ) )
 
         return self
+
+    #
+    # Locate the first item whose key starts with PREFIX, scanning from the
+    # current item and wrapping around. Returns None if there is none.
+    #
+    def findPrefix( self, prefix ):
+        maxIndex = self.getMaxIndex()
+        for offset in xrange( maxIndex ):
+            index = ( self.index + offset ) % maxIndex
+            if self.getKeyAtIndex( index ).startswith( prefix ):
+                return index
+        return None
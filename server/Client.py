@@ -108,6 +108,11 @@ class Client( object ):
         #
         self.lastKeyTimeStamp = datetime.now() - timedelta( seconds = 1000 )
 
+        #
+        # Whether iTunes was answering requests at the last display refresh.
+        #
+        self.playerResponding = True
+
         #
         # Create a new display animator to use to render Content objects from
         # the active display generator.
@@ -155,7 +160,8 @@ class Client( object ):
         return self.settings.isDirty()
 
     #
-    # Obtain the appscript object connected to iTunes.
+    # Obtain the iTunesXML object that holds the library and controls the
+    # player.
     #
     def getSource( self ): return self.iTunes
 
@@ -311,6 +317,18 @@ class Client( object ):
     #
     def refreshDisplay( self ):
 
+        #
+        # Let the user know when iTunes stops answering. Until it does again,
+        # the displays show the last player state that we know of.
+        #
+        responding = self.iTunes.isPlayerResponding()
+        if responding != self.playerResponding:
+            self.playerResponding = responding
+            if not responding:
+                self.setOverlayGenerator(
+                    NotificationDisplay( self, None, 'Player not responding',
+                                         'Showing last known state' ) )
+
         #
         # If iTunes is currently playing and the current display generator is
         # not a PlaybackDisplay, see if we should force it to be.
@@ -528,7 +546,7 @@ class Client( object ):
             return
         if not isinstance( self.linesGenerator, PlaybackDisplay ):
             playlist = self.iTunes.getActivePlaylist()
-            if playlist.getTrackCount() > 0:
+            if playlist is not None and playlist.getTrackCount() > 0:
                 self.setLinesGenerator(
                     PlaybackDisplay( self, self.linesGenerator ) )
 
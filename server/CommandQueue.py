@@ -0,0 +1,137 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import Queue, threading, traceback
+from PlayerBackend import PlayerError
+
+#
+# Queue of commands that run one at a time, in the order given, in a worker
+# thread. Used for the commands that change iTunes, so that the server loop
+# never waits for iTunes to carry them out. When a command finishes, its
+# completion callback runs in the thread that calls processCompletions(),
+# which should be the server loop.
+#
+# A command may be put with a key. If the last command put has the same key
+# and is still waiting to run, putting another one merges its arguments into
+# the waiting one instead, so a burst of requests (eg. volume key repeats)
+# becomes one command. Only the last command is a candidate, so a merged
+# request never runs ahead of a different command put before it.
+#
+class CommandQueue( object ):
+
+    def __init__( self ):
+        self.commands = Queue.Queue()
+        self.completions = Queue.Queue()
+        self.worker = None      # Started by the first put()
+        self.pending = 0        # Commands put but not yet completed
+        self.failures = 0
+        self.coalesced = 0      # Commands merged into waiting ones
+        self.lock = threading.Lock()
+        self.last = None        # Last command put, if keyed and waiting
+
+    #
+    # Add a command to the queue. COMMAND is the callable to run with the
+    # arguments ARGS. If given, DONE is a callable to run without arguments
+    # from processCompletions() once COMMAND has finished, whether or not it
+    # succeeded. If given, KEY identifies the kind of command. If the last
+    # command put has the same KEY and is still waiting to run, nothing is put;
+    # instead, the waiting command gets the arguments MERGE( old, ARGS ), or
+    # just ARGS if MERGE is None. Returns True if COMMAND was put.
+    #
+    def put( self, command, args = (), done = None, key = None,
+             merge = None ):
+        if self.worker is None:
+            self.worker = threading.Thread( target = self.run )
+            self.worker.setDaemon( True )
+            self.worker.start()
+        self.lock.acquire()
+        try:
+            last = self.last
+            if key is not None and last is not None and last[ 3 ] == key:
+                if merge is not None:
+                    args = merge( last[ 1 ], args )
+                last[ 1 ] = args
+                self.coalesced += 1
+                return False
+            entry = [ command, args, done, key ]
+            if key is not None:
+                self.last = entry
+            else:
+                self.last = None
+            self.pending += 1
+            self.commands.put( entry )
+        finally:
+            self.lock.release()
+        return True
+
+    #
+    # Obtain the number of commands that have not yet completed.
+    #
+    def getPendingCount( self ): return self.pending
+
+    #
+    # Body of the worker thread. Runs each command in turn, and hands it to
+    # processCompletions() when it is done.
+    #
+    def run( self ):
+        while 1:
+            entry = self.commands.get()
+
+            #
+            # Once the command starts, a new request needs a new command.
+            #
+            self.lock.acquire()
+            try:
+                if entry is self.last:
+                    self.last = None
+                command, args, done, key = entry
+            finally:
+                self.lock.release()
+            try:
+                command( *args )
+            except PlayerError, err:
+                print( '*** command failed:', command, err )
+                self.failures += 1
+            except:
+                print( '*** command failed:', command )
+                traceback.print_exc()
+                self.failures += 1
+            self.completions.put( done )
+
+    #
+    # Run the completion callbacks of the commands that have finished since
+    # the last call. Never waits for a command.
+    #
+    def processCompletions( self ):
+        while 1:
+            try:
+                done = self.completions.get_nowait()
+            except Queue.Empty:
+                return
+            self.pending -= 1
+            if done is not None:
+                try:
+                    done()
+                except:
+                    print( '*** command completion failed:', done )
+                    traceback.print_exc()
+
+    def __repr__( self ):
+        return 'CommandQueue pending %d failures %d coalesced %d' % (
+            self.pending, self.failures, self.coalesced )
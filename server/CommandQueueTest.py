@@ -0,0 +1,138 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+
+import threading, unittest
+from time import sleep
+import iTunesXML
+from CommandQueue import CommandQueue
+from iTunesXML import Track, iTunesXML as Model
+from SimulatedPlayer import SimulatedPlayer
+
+#
+# Tests of the CommandQueue class, and of the iTunesXML commands that merge
+# key repeats through it. Run with 'python -m unittest CommandQueueTest'.
+#
+class CommandQueueTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.gate = threading.Event()
+        self.log = []
+
+    def tearDown( self ):
+        self.gate.set()
+
+    #
+    # Put a command that keeps the worker thread of QUEUE busy until the gate
+    # opens, so that the commands put after it wait to run.
+    #
+    def block( self, queue ):
+        queue.put( self.gate.wait )
+
+    #
+    # Open the gate and wait for all of the commands of QUEUE to complete.
+    #
+    def drain( self, queue ):
+        self.gate.set()
+        for count in xrange( 500 ):
+            queue.processCompletions()
+            if queue.getPendingCount() == 0:
+                return
+            sleep( 0.01 )
+        self.fail( 'commands did not complete' )
+
+    def record( self, *args ): self.log.append( args )
+
+    def testBurstMerges( self ):
+        queue = CommandQueue()
+        merge = lambda old, new: ( 'skip', old[ 1 ] + new[ 1 ] )
+        self.block( queue )
+        self.failUnless( queue.put( self.record, ( 'skip', 1 ), None, 'skip',
+                                    merge ) )
+        for count in xrange( 4 ):
+            self.failIf( queue.put( self.record, ( 'skip', 1 ), None, 'skip',
+                                    merge ) )
+        self.drain( queue )
+        self.assertEqual( self.log, [ ( 'skip', 5 ) ] )
+        self.assertEqual( queue.coalesced, 4 )
+
+    def testLatestArgumentsWin( self ):
+        queue = CommandQueue()
+        self.block( queue )
+        for value in ( 10, 20, 30 ):
+            queue.put( self.record, ( 'volume', value ), None, 'volume' )
+        self.drain( queue )
+        self.assertEqual( self.log, [ ( 'volume', 30 ) ] )
+
+    #
+    # A keyed command must not absorb a request made after a different
+    # command was put, since it runs before that command.
+    #
+    def testNoMergeAcrossOtherCommands( self ):
+        queue = CommandQueue()
+        self.block( queue )
+        queue.put( self.record, ( 'skip', 1 ), None, 'skip' )
+        queue.put( self.record, ( 'play', ) )
+        self.failUnless( queue.put( self.record, ( 'skip', 1 ), None,
+                                    'skip' ) )
+        self.drain( queue )
+        self.assertEqual( self.log, [ ( 'skip', 1 ), ( 'play', ),
+                                      ( 'skip', 1 ) ] )
+
+    #
+    # Once a keyed command starts, a new request gets its own command.
+    #
+    def testNoMergeIntoRunningCommand( self ):
+        queue = CommandQueue()
+        started = threading.Event()
+        def wait( name ):
+            started.set()
+            self.gate.wait()
+            self.record( name )
+        queue.put( wait, ( 'first', ), None, 'skip' )
+        started.wait( 5.0 )
+        self.failUnless( queue.put( self.record, ( 'second', ), None,
+                                    'skip' ) )
+        self.drain( queue )
+        self.assertEqual( self.log, [ ( 'first', ), ( 'second', ) ] )
+
+    #
+    # Pressing 'next' while a play command waits must move on from the track
+    # that the play starts, even if an older skip is still waiting to run.
+    #
+    def testSkipAfterPlay( self ):
+        player = SimulatedPlayer()
+        playlist = player.makePlaylist( 'test' )
+        for index in xrange( 3 ):
+            player.addTrack( playlist, Track( {
+                        'Name': 'Track %d' % ( index, ),
+                        'Persistent ID': 'ID%d' % ( index, ),
+                        'Total Time': 60000 } ) )
+        player.playPlaylist( playlist, 2 )
+        model = Model( player, '/dev/null' )
+        queue = iTunesXML.kCommandQueue
+        self.block( queue )
+        model.nextTrack()
+        model.sendCommand( model.player.playPlaylist, playlist, 0 )
+        model.nextTrack()
+        self.drain( queue )
+        self.assertEqual( player.getCurrentTrackID(), 'ID1' )
+
+if __name__ == '__main__':
+    unittest.main()
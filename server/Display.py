@@ -333,11 +333,11 @@ class RepeatStateGenerator( StateGenerator ):
     #
     # Mapping of iTunes repeat states to strings
     #
-    kTagMapping = { 'k.all': 'ALL', 'k.one': 'SONG', 'k.off': 'OFF' }
+    kTagMapping = { 'all': 'ALL', 'one': 'SONG', 'off': 'OFF' }
 
     def generate( self ):
         return self.makeContent( 
-            'Repeat', self.kTagMapping[ repr( self.source.getRepeat() ) ] )
+            'Repeat', self.kTagMapping[ self.source.getRepeat() ] )
 
 #
 # Base class for all overlay (temporary) displays
@@ -56,5 +56,5 @@ class GenreListBrowser( PlayableBrowser ):
     # start of the first album
     #
     def play( self ): 
-        self.source.playObject( self.getCurrentObject() )
-        return PlaybackDisplay( self.client, self )
+        return self.playObject( self.getCurrentObject() ) or \
+            PlaybackDisplay( self.client, self )
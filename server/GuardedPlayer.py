@@ -0,0 +1,323 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import Queue, sys, threading
+from time import sleep, time
+from PlayerBackend import PlayerBackend, PlayerError
+
+#
+# Exception raised by GuardedPlayer when the player did not answer in time,
+# or when it has stopped answering altogether.
+#
+class PlayerNotResponding( PlayerError ):
+    pass
+
+#
+# Implementation of PlayerBackend that passes each request on to another
+# PlayerBackend object, but never waits longer than a deadline (kDeadline
+# seconds for most) for an answer. The requests run one at a time in a worker
+# thread while the caller waits. If the deadline passes, the caller gets a
+# PlayerNotResponding exception, and the request carries on without it. The
+# thread that creates the GuardedPlayer (the server loop) does not even wait
+# for a request from another thread to finish: it gets PlayerNotResponding
+# right away, and can use the last known values instead. Only for the
+# requests that find, make or delete playlists, which have no last known
+# value, does it wait up to kOwnerWait seconds for its turn.
+#
+# After kFailureLimit failures in a row, we consider the player to be down:
+# requests fail right away without going to the player, and a probe thread
+# asks the player for its state every kProbeInterval seconds until it answers
+# again. A request that raises PlayerError counts as an answer, since the
+# player had to be running to refuse it.
+#
+class GuardedPlayer( PlayerBackend ):
+
+    kDeadline = 2.0
+
+    #
+    # Deadline for the requests that change the contents of playlists. They
+    # may take iTunes a while, and they only run from the command queue, so
+    # the server loop does not wait on them.
+    #
+    kPlaylistDeadline = 10.0
+    kOwnerWait = 1.0
+    kFailureLimit = 3
+    kProbeInterval = 2.0
+
+    #
+    # Constructor. PLAYER is the PlayerBackend object to guard.
+    #
+    def __init__( self, player ):
+        self.player = player
+        self.owner = threading.currentThread()
+        self.condition = threading.Condition()
+        self.inUse = False      # True while a caller has a request running
+        self.ownerWaiting = False # True while the owner waits for its turn
+        self.stateLock = threading.Lock()
+        self.requests = Queue.Queue()
+        self.results = Queue.Queue()
+        self.waiting = False    # True while a caller waits for a result
+        self.busy = False       # True while a late request is still running
+        self.failures = 0       # Failures since the last answer
+        self.down = False       # True while the player is considered down
+        self.timeouts = 0       # Total number of requests that timed out
+        self.worker = threading.Thread( target = self.run )
+        self.worker.setDaemon( True )
+        self.worker.start()
+        self.prober = None
+
+    #
+    # Obtain the PlayerBackend object being guarded.
+    #
+    def getPlayer( self ): return self.player
+
+    #
+    # Determine if the player is answering requests.
+    #
+    def isResponding( self ): return not self.down
+
+    #
+    # Run the method NAME of the guarded player with the arguments ARGS, and
+    # return its result. DEADLINE is the number of seconds to wait for it, if
+    # not kDeadline. OWNERWAIT is the number of seconds that the server loop
+    # may wait for its turn. Fails right away if the player is down, unless
+    # PROBE is True.
+    #
+    def call( self, name, args = (), deadline = None, probe = False,
+              ownerWait = 0.0 ):
+        if deadline is None:
+            deadline = self.kDeadline
+        if self.down and not probe:
+            raise PlayerNotResponding, name
+
+        #
+        # Wait for our turn, but no longer than the deadline, and in the server
+        # loop no longer than OWNERWAIT. A request from another thread may be
+        # taking a while; its own result decides whether the player is
+        # answering, so this does not count as a failure. While the server
+        # loop waits, it goes before the other threads.
+        #
+        end = time() + deadline
+        isOwner = threading.currentThread() is self.owner
+        if isOwner:
+            end = time() + ownerWait
+        self.condition.acquire()
+        try:
+            if isOwner:
+                self.ownerWaiting = True
+            try:
+                while self.inUse or ( self.ownerWaiting and not isOwner ):
+                    remaining = end - time()
+                    if remaining <= 0.0:
+                        raise PlayerNotResponding, name
+                    self.condition.wait( remaining )
+                self.inUse = True
+            finally:
+                if isOwner:
+                    self.ownerWaiting = False
+                    self.condition.notifyAll()
+        finally:
+            self.condition.release()
+
+        try:
+
+            #
+            # If an earlier request is still running, the player is stuck on
+            # it, so do not queue another behind it.
+            #
+            if self.busy:
+                self.failed()
+                raise PlayerNotResponding, name
+
+            self.waiting = True
+            self.requests.put( ( name, args ) )
+            try:
+                result = self.results.get( True, deadline )
+            except Queue.Empty:
+
+                #
+                # The result may have arrived just now. If not, tell the
+                # worker to drop it when it does.
+                #
+                self.stateLock.acquire()
+                try:
+                    try:
+                        result = self.results.get_nowait()
+                    except Queue.Empty:
+                        result = None
+                        self.waiting = False
+                        self.busy = True
+                finally:
+                    self.stateLock.release()
+                if result is None:
+                    self.timeouts += 1
+                    self.failed()
+                    raise PlayerNotResponding, name
+        finally:
+            self.condition.acquire()
+            self.inUse = False
+            self.condition.notifyAll()
+            self.condition.release()
+
+        ok, value = result
+        if ok or isinstance( value[ 1 ], PlayerError ):
+            self.answered()
+        else:
+            self.failed()
+        if ok:
+            return value
+        raise value[ 0 ], value[ 1 ], value[ 2 ]
+
+    #
+    # Body of the worker thread. Runs each request on the guarded player, and
+    # hands the result to the waiting caller, if there still is one.
+    #
+    def run( self ):
+        while 1:
+            name, args = self.requests.get()
+            try:
+                result = ( True, getattr( self.player, name )( *args ) )
+            except:
+                result = ( False, sys.exc_info() )
+            self.stateLock.acquire()
+            try:
+                if self.waiting:
+                    self.waiting = False
+                    self.results.put( result )
+                else:
+                    self.busy = False
+            finally:
+                self.stateLock.release()
+
+    #
+    # Note that the player answered a request.
+    #
+    def answered( self ):
+        self.failures = 0
+        if self.down:
+            print( '*** player is responding again' )
+            self.down = False
+
+    #
+    # Note that a request failed. Consider the player down once there have
+    # been kFailureLimit failures in a row, and start probing it.
+    #
+    def failed( self ):
+        self.failures += 1
+        if self.failures >= self.kFailureLimit and not self.down:
+            print( '*** player is not responding' )
+            self.down = True
+            if self.prober is None or not self.prober.isAlive():
+                self.prober = threading.Thread( target = self.probe )
+                self.prober.setDaemon( True )
+                self.prober.start()
+
+    #
+    # Body of the probe thread. Asks the player for its state every
+    # kProbeInterval seconds until it answers.
+    #
+    def probe( self ):
+        while self.down:
+            sleep( self.kProbeInterval )
+            try:
+                self.call( 'getPlayerState', probe = True )
+            except PlayerError:
+                pass
+
+    def getPlayerState( self ): return self.call( 'getPlayerState' )
+    def getPlayerPosition( self ): return self.call( 'getPlayerPosition' )
+    def getCurrentTrack( self ): return self.call( 'getCurrentTrack' )
+    def getCurrentTrackID( self ): return self.call( 'getCurrentTrackID' )
+
+    def getCurrentPlaylistName( self ):
+        return self.call( 'getCurrentPlaylistName' )
+
+    def getVolume( self ): return self.call( 'getVolume' )
+    def setVolume( self, value ): self.call( 'setVolume', ( value, ) )
+    def getMute( self ): return self.call( 'getMute' )
+    def setMute( self, value ): self.call( 'setMute', ( value, ) )
+
+    def play( self ): self.call( 'play' )
+    def pause( self ): self.call( 'pause' )
+    def stop( self ): self.call( 'stop' )
+    def backTrack( self ): self.call( 'backTrack' )
+    def previousTrack( self ): self.call( 'previousTrack' )
+    def nextTrack( self ): self.call( 'nextTrack' )
+    def rewind( self ): self.call( 'rewind' )
+    def fastForward( self ): self.call( 'fastForward' )
+    def resume( self ): self.call( 'resume' )
+
+    def findPlaylist( self, name, tracks ):
+        return self.call( 'findPlaylist', ( name, tracks ),
+                          ownerWait = self.kOwnerWait )
+
+    def makePlaylist( self, name ):
+        return self.call( 'makePlaylist', ( name, ),
+                          ownerWait = self.kOwnerWait )
+
+    def deletePlaylist( self, playlist ):
+        self.call( 'deletePlaylist', ( playlist, ),
+                   ownerWait = self.kOwnerWait )
+
+    def clearPlaylist( self, playlist ):
+        self.call( 'clearPlaylist', ( playlist, ),
+                   self.kPlaylistDeadline )
+
+    def addTrack( self, playlist, track ):
+        self.call( 'addTrack', ( playlist, track ),
+                   self.kPlaylistDeadline )
+
+    def addTracks( self, playlist, tracks ):
+        self.call( 'addTracks', ( playlist, tracks ),
+                   self.kPlaylistDeadline )
+
+    def removeTrack( self, playlist, index ):
+        self.call( 'removeTrack', ( playlist, index ),
+                   self.kPlaylistDeadline )
+
+    def playPlaylist( self, playlist, index ):
+        self.call( 'playPlaylist', ( playlist, index ) )
+
+    def getShuffle( self, playlist ):
+        return self.call( 'getShuffle', ( playlist, ) )
+
+    def setShuffle( self, playlist, value ):
+        self.call( 'setShuffle', ( playlist, value ) )
+
+    def getRepeat( self, playlist ):
+        return self.call( 'getRepeat', ( playlist, ) )
+
+    def setRepeat( self, playlist, value ):
+        self.call( 'setRepeat', ( playlist, value ) )
+
+    def getTrackRating( self, track ):
+        return self.call( 'getTrackRating', ( track, ) )
+
+    def setTrackRating( self, track, rating ):
+        self.call( 'setTrackRating', ( track, rating ) )
+
+    def getAlbumRating( self, track ):
+        return self.call( 'getAlbumRating', ( track, ) )
+
+    def setAlbumRating( self, track, rating ):
+        self.call( 'setAlbumRating', ( track, rating ) )
+
+    def __repr__( self ):
+        return 'GuardedPlayer %s down %s failures %d timeouts %d' % (
+            self.player, self.down, self.failures, self.timeouts )
@@ -0,0 +1,179 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+
+import threading, unittest
+from time import sleep, time
+from GuardedPlayer import GuardedPlayer, PlayerNotResponding
+from PlayerBackend import PlayerError
+from PlayerStatus import PlayerStatus
+from SimulatedPlayer import SimulatedPlayer
+
+#
+# SimulatedPlayer whose volume requests fail with ERROR, if set.
+#
+class FailingPlayer( SimulatedPlayer ):
+
+    def __init__( self ):
+        SimulatedPlayer.__init__( self )
+        self.error = None
+
+    def getVolume( self ):
+        if self.error is not None:
+            raise self.error
+        return SimulatedPlayer.getVolume( self )
+
+#
+# Fault-injection tests of the GuardedPlayer class. The player is made slow or
+# hung with SimulatedPlayer.setDelay() and hang(), and the deadlines are kept
+# short. Run with 'python -m unittest GuardedPlayerTest'.
+#
+class GuardedPlayerTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.player = FailingPlayer()
+        self.guarded = GuardedPlayer( self.player )
+        self.guarded.kDeadline = 0.1
+        self.guarded.kProbeInterval = 0.05
+
+    def tearDown( self ):
+        self.player.hangUntil = 0.0
+        self.player.setDelay( 0.0 )
+
+    #
+    # Make the player stop answering for SECONDS seconds, and then make
+    # kFailureLimit requests so that the guard considers it down.
+    #
+    def bringDown( self, seconds ):
+        self.player.hang( seconds )
+        for count in xrange( self.guarded.kFailureLimit ):
+            self.assertRaises( PlayerNotResponding, self.guarded.getVolume )
+
+    #
+    # Wait up to SECONDS seconds for the guard to consider the player up.
+    #
+    def waitForResponding( self, seconds ):
+        end = time() + seconds
+        while time() < end:
+            if self.guarded.isResponding():
+                return True
+            sleep( 0.01 )
+        return False
+
+    #
+    # A player that misses the deadline leaves the status snapshot with the
+    # last known values.
+    #
+    def testDeadlineServesKnownValues( self ):
+        status = PlayerStatus()
+        self.assertEqual( status.get( 'volume', self.guarded.getVolume ), 50 )
+        self.player.hang( 1.0 )
+        status = PlayerStatus( None, status.getKnown() )
+        start = time()
+        self.assertEqual( status.get( 'volume', self.guarded.getVolume ), 50 )
+        self.failUnless( time() - start < 0.5 )
+        self.assertRaises( PlayerNotResponding, status.get, 'mute',
+                           self.guarded.getMute )
+
+    #
+    # While another thread has a request running, the server loop does not
+    # wait for its turn, and that does not count against the player.
+    #
+    def testBusySlotFailsFast( self ):
+        self.guarded.kDeadline = 2.0
+        self.player.setDelay( 0.5 )
+        results = []
+        other = threading.Thread(
+            target = lambda: results.append( self.guarded.getVolume() ) )
+        other.start()
+        sleep( 0.1 )
+        start = time()
+        self.assertRaises( PlayerNotResponding, self.guarded.getMute )
+        self.failUnless( time() - start < 0.1 )
+        other.join()
+        self.assertEqual( results, [ 50 ] )
+        self.assertEqual( self.guarded.failures, 0 )
+        self.failUnless( self.guarded.isResponding() )
+
+    #
+    # The server loop waits a short while for its turn to make a playlist,
+    # since there is no last known value to use instead, and goes before
+    # another thread making one request after another (like a playlist fill).
+    #
+    def testPlaylistWaitsForTurn( self ):
+        self.guarded.kDeadline = 2.0
+        self.player.setDelay( 0.3 )
+        def fill():
+            for count in xrange( 5 ):
+                self.guarded.getVolume()
+        other = threading.Thread( target = fill )
+        other.start()
+        sleep( 0.1 )
+        start = time()
+        self.failIf( self.guarded.makePlaylist( 'Waited' ) is None )
+        self.failUnless( time() - start < 1.0 )
+        other.join()
+
+        self.guarded.kOwnerWait = 0.1
+        other = threading.Thread( target = self.guarded.getVolume )
+        other.start()
+        sleep( 0.05 )
+        self.assertRaises( PlayerNotResponding, self.guarded.makePlaylist,
+                           'Too Late' )
+        other.join()
+
+    def testBreakerOpens( self ):
+        self.bringDown( 1.0 )
+        self.failIf( self.guarded.isResponding() )
+
+        #
+        # Once open, requests fail without going to the player.
+        #
+        start = time()
+        self.assertRaises( PlayerNotResponding, self.guarded.getVolume )
+        self.failUnless( time() - start < 0.05 )
+
+    def testFailuresBelowLimit( self ):
+        self.player.hang( 1.0 )
+        for count in xrange( self.guarded.kFailureLimit - 1 ):
+            self.assertRaises( PlayerNotResponding, self.guarded.getVolume )
+        self.failUnless( self.guarded.isResponding() )
+
+    def testProbeCloses( self ):
+        self.bringDown( 0.3 )
+        self.failIf( self.guarded.isResponding() )
+        self.failUnless( self.waitForResponding( 3.0 ) )
+        self.assertEqual( self.guarded.getVolume(), 50 )
+
+    #
+    # Errors other than PlayerError count as failures; a PlayerError is an
+    # answer, and is passed on as is.
+    #
+    def testErrors( self ):
+        self.player.error = RuntimeError( 'broken' )
+        for count in xrange( self.guarded.kFailureLimit ):
+            self.assertRaises( RuntimeError, self.guarded.getVolume )
+        self.failIf( self.guarded.isResponding() )
+        self.player.error = PlayerError( 'refused' )
+        self.failUnless( self.waitForResponding( 3.0 ) )
+        self.assertRaises( PlayerError, self.guarded.getVolume )
+        self.assertEqual( self.guarded.failures, 0 )
+
+if __name__ == '__main__':
+    unittest.main()
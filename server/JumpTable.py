@@ -0,0 +1,60 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+from bisect import bisect_left
+
+#
+# Table of positions in a list of items sorted by key, used by Browser to jump
+# to the first item that starts with a given character or prefix. Holds the
+# position of the first item for each starting character, so a jump to a
+# letter is a dictionary lookup. Longer prefixes use binary search on a copy of
+# the keys.
+#
+class JumpTable( object ):
+
+    #
+    # Constructor. ITEMS is the list of items, which must provide getKey() and
+    # be ordered by it. GENERATION is the generation number of the library
+    # that the list belongs to.
+    #
+    def __init__( self, items, generation = None ):
+        self.items = items
+        self.generation = generation
+        self.keys = [ item.getKey() for item in items ]
+        self.offsets = {}
+        previous = None
+        for index in xrange( len( self.keys ) ):
+            first = self.keys[ index ][ : 1 ]
+            if first != previous:
+                self.offsets[ first ] = index
+                previous = first
+
+    #
+    # Obtain the position of the first item whose key is not less than PREFIX.
+    # If PREFIX is a character that starts one of the keys, this is the first
+    # item that starts with it. Returns len( items ) if there is no such item.
+    #
+    def getIndex( self, prefix ):
+        if len( prefix ) == 1:
+            index = self.offsets.get( prefix )
+            if index is None:
+                index = self.offsets[ prefix ] = bisect_left( self.keys,
+                                                              prefix )
+            return index
+        return bisect_left( self.keys, prefix )
@@ -0,0 +1,111 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import copy
+from array import array
+from bisect import bisect_left
+from Browser import Browser
+
+#
+# Index of the key values of a list of OrderedItem objects by the keypad digits
+# one would press to enter them (eg. 'ABBA' is '2222'). Characters that are
+# not on the keypad, including spaces, are ignored. The digit sequences are
+# kept in sorted order, so the items that start with a given sequence of
+# digits are found with two binary searches, no matter how many there are.
+#
+class KeypadIndex( object ):
+
+    #
+    # Mapping of characters to the keypad digit that produces them, made from
+    # the Browser.kDigits table.
+    #
+    kKeypad = dict( ( value, str( digit ) ) for digit in range( 10 )
+                    for value in Browser.kDigits[ digit ] + str( digit ) )
+
+    #
+    # Constructor. ITEMS is the list of OrderedItem objects to index. It must
+    # not change while the index is in use.
+    #
+    def __init__( self, items ):
+        self.items = items
+        entries = [ ( self.getDigits( items[ position ].key ), position )
+                    for position in xrange( len( items ) ) ]
+        entries.sort()
+        self.sequences = [ entry[ 0 ] for entry in entries ]
+        self.positions = array( 'I', [ entry[ 1 ] for entry in entries ] )
+
+    #
+    # Obtain an index like this one for ITEMS, a list holding items with the
+    # same keys in the same order as the one this index was made for.
+    #
+    def withItems( self, items ):
+        index = copy.copy( self )
+        index.items = items
+        return index
+
+    #
+    # Obtain the keypad digits for the characters in TEXT
+    #
+    def getDigits( self, text ):
+        keypad = self.kKeypad
+        return ''.join( [ keypad[ value ] for value in text.upper()
+                          if value in keypad ] )
+
+    #
+    # Obtain the range of sorted entries whose digits start with DIGITS.
+    #
+    def getRange( self, digits ):
+        lo = bisect_left( self.sequences, digits )
+        hi = bisect_left( self.sequences, digits + ':', lo ) # ':' follows '9'
+        return lo, hi
+
+    #
+    # Obtain the number of items whose digits start with DIGITS.
+    #
+    def getCount( self, digits ):
+        lo, hi = self.getRange( digits )
+        return hi - lo
+
+    #
+    # Obtain the item that best matches DIGITS: the first one in digit order,
+    # so an exact match comes before any longer ones. Returns None if there is
+    # no match.
+    #
+    def getBest( self, digits ):
+        lo, hi = self.getRange( digits )
+        if lo == hi:
+            return None
+        return self.items[ self.positions[ lo ] ]
+
+    #
+    # Obtain a list of the items whose digits start with DIGITS, in the same
+    # order as they appear in the indexed list.
+    #
+    def search( self, digits ):
+        lo, hi = self.getRange( digits )
+        positions = list( self.positions[ lo : hi ] )
+        positions.sort()
+        return [ self.items[ position ] for position in positions ]
+
+    def __repr__( self ):
+        digits = sum( [ len( sequence ) for sequence in self.sequences ] )
+        return 'KeypadIndex %d items %d digits (%dK)' % (
+            len( self.items ), digits,
+            ( digits + len( self.positions ) * self.positions.itemsize ) /
+            1024 )
@@ -55,6 +55,16 @@ class PlayableBrowser( Browser ):
                                     u'Added ' + obj.getName(),
                                     u'to playlist ' + playlist.getName() )
 
+    #
+    # Ask iTunes to play OBJ, starting at the track at TRACKINDEX. Returns a
+    # NotificationDisplay to show if that failed, or None.
+    #
+    def playObject( self, obj, trackIndex = 0 ):
+        if self.source.playObject( obj, trackIndex ):
+            return None
+        return NotificationDisplay( self.client, self, u'Failed to play',
+                                    obj.getName() )
+
     #
     # Action performed when the user presses the 'play' key. Derived classes
     # must define.
@@ -32,11 +32,11 @@ class PlaybackDisplay( DisplayGenerator ):
     #
     # Mapping of iTunes player state to a status string
     #
-    kPlayerState = { 'k.playing': '',
-                     'k.paused': 'PAUSED',
-                     'k.stopped': 'STOPPED',
-                     'k.fast_forwarding': 'FFWD',
-                     'k.rewinding': 'RWD'
+    kPlayerState = { 'playing': '',
+                     'paused': 'PAUSED',
+                     'stopped': 'STOPPED',
+                     'fast forwarding': 'FFWD',
+                     'rewinding': 'RWD'
                      }
 
     #
@@ -148,6 +148,8 @@ class PlaybackDisplay( DisplayGenerator ):
 
     def nextTrackBrowser( self ):
         playlist = self.source.getActivePlaylist()
+        if playlist is None:
+            return self
         index = playlist.getTrackIndex( self.source.getCurrentTrack() ) + 1
         if index >= playlist.getTrackCount():
             index = 0
@@ -156,6 +158,8 @@ class PlaybackDisplay( DisplayGenerator ):
 
     def previousTrackBrowser( self ):
         playlist = self.source.getActivePlaylist()
+        if playlist is None:
+            return self
         index = playlist.getTrackIndex( self.source.getCurrentTrack() ) - 1
         if index < 0:
             index = playlist.getTrackCount() - 1
@@ -165,7 +169,7 @@ class PlaybackDisplay( DisplayGenerator ):
     def unrecord( self, trackIndex ):
         print( 'unrecord', trackIndex )
         playlist = self.source.getActivePlaylist()
-        if not playlist.getCanManipulate():
+        if playlist is None or not playlist.getCanManipulate():
             return self
         playlist.removeTrack( trackIndex )
         if playlist.getTrackCount() == 0:
@@ -193,15 +197,33 @@ class PlaybackDisplay( DisplayGenerator ):
     #
     def getPlayerState( self, track ):
         state = self.kPlayerState.get( self.source.getPlayerState(), '???' )
+        if not self.source.isPlayerResponding():
+            state = 'NO PLAYER'
         if state == '':
             if self.source.getMute():
                 state = 'MUTED'
+            else:
+                state = self.getPlaylistFillState()
         if state == '':
             state = self.getPlayerPositionIndicator( track )
         else:
             state = unichr( CustomCharacters.kEllipsis ) + state
         return state
 
+    #
+    # Obtain a string showing how far iTunes has got with adding the tracks
+    # of the active playlist, or an empty string if it has them all (or there
+    # is no active playlist).
+    #
+    def getPlaylistFillState( self ):
+        playlist = self.source.getActivePlaylist()
+        if playlist is None:
+            return ''
+        progress = playlist.getFillProgress()
+        if progress is None:
+            return ''
+        return 'ADD %d%%' % ( int( progress * 100 ), )
+
     #
     # Obtain an empty string. This is one of the custom position indicators.
     #
@@ -214,6 +236,8 @@ class PlaybackDisplay( DisplayGenerator ):
     #
     def getPlayerTrackIndex( self, track ):
         playlist = self.source.getActivePlaylist()
+        if playlist is None:
+            return ''
         return '%d/%d' % ( playlist.getTrackIndex( track ) + 1,
                            playlist.getTrackCount() )
 
@@ -280,7 +304,10 @@ class PlaybackDisplay( DisplayGenerator ):
         if trackIndex == -1:
             self.source.play()
         else:
-            self.source.getActivePlaylist().play( trackIndex )
+            source = self.source
+            playlist = source.getActivePlaylist()
+            if playlist is not None:
+                source.playPlaylist( playlist, trackIndex )
         return self
 
     #
@@ -319,7 +346,9 @@ class PlaybackDisplay( DisplayGenerator ):
     def digit( self, digit ):
         source = self.source
         playlist = source.getActivePlaylist()
-        maxIndex = playlist.getTrackCount()
+        maxIndex = 0
+        if playlist is not None:
+            maxIndex = playlist.getTrackCount()
 
         index = digit
 
@@ -344,8 +373,8 @@ class PlaybackDisplay( DisplayGenerator ):
         #
         if index == 0:
             source.beginTrack()
-        else:
+        elif maxIndex:
             index = min( max( index, 1 ), maxIndex ) - 1
-            playlist.play( index )
+            source.playPlaylist( playlist, index )
 
         return self
@@ -0,0 +1,215 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+#
+# Exception raised by a PlayerBackend when the player refuses a request (eg.
+# there is no current track, or no playlist with a given name).
+#
+class PlayerError( Exception ):
+    pass
+
+#
+# Interface to the music player that iTunesXML controls. AppscriptPlayer talks
+# to iTunes, and SimulatedPlayer plays the library in memory. Playlists are
+# represented by objects that only the backend understands, obtained from
+# findPlaylist() or makePlaylist(). Tracks are the Track objects of the loaded
+# library.
+#
+# Player states are one of the kStates values, and repeat modes are one of the
+# kRepeatModes values.
+#
+class PlayerBackend( object ):
+
+    kStates = ( 'playing', 'paused', 'stopped', 'fast forwarding',
+                'rewinding' )
+
+    kRepeatModes = ( 'off', 'all', 'one' )
+
+    #
+    # Obtain the current player state (see kStates)
+    #
+    def getPlayerState( self ):
+        raise NotImplementedError, 'getPlayerState'
+
+    #
+    # Obtain the current position (seconds) in the current track
+    #
+    def getPlayerPosition( self ):
+        raise NotImplementedError, 'getPlayerPosition'
+
+    #
+    # Obtain a Track object for the current track, or None if there is none.
+    #
+    def getCurrentTrack( self ):
+        raise NotImplementedError, 'getCurrentTrack'
+
+    #
+    # Obtain the persistent ID of the current track, or None if there is none.
+    # Cheaper than getCurrentTrack() for a player that must ask for each
+    # attribute of the track.
+    #
+    def getCurrentTrackID( self ):
+        raise NotImplementedError, 'getCurrentTrackID'
+
+    #
+    # Obtain the name of the current playlist, or None if there is none.
+    #
+    def getCurrentPlaylistName( self ):
+        raise NotImplementedError, 'getCurrentPlaylistName'
+
+    #
+    # Obtain the volume setting, an integer from 0 to 100
+    #
+    def getVolume( self ):
+        raise NotImplementedError, 'getVolume'
+
+    #
+    # Change the volume setting to VALUE, an integer from 0 to 100
+    #
+    def setVolume( self, value ):
+        raise NotImplementedError, 'setVolume'
+
+    #
+    # Obtain the mute setting
+    #
+    def getMute( self ):
+        raise NotImplementedError, 'getMute'
+
+    #
+    # Change the mute setting to VALUE, True or False
+    #
+    def setMute( self, value ):
+        raise NotImplementedError, 'setMute'
+
+    #
+    # Transport controls
+    #
+    def play( self ): raise NotImplementedError, 'play'
+    def pause( self ): raise NotImplementedError, 'pause'
+    def stop( self ): raise NotImplementedError, 'stop'
+    def backTrack( self ): raise NotImplementedError, 'backTrack'
+    def previousTrack( self ): raise NotImplementedError, 'previousTrack'
+    def nextTrack( self ): raise NotImplementedError, 'nextTrack'
+    def rewind( self ): raise NotImplementedError, 'rewind'
+    def fastForward( self ): raise NotImplementedError, 'fastForward'
+    def resume( self ): raise NotImplementedError, 'resume'
+
+    #
+    # Obtain the player's object for the playlist NAME, or None if there is
+    # none. TRACKS is the list of Track objects found for the playlist in the
+    # library XML file, for players that do not keep their own playlists.
+    #
+    def findPlaylist( self, name, tracks ):
+        raise NotImplementedError, 'findPlaylist'
+
+    #
+    # Create a new, empty playlist called NAME and return the player's object
+    # for it.
+    #
+    def makePlaylist( self, name ):
+        raise NotImplementedError, 'makePlaylist'
+
+    #
+    # Delete the playlist PLAYLIST
+    #
+    def deletePlaylist( self, playlist ):
+        raise NotImplementedError, 'deletePlaylist'
+
+    #
+    # Remove all of the tracks of PLAYLIST
+    #
+    def clearPlaylist( self, playlist ):
+        raise NotImplementedError, 'clearPlaylist'
+
+    #
+    # Add the Track object TRACK to the end of PLAYLIST
+    #
+    def addTrack( self, playlist, track ):
+        raise NotImplementedError, 'addTrack'
+
+    #
+    # Add the Track objects in TRACKS to the end of PLAYLIST, in order. This
+    # version adds them one at a time with addTrack(); players that can add
+    # several tracks in one request should override it.
+    #
+    def addTracks( self, playlist, tracks ):
+        for track in tracks:
+            self.addTrack( playlist, track )
+
+    #
+    # Remove the track at INDEX from PLAYLIST
+    #
+    def removeTrack( self, playlist, index ):
+        raise NotImplementedError, 'removeTrack'
+
+    #
+    # Begin playing PLAYLIST at the track at INDEX
+    #
+    def playPlaylist( self, playlist, index ):
+        raise NotImplementedError, 'playPlaylist'
+
+    #
+    # Obtain the shuffle setting of PLAYLIST
+    #
+    def getShuffle( self, playlist ):
+        raise NotImplementedError, 'getShuffle'
+
+    #
+    # Change the shuffle setting of PLAYLIST to VALUE
+    #
+    def setShuffle( self, playlist, value ):
+        raise NotImplementedError, 'setShuffle'
+
+    #
+    # Obtain the repeat mode of PLAYLIST (see kRepeatModes)
+    #
+    def getRepeat( self, playlist ):
+        raise NotImplementedError, 'getRepeat'
+
+    #
+    # Change the repeat mode of PLAYLIST to VALUE (see kRepeatModes)
+    #
+    def setRepeat( self, playlist, value ):
+        raise NotImplementedError, 'setRepeat'
+
+    #
+    # Obtain the rating (0-100) that the user gave TRACK. A rating that the
+    # player computed from other ratings counts as 0.
+    #
+    def getTrackRating( self, track ):
+        raise NotImplementedError, 'getTrackRating'
+
+    #
+    # Change the rating of TRACK to RATING (0-100)
+    #
+    def setTrackRating( self, track, rating ):
+        raise NotImplementedError, 'setTrackRating'
+
+    #
+    # Obtain the rating (0-100) that the user gave the album of TRACK. A rating
+    # that the player computed from the track ratings counts as 0.
+    #
+    def getAlbumRating( self, track ):
+        raise NotImplementedError, 'getAlbumRating'
+
+    #
+    # Change the rating of the album of TRACK to RATING (0-100)
+    #
+    def setAlbumRating( self, track, rating ):
+        raise NotImplementedError, 'setAlbumRating'
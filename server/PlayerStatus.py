@@ -0,0 +1,108 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+from PlayerBackend import PlayerError
+
+#
+# Snapshot of the state of the iTunes player (eg. 'state', 'position', 'mute')
+# for one display refresh tick. Each value is fetched from iTunes the first
+# time it is asked for, and then every client and display generator gets the
+# same value until the snapshot is cleared. Counts the number of fetches, which
+# are the calls made to iTunes on behalf of the snapshot.
+#
+# A command sent to iTunes may take a while to carry out, so the value it is
+# expected to produce can be set ahead of time with expect(). Such values are
+# not fetched, and may be passed on to the snapshot for the next tick.
+#
+# Snapshots also share the last value fetched for each name. If the player
+# does not answer (a PlayerError), the last known value stands in for the
+# fetched one.
+#
+class PlayerStatus( object ):
+
+    #
+    # Constructor. If given, EXPECTED is a mapping of value names to the values
+    # they are expected to have (see expect()), and KNOWN is the mapping of
+    # value names to the last values fetched, which this snapshot updates.
+    #
+    def __init__( self, expected = None, known = None ):
+        if expected is None:
+            expected = {}
+        if known is None:
+            known = {}
+        self.expected = dict( expected )
+        self.values = dict( expected ) # Mapping of value names to values
+        self.known = known
+        self.calls = 0          # Number of fetches made
+
+    #
+    # Obtain the value with the name NAME. If it has not been fetched, call
+    # GETTER to fetch it. If GETTER raises PlayerError, use the last known
+    # value for NAME; if there is none, the exception is passed on.
+    #
+    def get( self, name, getter ):
+        try:
+            return self.values[ name ]
+        except KeyError:
+            self.calls += 1
+            try:
+                value = getter()
+            except PlayerError:
+                if name not in self.known:
+                    raise
+                value = self.known[ name ]
+            else:
+                self.known[ name ] = value
+            self.values[ name ] = value
+            return value
+
+    #
+    # Set the value with the name NAME to VALUE, the value that it will have
+    # once iTunes carries out a command that was sent to it.
+    #
+    def expect( self, name, value ):
+        self.expected[ name ] = value
+        self.values[ name ] = value
+
+    #
+    # Obtain the mapping of value names to expected values.
+    #
+    def getExpected( self ): return self.expected
+
+    #
+    # Obtain the mapping of value names to the last values fetched.
+    #
+    def getKnown( self ): return self.known
+
+    #
+    # Forget the fetched and expected values, so that the next request for
+    # each one will fetch it again. Call once iTunes has carried out the
+    # commands sent to it.
+    #
+    def clear( self ):
+        self.expected = {}
+        self.values = {}
+
+    #
+    # Obtain the number of fetches made for this snapshot.
+    #
+    def getCallCount( self ): return self.calls
+
+    def __repr__( self ):
+        return 'PlayerStatus %s calls %d' % ( self.values.keys(), self.calls )
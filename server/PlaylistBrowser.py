@@ -135,7 +135,7 @@ class PlaylistBrowser( Browser ):
     def play( self, trackIndex = 0 ): 
         obj = self.getCurrentObject()
         if obj.getTrackCount() > 0:
-            self.getCurrentObject().play( trackIndex )
+            self.source.playPlaylist( obj, trackIndex )
             return PlaybackDisplay( self.client, self )
         return self
 
@@ -213,7 +213,11 @@ class PlaylistBrowser( Browser ):
     # Delete the playlist from iTunes.
     #
     def doDeletePlaylist( self ):
-        self.source.deletePlaylist( self.getCurrentObject() )
+        playlist = self.getCurrentObject()
+        if not self.source.deletePlaylist( playlist ):
+            return NotificationDisplay( self.client, self,
+                                        u'Failed to delete playlist',
+                                        playlist.getName() )
 
         #
         # Make sure our internal index value is still sane.
@@ -0,0 +1,97 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+from time import time
+
+#
+# Estimate of the playback position of the current track that needs few
+# requests to iTunes. The position is sampled from iTunes when the track or
+# the player state changes, and every kSampleInterval seconds. In between,
+# the position is worked out from the clock while the player is playing.
+#
+class PositionTracker( object ):
+
+    #
+    # Maximum number of seconds between samples. Keeps the estimate from
+    # drifting far from what iTunes reports.
+    #
+    kSampleInterval = 5.0
+
+    #
+    # Constructor. CLOCK is the function that returns the time in seconds.
+    #
+    def __init__( self, clock = time ):
+        self.clock = clock
+        self.position = None    # Position (seconds) found by the last sample
+        self.when = 0.0         # Time of the last sample
+        self.trackId = None     # Persistent ID of the track sampled
+        self.state = None       # Player state when sampled
+        self.samples = 0        # Number of samples taken
+
+    #
+    # Obtain the position (seconds) in TRACK, the current Track object (or
+    # None), while the player is in STATE (see PlayerBackend.kStates). Calls
+    # FETCH to sample the position from iTunes when necessary.
+    #
+    def getPosition( self, track, state, fetch ):
+        now = self.clock()
+        trackId = None
+        if track is not None:
+            trackId = track.getID()
+
+        #
+        # Sample while rewinding or fast-forwarding, since we do not know how
+        # fast iTunes moves through the track. Also sample if the clock went
+        # backwards.
+        #
+        if self.position is None or trackId != self.trackId or \
+                state != self.state or \
+                state not in ( 'playing', 'paused', 'stopped' ) or \
+                now < self.when or now - self.when >= self.kSampleInterval:
+            self.position = fetch()
+            self.when = now
+            self.trackId = trackId
+            self.state = state
+            self.samples += 1
+            return self.position
+
+        position = self.position
+        if state == 'playing':
+            position += int( now - self.when )
+            if track is not None:
+                position = min( position, track.getDuration() )
+        return position
+
+    #
+    # Forget the last sample, so that the next getPosition() takes a new
+    # one. Call once iTunes has carried out a command that may have moved
+    # the position.
+    #
+    def reset( self ):
+        self.position = None
+
+    #
+    # Obtain the number of samples taken.
+    #
+    def getSampleCount( self ): return self.samples
+
+    def __repr__( self ):
+        return 'PositionTracker %s at %s samples %d' % ( self.position,
+                                                         self.when,
+                                                         self.samples )
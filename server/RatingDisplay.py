@@ -163,7 +163,10 @@ class TrackRatingDisplay( RatingDisplay ):
     # this track.
     #
     def albumRating( self ):
-        album = self.source.getAlbum( self.obj.getAlbumName() )
+        album = self.source.getArtistAlbum( self.obj.getArtistName(),
+                                            self.obj.getAlbumName() )
+        if album is None:
+            album = self.source.getAlbum( self.obj.getAlbumName() )
         return AlbumRatingDisplay( self.client, self.prevLevel, album )
 
     #
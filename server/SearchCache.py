@@ -0,0 +1,98 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+#
+# Cache of the results of recent searches, keyed by the kind of thing searched
+# for (eg. 'album') and the upper-case search term. Holds at most kSize
+# entries, dropping the least recently used one to make room for a new one.
+# The results belong to one generation of the library (see LibrarySnapshot);
+# asking for results from a different generation empties the cache.
+#
+class SearchCache( object ):
+
+    kSize = 64
+
+    def __init__( self, size = kSize ):
+        self.size = size
+        self.generation = None
+        self.entries = {}       # Mapping of ( kind, term ) to [ used, found ]
+        self.clock = 0          # Value for the 'used' field of the next access
+        self.hits = 0
+        self.refinements = 0
+        self.misses = 0
+        self.evictions = 0
+
+    #
+    # Obtain the results held for KIND and TERM from the library with the
+    # generation number GENERATION. If there are none, but there are results
+    # for the start of TERM, filter those to get the results for TERM: no item
+    # can contain TERM without containing its start. Returns None if nothing
+    # useful is held.
+    #
+    def get( self, generation, kind, term ):
+        if generation != self.generation:
+            self.entries = {}
+            self.generation = generation
+
+        entry = self.entries.get( ( kind, term ) )
+        if entry is not None:
+            self.hits += 1
+            entry[ 0 ] = self.tick()
+            return entry[ 1 ]
+
+        for size in xrange( len( term ) - 1, 0, -1 ):
+            entry = self.entries.get( ( kind, term[ : size ] ) )
+            if entry is not None:
+                self.refinements += 1
+                entry[ 0 ] = self.tick()
+                found = [ item for item in entry[ 1 ]
+                          if item.key.find( term ) != -1 ]
+                self.put( generation, kind, term, found )
+                return found
+
+        self.misses += 1
+        return None
+
+    #
+    # Remember FOUND as the results for KIND and TERM from the library with the
+    # generation number GENERATION.
+    #
+    def put( self, generation, kind, term, found ):
+        if generation != self.generation:
+            self.entries = {}
+            self.generation = generation
+
+        key = ( kind, term )
+        if key not in self.entries and len( self.entries ) >= self.size:
+            oldest = min( self.entries.items(), key = lambda a: a[ 1 ][ 0 ] )
+            del self.entries[ oldest[ 0 ] ]
+            self.evictions += 1
+        self.entries[ key ] = [ self.tick(), found ]
+
+    #
+    # Obtain the next value for the 'used' field of an entry.
+    #
+    def tick( self ):
+        self.clock += 1
+        return self.clock
+
+    def __repr__( self ):
+        return 'SearchCache %d/%d hits %d refinements %d misses %d ' \
+            'evictions %d' % ( len( self.entries ), self.size, self.hits,
+                               self.refinements, self.misses, self.evictions )
@@ -22,7 +22,9 @@ from ArtistListBrowser import ArtistListBrowser
 from Content import *
 from Display import *
 from KeyProcessor import *
+from PlaybackDisplay import PlaybackDisplay
 from TextEntry import *
+from TrackListBrowser import TrackListBrowser
 
 #
 # Generic search term entry and display for album and artist searching. Uses
@@ -50,6 +52,10 @@ from TextEntry import *
 # the search. Press the left-arrow to erase the last character position; if
 # there are no more, show the previous browser screen.
 #
+# While entering the search term, the display shows the number of names that
+# start with the keypad digits pressed so far (ignoring which letter of a key
+# is showing), along with the first of them.
+#
 class Searcher( TextEntry ):
 
     def __init__( self, client, prevLevel, tag ):
@@ -67,11 +73,32 @@ class Searcher( TextEntry ):
         TextEntry.updateLastCharacter( self, value )
         self.nextLevel = None
 
+    #
+    # Override of TextEntry method. Show the number of names that match the
+    # keypad digits of the search text, and the best match.
+    #
+    def generate( self ):
+        index = self.getKeypadIndex()
+        digits = index.getDigits( self.text )
+        if len( digits ) == 0:
+            return TextEntry.generate( self )
+
+        best = index.getBest( digits )
+        if best is None:
+            overlays = [ 'No matches', '' ]
+        else:
+            overlays = [ formatQuantity( index.getCount( digits ), 'match',
+                                         'matches' ),
+                         best.getName()[ : kDisplayWidth / 2 ] ]
+        return Content( [ self.title, self.text ], overlays )
+
     def accept( self, text ):
         if self.nextLevel:
             return self.nextLevel
         print 'search text:', text
         found = self.searchFor( text )
+        if found is None:
+            found = self.fuzzySearchFor( text )
         if found is None:
             found = NoneFound( self.client, self, self.tag, text )
         self.nextLevel = found
@@ -88,6 +115,19 @@ class Searcher( TextEntry ):
     def searchFor( self ):
         raise NotImplementedError, 'searchFor'
 
+    #
+    # Look for names that almost match the text, for when searchFor() finds
+    # nothing. By default, there is no such search.
+    #
+    def fuzzySearchFor( self, text ):
+        return None
+
+    #
+    # Obtain the KeypadIndex object for the names being searched.
+    #
+    def getKeypadIndex( self ):
+        raise NotImplementedError, 'getKeypadIndex'
+
 #
 # Specialization of Searcher that peforms searches on album names.
 #
@@ -101,22 +141,35 @@ class AlbumSearcher( Searcher ):
         if len( found ) == 0: return None
         return AlbumSearchResults( self.client, self, found )
 
+    def fuzzySearchFor( self, text ):
+        found = self.client.iTunes.fuzzySearchLibrary( 'album', text )
+        if len( found ) == 0: return None
+        return AlbumSearchResults( self.client, self, found, 'Close', False )
+
+    def getKeypadIndex( self ):
+        return self.client.iTunes.getLibrary().getKeypadIndex( 'album' )
+
 #
 # Specialization of AlbumListBrowser that browses the results of the last
 # search.
 #
 class AlbumSearchResults( AlbumListBrowser ):
 
-    def __init__( self, client, prevLevel, found ):
+    def __init__( self, client, prevLevel, found, label = 'Found',
+                  sortedByKey = True ):
         AlbumListBrowser.__init__( self, client, prevLevel )
         self.found = found
+        self.label = label
+        self.sortedByKey = sortedByKey
 
     def getCollection( self ): return self.found
 
+    def isSortedByKey( self ): return self.sortedByKey
+
     def generateWith( self, obj ):
         return Content( [ obj.getName(),
                           obj.getArtistName() ],
-                        [ 'Found',
+                        [ self.label,
                           self.getIndexOverlay() ] )
 
 #
@@ -132,25 +185,78 @@ class ArtistSearcher( Searcher ):
         if len( found ) == 0: return None
         return ArtistSearchResults( self.client, self, found )
 
+    def fuzzySearchFor( self, text ):
+        found = self.client.iTunes.fuzzySearchLibrary( 'artist', text )
+        if len( found ) == 0: return None
+        return ArtistSearchResults( self.client, self, found, 'Close', False )
+
+    def getKeypadIndex( self ):
+        return self.client.iTunes.getLibrary().getKeypadIndex( 'artist' )
+
 #
 # Specialization of ArtstListBrowser that browses the results of the last
 # search.
 #
 class ArtistSearchResults( ArtistListBrowser ):
     
-    def __init__( self, client, prevLevel, found ):
+    def __init__( self, client, prevLevel, found, label = 'Found',
+                  sortedByKey = True ):
         ArtistListBrowser.__init__( self, client, prevLevel )
         self.found = found
+        self.label = label
+        self.sortedByKey = sortedByKey
 
     def getCollection( self ): return self.found
 
+    def isSortedByKey( self ): return self.sortedByKey
+
     def generateWith( self, obj ): 
         return Content( [ obj.getName(),
                           formatQuantity( obj.getAlbumCount(), 'album', None,
                                           '(%d %s)' ) ],
+                        [ self.label,
+                          self.getIndexOverlay() ] )
+
+#
+# Specialization of Searcher that peforms searches on track names.
+#
+class TrackSearcher( Searcher ):
+
+    def __init__( self, client, prevLevel ):
+        Searcher.__init__( self, client, prevLevel, 'Track' ) 
+
+    def searchFor( self, text ):
+        found = self.client.iTunes.searchForTrack( text )
+        if len( found ) == 0: return None
+        return TrackSearchResults( self.client, self, found )
+
+    def getKeypadIndex( self ):
+        return self.client.iTunes.getLibrary().getKeypadIndex( 'track' )
+
+#
+# Specialization of TrackListBrowser that browses the results of the last
+# search, best matches first.
+#
+class TrackSearchResults( TrackListBrowser ):
+
+    def __init__( self, client, prevLevel, found ):
+        TrackListBrowser.__init__( self, client, prevLevel, found )
+
+    def generateWith( self, obj ): 
+        return Content( [ obj.getName(),
+                          obj.getAlbumName() + 
+                          unichr( CustomCharacters.kDottedVerticalBar ) + 
+                          obj.getArtistName() ],
                         [ 'Found',
                           self.getIndexOverlay() ] )
 
+    #
+    # Override of TrackListBrowser method. Play the current track by itself.
+    #
+    def play( self ):
+        return self.playObject( self.getCurrentObject() ) or \
+            PlaybackDisplay( self.client, self )
+
 #
 # Simple display generate that indicates that there are no matches for a given
 # search term.
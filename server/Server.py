@@ -19,7 +19,7 @@
 
 from os import stat
 from stat import *
-import array, asyncore, cPickle, socket, struct, traceback
+import array, asyncore, cPickle, socket, struct, sys, traceback
 import ClientPersistence, Display, IR, iTunesXML, Timer
 
 #
@@ -34,29 +34,55 @@ class Server( asyncore.dispatcher ):
     kLoopPollTimeout = 0.010      # Maximum amount of time to give to asyncore
     kReceiveBufferSize = 2048     # 2K should be enough for everyone...
     kLibraryLoadCheckInterval = 15 # seconds
-
-    def __init__( self ):
+    kPlayerStatusInterval = 0.25  # seconds
+    kStatsInterval = 60           # seconds
+
+    #
+    # Constructor. PLAYER and XMLFILEPATH are given to the iTunesXML object
+    # (see there).
+    #
+    def __init__( self, player = None, xmlFilePath = None ):
         asyncore.dispatcher.__init__( self )
         self.loader = None
         self.loadTimeStamp = None
         self.clients = ClientPersistence.ClientPersistence()
         self.makeTimerManager()
-        self.makeITunesManager()
+        self.makeITunesManager( player, xmlFilePath )
         self.makeIRManager()
         self.makeDispatcher()
 
     def makeIRManager( self ):
         self.irManager = IR.IR()
 
-    def makeITunesManager( self ):
-        self.iTunes = iTunesXML.iTunesXML()
+    def makeITunesManager( self, player = None, xmlFilePath = None ):
+        self.iTunes = iTunesXML.iTunesXML( player, xmlFilePath )
         self.iTunes.load()
         self.addTimer( self.kLibraryLoadCheckInterval, self.reloadCheck )
+        self.addTimer( self.kPlayerStatusInterval, self.refreshPlayerStatus )
+        self.addTimer( self.kStatsInterval, self.logStats )
 
     def reloadCheck( self ):
         self.iTunes.reloadCheck()
         self.addTimer( self.kLibraryLoadCheckInterval, self.reloadCheck )
 
+    #
+    # Fetch the iTunes player state once per refresh tick for all of the
+    # clients to share.
+    #
+    def refreshPlayerStatus( self ):
+        self.iTunes.refreshStatus()
+        self.addTimer( self.kPlayerStatusInterval, self.refreshPlayerStatus )
+
+    #
+    # Log the counters kept by the iTunesXML object, to see how well its
+    # caches work and how many calls to iTunes each refresh tick makes.
+    #
+    def logStats( self ):
+        print( self.iTunes.getSearchCache() )
+        print( 'status calls per tick: last %d, average %.1f, most %d' %
+               self.iTunes.getStatusCallsPerTick() )
+        self.addTimer( self.kStatsInterval, self.logStats )
+
     def makeTimerManager( self ):
         self.timerManager = Timer.TimerManager()
 
@@ -74,9 +100,11 @@ class Server( asyncore.dispatcher ):
         timerManager.addTimer( self.kSaveClientStateInterval, 
                                self.saveClientState )
         loop = asyncore.loop
+        iTunes = self.iTunes
         while 1:
             loop( timeout = self.kLoopPollTimeout, use_poll = True, count = 1 )
             timerManager.processTimers()
+            iTunes.processCompletions()
 
     def handle_read( self ):
         
@@ -161,5 +189,14 @@ class Server( asyncore.dispatcher ):
         self.timerManager.removeTimer( timer )
 
 if __name__ == "__main__":
-    a = Server()
+
+    #
+    # If given the path of an iTunes XML file, play its library with a
+    # SimulatedPlayer instead of controlling iTunes.
+    #
+    if len( sys.argv ) > 1:
+        from SimulatedPlayer import SimulatedPlayer
+        a = Server( SimulatedPlayer(), sys.argv[ 1 ] )
+    else:
+        a = Server()
     a.run()
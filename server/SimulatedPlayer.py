@@ -0,0 +1,420 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import random, threading
+from time import sleep, time
+from PlayerBackend import PlayerBackend, PlayerError
+
+#
+# Playlist kept by SimulatedPlayer.
+#
+class SimulatedPlaylist( object ):
+
+    def __init__( self, name, tracks = None ):
+        if tracks is None:
+            tracks = []
+        self.name = name
+        self.tracks = tracks
+        self.shuffle = False
+        self.repeat = 'off'
+
+    def __repr__( self ): return 'SimulatedPlaylist "%s"' % ( self.name, )
+
+#
+# Implementation of PlayerBackend that needs no music player: it keeps the
+# playlists, ratings and settings in memory, and plays a track by letting the
+# clock run for its duration. When a track ends, playback moves on to the next
+# one in the playlist, following the shuffle and repeat settings. Runs on any
+# host, which makes it useful for running the server without iTunes.
+#
+# For trying out how the server copes with a slow or hung player, every
+# request can be made to take a while (see setDelay() and hang()).
+#
+class SimulatedPlayer( PlayerBackend ):
+
+    #
+    # Rate of movement through a track while rewinding or fast-forwarding
+    #
+    kSeekRate = 8.0
+
+    def __init__( self, clock = time ):
+        self.clock = clock      # Function that returns the time in seconds
+        self.lock = threading.Lock()
+        self.playlists = {}     # Mapping of names to SimulatedPlaylist objects
+        self.playlist = None    # The current SimulatedPlaylist
+        self.index = 0          # Index of the current track in the playlist
+        self.state = 'stopped'
+        self.position = 0.0     # Position in the current track at 'when'
+        self.when = clock()
+        self.volume = 50
+        self.mute = False
+        self.trackRatings = {}  # Mapping of track IDs to ratings
+        self.albumRatings = {}  # Mapping of ( artist, album ) to ratings
+        self.delay = 0.0        # Seconds that each request takes
+        self.hangUntil = 0.0    # Time (time.time()) when requests resume
+
+    #
+    # Make each request take SECONDS seconds to answer.
+    #
+    def setDelay( self, seconds ): self.delay = seconds
+
+    #
+    # Stop answering requests for SECONDS seconds, like a player showing a
+    # dialog box. Requests made in the meantime wait until the end.
+    #
+    def hang( self, seconds ): self.hangUntil = time() + seconds
+
+    #
+    # Wait as long as setDelay() and hang() ask for. Called at the start of
+    # each request.
+    #
+    def respond( self ):
+        if self.delay > 0.0:
+            sleep( self.delay )
+        wait = self.hangUntil - time()
+        if wait > 0.0:
+            sleep( wait )
+
+    #
+    # Obtain the number of seconds of the current track played per second for
+    # the current state.
+    #
+    def getRate( self ):
+        if self.state == 'playing':
+            return 1.0
+        elif self.state == 'fast forwarding':
+            return self.kSeekRate
+        elif self.state == 'rewinding':
+            return -self.kSeekRate
+        return 0.0
+
+    #
+    # Bring the position up to date with the clock, moving on to the following
+    # tracks when the current one runs out. Must be called with the lock held.
+    #
+    def update( self ):
+        now = self.clock()
+        self.position += self.getRate() * ( now - self.when )
+        self.when = now
+        if self.position < 0.0:
+            self.position = 0.0
+        track = self.getTrack()
+        while track is not None and \
+                self.position >= max( track.getDuration(), 1 ):
+            self.position -= max( track.getDuration(), 1 )
+            if not self.advance( 1, False ):
+                self.position = 0.0
+                self.state = 'stopped'
+                break
+            track = self.getTrack()
+
+    #
+    # Move OFFSET tracks through the current playlist. If BYUSER is False,
+    # this is the end of a track, so a repeat mode of 'one' stays with it.
+    # Returns False if there is no track to move to.
+    #
+    def advance( self, offset, byUser ):
+        playlist = self.playlist
+        if playlist is None or not playlist.tracks:
+            return False
+        if playlist.repeat == 'one' and not byUser:
+            return True
+        count = len( playlist.tracks )
+        if playlist.shuffle and offset > 0:
+            index = random.randrange( count )
+        else:
+            index = self.index + offset
+        if index < 0 or index >= count:
+            if playlist.repeat == 'off':
+                return False
+            index %= count
+        self.index = index
+        return True
+
+    #
+    # Obtain the current Track object, or None if there is none. Must be
+    # called with the lock held.
+    #
+    def getTrack( self ):
+        playlist = self.playlist
+        if playlist is None or self.index >= len( playlist.tracks ):
+            return None
+        return playlist.tracks[ self.index ]
+
+    #
+    # Change the player state to STATE, keeping the position up to date.
+    #
+    def setState( self, state ):
+        self.lock.acquire()
+        try:
+            self.update()
+            if self.getTrack() is not None:
+                self.state = state
+        finally:
+            self.lock.release()
+
+    def getPlayerState( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            return self.state
+        finally:
+            self.lock.release()
+
+    def getPlayerPosition( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            return int( self.position )
+        finally:
+            self.lock.release()
+
+    def getCurrentTrack( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            return self.getTrack()
+        finally:
+            self.lock.release()
+
+    def getCurrentTrackID( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            track = self.getTrack()
+        finally:
+            self.lock.release()
+        if track is None:
+            return None
+        return track.getID()
+
+    def getCurrentPlaylistName( self ):
+        self.respond()
+        if self.playlist is None:
+            return None
+        return self.playlist.name
+
+    def getVolume( self ):
+        self.respond()
+        return self.volume
+    def setVolume( self, value ):
+        self.respond()
+        self.volume = min( max( value, 0 ), 100 )
+    def getMute( self ):
+        self.respond()
+        return self.mute
+    def setMute( self, value ):
+        self.respond()
+        self.mute = bool( value )
+
+    def play( self ):
+        self.respond()
+        self.setState( 'playing' )
+    def pause( self ):
+        self.respond()
+        self.setState( 'paused' )
+    def rewind( self ):
+        self.respond()
+        self.setState( 'rewinding' )
+    def fastForward( self ):
+        self.respond()
+        self.setState( 'fast forwarding' )
+    def resume( self ):
+        self.respond()
+        self.setState( 'playing' )
+
+    def stop( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            self.state = 'stopped'
+            self.position = 0.0
+        finally:
+            self.lock.release()
+
+    def backTrack( self ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            self.position = 0.0
+        finally:
+            self.lock.release()
+
+    #
+    # Move OFFSET tracks through the current playlist at the request of the
+    # user.
+    #
+    def skip( self, offset ):
+        self.lock.acquire()
+        try:
+            self.update()
+            if self.advance( offset, True ):
+                self.position = 0.0
+        finally:
+            self.lock.release()
+
+    def previousTrack( self ):
+        self.respond()
+        self.skip( -1 )
+    def nextTrack( self ):
+        self.respond()
+        self.skip( 1 )
+
+    #
+    # Remember TRACKS as the contents of the playlist NAME, unless we already
+    # have our own.
+    #
+    def findPlaylist( self, name, tracks ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            playlist = self.playlists.get( name )
+            if playlist is None:
+                playlist = SimulatedPlaylist( name, list( tracks ) )
+                self.playlists[ name ] = playlist
+            return playlist
+        finally:
+            self.lock.release()
+
+    def makePlaylist( self, name ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            if name in self.playlists:
+                raise PlayerError, 'duplicate playlist name: ' + name
+            playlist = SimulatedPlaylist( name )
+            self.playlists[ name ] = playlist
+            return playlist
+        finally:
+            self.lock.release()
+
+    def deletePlaylist( self, playlist ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            if self.playlists.get( playlist.name ) is not playlist:
+                raise PlayerError, 'unknown playlist: ' + playlist.name
+            del self.playlists[ playlist.name ]
+            if self.playlist is playlist:
+                self.playlist = None
+                self.state = 'stopped'
+        finally:
+            self.lock.release()
+
+    def clearPlaylist( self, playlist ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            playlist.tracks = []
+            if self.playlist is playlist:
+                self.state = 'stopped'
+                self.position = 0.0
+                self.index = 0
+        finally:
+            self.lock.release()
+
+    def addTrack( self, playlist, track ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            playlist.tracks.append( track )
+        finally:
+            self.lock.release()
+
+    def addTracks( self, playlist, tracks ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            playlist.tracks.extend( tracks )
+        finally:
+            self.lock.release()
+
+    def removeTrack( self, playlist, index ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            self.update()
+            if index < 0 or index >= len( playlist.tracks ):
+                raise PlayerError, 'invalid track index: %d' % ( index, )
+            del playlist.tracks[ index ]
+            if self.playlist is playlist:
+                if index < self.index:
+                    self.index -= 1
+                elif index == self.index:
+                    self.position = 0.0
+                    if self.index >= len( playlist.tracks ):
+                        self.index = 0
+                        self.state = 'stopped'
+        finally:
+            self.lock.release()
+
+    def playPlaylist( self, playlist, index ):
+        self.respond()
+        self.lock.acquire()
+        try:
+            if index < 0 or index >= len( playlist.tracks ):
+                raise PlayerError, 'invalid track index: %d' % ( index, )
+            self.playlist = playlist
+            self.index = index
+            self.position = 0.0
+            self.when = self.clock()
+            self.state = 'playing'
+        finally:
+            self.lock.release()
+
+    def getShuffle( self, playlist ):
+        self.respond()
+        return playlist.shuffle
+    def setShuffle( self, playlist, value ):
+        self.respond()
+        playlist.shuffle = bool( value )
+    def getRepeat( self, playlist ):
+        self.respond()
+        return playlist.repeat
+
+    def setRepeat( self, playlist, value ):
+        self.respond()
+        if value not in self.kRepeatModes:
+            raise PlayerError, 'invalid repeat mode: ' + str( value )
+        playlist.repeat = value
+
+    def getTrackRating( self, track ):
+        self.respond()
+        return self.trackRatings.get( track.getID(), 0 )
+
+    def setTrackRating( self, track, rating ):
+        self.respond()
+        self.trackRatings[ track.getID() ] = rating
+
+    def getAlbumRating( self, track ):
+        self.respond()
+        return self.albumRatings.get( ( track.getArtistName(),
+                                        track.getAlbumName() ), 0 )
+
+    def setAlbumRating( self, track, rating ):
+        self.respond()
+        self.albumRatings[ ( track.getArtistName(),
+                             track.getAlbumName() ) ] = rating
@@ -0,0 +1,343 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+import copy
+from array import array
+
+#
+# Obtain the smallest number of edits (insertions, deletions, or replacements
+# of one character) that turn TERM into some part of TEXT. If ANCHORED is
+# True, the part must be at the start of TEXT.
+#
+def getMatchDistance( term, text, anchored = False ):
+    size = len( term )
+    column = range( size + 1 )
+    best = size
+    for char in text:
+        diagonal = column[ 0 ]
+        if anchored:
+            column[ 0 ] += 1
+        else:
+            column[ 0 ] = 0     # A match may start anywhere in TEXT
+        for index in xrange( 1, size + 1 ):
+            above = column[ index ]
+            value = diagonal
+            if term[ index - 1 ] != char:
+                value += 1
+            if above + 1 < value:
+                value = above + 1
+            if column[ index - 1 ] + 1 < value:
+                value = column[ index - 1 ] + 1
+            diagonal = above
+            column[ index ] = value
+        if column[ size ] < best:
+            best = column[ size ]
+    return best
+
+#
+# Index of the key values of a list of OrderedItem objects for substring
+# searches. Maps each sequence of kGramSize characters found in the keys to
+# the positions of the items that contain it. A search only visits the items
+# that hold the least common sequence of the search term, instead of all of
+# them. For fuzzySearch(), it also maps each word of the keys to the
+# positions of the items that contain it, and each short word with one
+# letter removed to the words it comes from.
+#
+class SubstringIndex( object ):
+
+    kGramSize = 3
+
+    #
+    # The most edits that fuzzySearch() will allow.
+    #
+    kMaxEdits = 2
+
+    #
+    # Terms shorter than this are matched against whole words by
+    # fuzzySearch(), with one edit.
+    #
+    kWordTermSize = 6
+
+    #
+    # The most items that fuzzySearch() will check or return for one term. A
+    # few typing mistakes in a term made of common pieces would otherwise have
+    # it check a large part of the library. None removes the limit.
+    #
+    kMaxCandidates = 250
+
+    #
+    # Constructor. ITEMS is the list of OrderedItem objects to index. It must
+    # not change while the index is in use.
+    #
+    def __init__( self, items ):
+        self.items = items
+        self.postings = {}
+        self.words = {}
+        self.shorter = {}
+        size = self.kGramSize
+        for position in xrange( len( items ) ):
+            key = items[ position ].key
+            grams = set( [ key[ index : index + size ] for index in
+                           xrange( len( key ) - size + 1 ) ] )
+            for gram in grams:
+                posting = self.postings.get( gram )
+                if posting is None:
+                    posting = self.postings[ gram ] = array( 'I' )
+                posting.append( position )
+            for word in set( key.split() ):
+                posting = self.words.get( word )
+                if posting is None:
+                    posting = self.words[ word ] = array( 'I' )
+                posting.append( position )
+
+        #
+        # Only the words that a short term could turn into with one
+        # replacement or insertion need their shorter forms.
+        #
+        for word in self.words:
+            if size < len( word ) <= self.kWordTermSize:
+                for index in xrange( len( word ) ):
+                    shorter = word[ : index ] + word[ index + 1 : ]
+                    self.shorter.setdefault( shorter, [] ).append( word )
+
+    #
+    # Obtain an index like this one for ITEMS, a list holding items with the
+    # same keys in the same order as the one this index was made for.
+    #
+    def withItems( self, items ):
+        index = copy.copy( self )
+        index.items = items
+        return index
+
+    #
+    # Obtain the number of items in the index
+    #
+    def __len__( self ): return len( self.items )
+
+    #
+    # Obtain a list of the items whose key contains TERM, in the same order as
+    # they appear in the indexed list. TERM is converted to upper-case as the
+    # keys are. Terms shorter than kGramSize are found by visiting every item.
+    #
+    def search( self, term ):
+        term = term.upper()
+        size = self.kGramSize
+        if len( term ) < size:
+            return [ item for item in self.items
+                     if item.key.find( term ) != -1 ]
+
+        #
+        # Make sure that each candidate contains the whole term.
+        #
+        items = self.items
+        found = []
+        for position in self.getPosting( term ):
+            item = items[ position ]
+            if item.key.find( term ) != -1:
+                found.append( item )
+        return found
+
+    #
+    # Obtain the positions of the least common sequence in TERM, which has at
+    # least kGramSize characters. Every item that contains TERM appears in
+    # them.
+    #
+    def getPosting( self, term ):
+        size = self.kGramSize
+        best = None
+        for index in xrange( len( term ) - size + 1 ):
+            posting = self.postings.get( term[ index : index + size ] )
+            if posting is None:
+                return ()
+            if best is None or len( posting ) < len( best ):
+                best = posting
+        return best
+
+    #
+    # Order FOUND, the results of search() for TERM, so that the best matches
+    # come first: items whose key is TERM, then those whose key starts with
+    # TERM, then those with a word that starts with TERM, and finally the
+    # rest. Items of the same rank keep their order.
+    #
+    def rank( self, found, term ):
+        term = term.upper()
+        wordStart = ' ' + term
+        def getRank( item ):
+            key = item.key
+            if key == term:
+                return 0
+            if key.startswith( term ):
+                return 1
+            if key.find( wordStart ) != -1:
+                return 2
+            return 3
+        return sorted( found, key = getRank )
+
+    #
+    # Obtain a list of the items with a part that is a few edits away from
+    # TERM, ordered by the number of edits and then by key. Terms of 4 or 5
+    # characters allow one edit in a whole word (see fuzzySearchWords()).
+    # Longer terms allow one edit, and those of 9 or more allow two (but no
+    # more than kMaxEdits).
+    #
+    # Split TERM into one more piece than the number of edits allowed. Every
+    # edit can spoil only one piece, so at least one of them must appear as
+    # is in any match. Each piece has at least kGramSize characters, so the
+    # index finds the items that hold it. For each place the piece appears in
+    # an item, only the text on either side of it is checked for the number
+    # of edits. See splitTerm() for where the pieces start and end. The least
+    # common pieces go first, and no more than kMaxCandidates items are
+    # checked, so a term made of common pieces may not find every match.
+    #
+    def fuzzySearch( self, term ):
+        term = term.upper()
+        size = len( term )
+        if size < self.kWordTermSize:
+            return self.fuzzySearchWords( term )
+        edits = min( size / self.kGramSize - 1, self.kMaxEdits )
+
+        cost, pieces = self.splitTerm( term, 0, edits + 1 )
+        pieces.sort( key = lambda a: self.getCost( term[ a[ 0 ] : a[ 1 ] ] ) )
+        items = self.items
+        remaining = self.kMaxCandidates
+        distances = {}
+        for start, end in pieces:
+            if remaining == 0:
+                break
+            text = term[ start : end ]
+            before = term[ start - 1 :: -1 ] if start else ''
+            after = term[ end : ]
+            for position in self.getPosting( text ):
+                key = items[ position ].key
+                found = key.find( text )
+                if found == -1 or len( key ) < size - edits:
+                    continue
+                if remaining is not None:
+                    if remaining == 0:
+                        break
+                    remaining -= 1
+                best = distances.get( position, edits + 1 )
+                while found != -1 and best > 0:
+
+                    #
+                    # Compare what comes before the piece backwards, and then
+                    # what comes after it.
+                    #
+                    begin = max( found - start - best, 0 )
+                    distance = getMatchDistance(
+                        before, key[ begin : found ][ :: -1 ], True )
+                    if distance < best:
+                        begin = found + end - start
+                        distance += getMatchDistance(
+                            after, key[ begin : begin + size - end + best ],
+                            True )
+                        if distance < best:
+                            best = distance
+                    found = key.find( text, found + 1 )
+                if best <= edits:
+                    distances[ position ] = best
+
+        return self.getOrdered( distances )
+
+    #
+    # Obtain a list of the items with a word that is one edit away from TERM
+    # (or is TERM), for fuzzySearch(). Allowing an edit anywhere in the keys
+    # for a short term would match a large part of the library. The words of
+    # the same length as TERM, or one letter longer, that become the same as
+    # TERM with one letter removed from each come from the shorter mapping;
+    # those one letter shorter are TERM with one letter removed.
+    #
+    def fuzzySearchWords( self, term ):
+        size = len( term )
+        if size <= self.kGramSize:
+            return []
+
+        found = { term: 0 }
+        for word in self.shorter.get( term, () ):
+            found.setdefault( word, 1 )
+        for index in xrange( size ):
+            shorter = term[ : index ] + term[ index + 1 : ]
+            found.setdefault( shorter, 1 )
+            for word in self.shorter.get( shorter, () ):
+                if len( word ) == size and \
+                        word[ : index ] + word[ index + 1 : ] == shorter:
+                    found.setdefault( word, 1 )
+
+        distances = {}
+        for word, distance in found.iteritems():
+            for position in self.words.get( word, () ):
+                if distance < distances.get( position, 2 ):
+                    distances[ position ] = distance
+
+        return self.getOrdered( distances )[ : self.kMaxCandidates ]
+
+    #
+    # Obtain the items for DISTANCES, a mapping of item positions to the
+    # number of edits in their match, ordered by the number of edits and then
+    # by key (the order of the positions).
+    #
+    def getOrdered( self, distances ):
+        items = self.items
+        found = [ ( distance, position ) for position, distance in
+                  distances.iteritems() ]
+        found.sort()
+        return [ items[ position ] for distance, position in found ]
+
+    #
+    # Obtain the best way to split TERM, from START to the end, into PIECES
+    # pieces for fuzzySearch(): the one with the fewest items to check.
+    # Returns the number of items and a list of the start and end positions of
+    # the pieces.
+    #
+    def splitTerm( self, term, start, pieces ):
+        size = self.kGramSize
+        if pieces == 1:
+            return self.getCost( term[ start : ] ), [ ( start, len( term ) ) ]
+
+        best = None
+        last = len( term ) - size * ( pieces - 1 )
+        for end in xrange( start + size, last + 1 ):
+            cost, rest = self.splitTerm( term, end, pieces - 1 )
+            cost += self.getCost( term[ start : end ] )
+            if best is None or cost < best[ 0 ]:
+                best = ( cost, [ ( start, end ) ] + rest )
+        return best
+
+    #
+    # Obtain the number of items that search() would check for TEXT.
+    #
+    def getCost( self, text ):
+        size = self.kGramSize
+        cost = len( self.items )
+        for index in xrange( len( text ) - size + 1 ):
+            posting = self.postings.get( text[ index : index + size ] )
+            if posting is None:
+                return 0
+            cost = min( cost, len( posting ) )
+        return cost
+
+    def __repr__( self ):
+        positions = sum( [ len( posting ) for posting in
+                           self.postings.itervalues() ] )
+        positions += sum( [ len( posting ) for posting in
+                            self.words.itervalues() ] )
+        return 'SubstringIndex %d items %d grams %d words %d positions ' \
+            '(%dK)' % ( len( self.items ), len( self.postings ),
+                        len( self.words ), positions,
+                        positions * array( 'I' ).itemsize / 1024 )
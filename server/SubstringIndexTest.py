@@ -0,0 +1,70 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+
+import unittest
+from OrderedItem import OrderedItem
+from SubstringIndex import SubstringIndex
+
+#
+# Tests of the fuzzySearch() method of the SubstringIndex class. Run with
+# 'python -m unittest SubstringIndexTest'.
+#
+class SubstringIndexTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.items = [ OrderedItem( name ) for name in (
+                'Moon River', 'Moonlight Serenade', 'Blue Moon',
+                'Harvest Moon', 'Mood Indigo', 'Yellow', 'Mellow Yellow', 'Fellow Traveller',
+                'Heart Of Gold', 'Hearts Of Stone' ) ]
+        self.items.sort( key = OrderedItem.sortKey )
+        self.index = SubstringIndex( self.items )
+
+    def getKeys( self, term ):
+        return [ item.key for item in self.index.fuzzySearch( term ) ]
+
+    def testLongTerm( self ):
+        self.assertEqual( self.getKeys( 'Heart 0f' ), [ 'HEART OF GOLD' ] )
+        self.assertEqual( self.getKeys( 'Hearts 0f' ),
+                          [ 'HEARTS OF STONE', 'HEART OF GOLD' ] )
+        self.assertEqual( self.getKeys( 'Moon Rivr' ), [ 'MOON RIVER' ] )
+        self.assertEqual( self.getKeys( 'Hearts Of Ztonx' ),
+                          [ 'HEARTS OF STONE' ] )
+
+    #
+    # Short terms match whole words with one edit, the closest first.
+    #
+    def testShortTerm( self ):
+        self.assertEqual( self.getKeys( 'Moon' ),
+                          [ 'BLUE MOON', 'HARVEST MOON', 'MOON RIVER',
+                            'MOOD INDIGO' ] )
+        self.assertEqual( self.getKeys( 'Yelow' ),
+                          [ 'MELLOW YELLOW', 'YELLOW' ] )
+        self.assertEqual( self.getKeys( 'Felow' ), [ 'FELLOW TRAVELLER' ] )
+        self.assertEqual( self.getKeys( 'Moo' ), [] )
+
+    def testMaxCandidates( self ):
+        self.index.kMaxCandidates = 1
+        self.assertEqual( len( self.index.fuzzySearch( 'Mellow' ) ), 1 )
+        self.assertEqual( len( self.index.fuzzySearch( 'Moon' ) ), 1 )
+        self.index.kMaxCandidates = None
+        self.assertEqual( len( self.index.fuzzySearch( 'Mellow' ) ), 3 )
+
+if __name__ == '__main__':
+    unittest.main()
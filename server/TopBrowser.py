@@ -23,7 +23,7 @@ from DynamicBrowser import *
 from Content import Content
 from GenreListBrowser import GenreListBrowser
 from PlaylistBrowser import PlaylistBrowser
-from Searcher import AlbumSearcher, ArtistSearcher
+from Searcher import AlbumSearcher, ArtistSearcher, TrackSearcher
 from SettingsBrowser import SettingsBrowser
 
 #
@@ -92,6 +92,15 @@ class SearchArtists( DynamicEntry ):
     def makeNextLevel( self, browser ):
         return ArtistSearcher( browser.client, browser )
 
+#
+# DynamicEntry derivative that for tracks
+#
+class SearchTracks( DynamicEntry ):
+    def makeContent( self, browser ): 
+        return [ 'Search', 'Tracks' ]
+    def makeNextLevel( self, browser ):
+        return TrackSearcher( browser.client, browser )
+
 #
 # DynamicEntry derivative that for playlists
 #
@@ -114,4 +123,5 @@ class TopBrowser( DynamicBrowser ):
                                    BrowsePlaylists(),
                                    SearchAlbums(),
                                    SearchArtists(),
+                                   SearchTracks(),
                                    Settings(), ) )
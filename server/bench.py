@@ -0,0 +1,470 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+
+#
+# Benchmarks for the library model. They run on a synthetic iTunes XML file
+# written to a scratch directory, with a SimulatedPlayer in place of iTunes.
+# Usage:
+#
+#   python bench.py NAME [SIZE]
+#
+# where NAME is one of the benchmarks listed at the bottom, and SIZE is the
+# number of tracks or items to use instead of its default.
+#
+
+import gc, os, random, resource, shutil, sys, tempfile
+from time import time
+from xml.sax.saxutils import escape
+import iTunesXML
+from OrderedItem import OrderedItem
+from SimulatedPlayer import SimulatedPlayer
+from SubstringIndex import SubstringIndex, getMatchDistance
+
+kWords = [ 'LOVE', 'NIGHT', 'BLUE', 'HEART', 'ROAD', 'FIRE', 'DREAM', 'TIME',
+           'SUN', 'RAIN', 'STAR', 'GOLD', 'RIVER', 'STONE', 'WIND', 'MOON',
+           'CITY', 'WILD', 'ECHO', 'SHADOW' ]
+
+kGenres = [ 'Rock', 'Jazz', 'Pop', 'Blues', 'Classical' ]
+
+#
+# Generate TRACKCOUNT track records like those found in an iTunes XML file. A
+# fraction COMPILATIONS of the tracks belong to COMPILATIONALBUMS compilation
+# albums, which end up under 'Various Artists'. The rest belong to artists with
+# a dozen albums each.
+#
+def makeTracks( trackCount, compilations = 0.3, compilationAlbums = 200,
+                seed = 1 ):
+    rand = random.Random( seed )
+    artistCount = max( 1, trackCount / 60 )
+    for index in xrange( trackCount ):
+        track = { u'Track ID': 1000 + index,
+                  u'Name': u'%s %s & %d' % ( rand.choice( kWords ),
+                                             rand.choice( kWords ).lower(),
+                                             index ),
+                  u'Genre': unicode( rand.choice( kGenres ) ),
+                  u'Kind': u'MPEG audio file',
+                  u'Total Time': rand.randrange( 60000, 400000 ),
+                  u'Track Number': rand.randrange( 1, 20 ),
+                  u'Persistent ID': u'%016X' % ( 0xABC0000000 + index, ),
+                  u'Track Type': u'File' }
+        if rand.random() < compilations:
+            track[ u'Artist' ] = u'Guest %d' % (
+                rand.randrange( artistCount ), )
+            track[ u'Album' ] = u'Hits %d' % (
+                rand.randrange( compilationAlbums ), )
+            track[ u'Compilation' ] = True
+        else:
+            artist = u'The Artist %d' % ( rand.randrange( artistCount ), )
+            track[ u'Artist' ] = artist
+            track[ u'Album Artist' ] = artist
+            track[ u'Album' ] = u'%s %s %d' % ( rand.choice( kWords ),
+                                               rand.choice( kWords ),
+                                               rand.randrange( 12 ) )
+        yield track
+
+#
+# Write an iTunes XML file holding the track records TRACKS to PATH, along
+# with a few playlists.
+#
+def writeLibrary( path, tracks ):
+    output = open( path, 'w' )
+    write = output.write
+    write( '<?xml version="1.0" encoding="UTF-8"?>\n'
+           '<!DOCTYPE plist PUBLIC "-//Apple//DTD PLIST 1.0//EN" '
+           '"http://www.apple.com/DTDs/PropertyList-1.0.dtd">\n'
+           '<plist version="1.0">\n<dict>\n'
+           '\t<key>Major Version</key><integer>1</integer>\n'
+           '\t<key>Tracks</key>\n\t<dict>\n' )
+    ids = []
+    for track in tracks:
+        id = track[ u'Track ID' ]
+        ids.append( id )
+        write( '\t\t<key>%d</key>\n\t\t<dict>\n' % ( id, ) )
+        for key, value in sorted( track.items() ):
+            if value is True:
+                value = '<true/>'
+            elif isinstance( value, int ):
+                value = '<integer>%d</integer>' % ( value, )
+            else:
+                value = '<string>%s</string>' % (
+                    escape( value.encode( 'utf-8' ) ), )
+            write( '\t\t\t<key>%s</key>%s\n' % ( key, value ) )
+        write( '\t\t</dict>\n' )
+    write( '\t</dict>\n\t<key>Playlists</key>\n\t<array>\n'
+           '\t\t<dict>\n\t\t\t<key>Name</key><string>Library</string>\n'
+           '\t\t\t<key>Master</key><true/>\n\t\t</dict>\n' )
+    rand = random.Random( len( ids ) )
+    for index in xrange( 5 ):
+        write( '\t\t<dict>\n\t\t\t<key>Name</key><string>List %d</string>\n'
+               '\t\t\t<key>Playlist Items</key>\n\t\t\t<array>\n' % (
+                index, ) )
+        for id in rand.sample( ids, min( len( ids ), 200 ) ):
+            write( '\t\t\t\t<dict><key>Track ID</key>'
+                   '<integer>%d</integer></dict>\n' % ( id, ) )
+        write( '\t\t\t</array>\n\t\t</dict>\n' )
+    write( '\t</array>\n</dict>\n</plist>\n' )
+    output.close()
+
+#
+# Run FUNCTION with the arguments ARGS. Returns the number of seconds it took,
+# and its result.
+#
+def timed( function, *args ):
+    start = time()
+    result = function( *args )
+    return time() - start, result
+
+#
+# Compare a load that parses the XML file with one that restores the library
+# snapshot saved by the first. The time for load() to return is when the
+# library is ready for use; the time after that is for the work load() leaves
+# to a separate thread, such as making the search indices. Also times parse()
+# and restoreSnapshot() on their own.
+#
+def benchSnapshot( trackCount ):
+    writeLibrary( 'library.xml', makeTracks( trackCount ) )
+    model = iTunesXML.iTunesXML( SimulatedPlayer(), 'library.xml' )
+    parsedLoad, ignored = timed( model.load )
+    parsedRest, ignored = timed( model.backgroundLoader.join )
+    model = iTunesXML.iTunesXML( SimulatedPlayer(), 'library.xml' )
+    restoredLoad, ignored = timed( model.load )
+    restoredRest, ignored = timed( model.backgroundLoader.join )
+    parsed, ignored = timed( model.parse )
+    restored, ignored = timed( model.restoreSnapshot )
+    print( 'snapshot: %d tracks, %.1fMB snapshot\n'
+           '  load: parse %.2fs (then %.2fs), snapshot %.2fs (then %.2fs)\n'
+           '  parse() %.2fs, restoreSnapshot() %.2fs' % (
+            trackCount, os.path.getsize( model.kSnapshotPath ) / 1048576.0,
+            parsedLoad, parsedRest, restoredLoad, restoredRest, parsed,
+            restored ) )
+
+#
+# Locate the album named ALBUMNAME, an OrderedItem, among the albums of
+# ARTIST the way the build did before it had an index: by looking at each one
+# from the most recently added. Returns the Album object or None.
+#
+def scanAlbums( artist, albumName ):
+    albums = artist.albums
+    for index in xrange( len( albums ) - 1, -1, -1 ):
+        if albums[ index ] == albumName:
+            return albums[ index ]
+    return None
+
+#
+# Time building the library model from TRACKCOUNT track records, half of them
+# on compilations, as the number of compilation albums grows. With albums
+# found through an index, the time should not grow with the number of albums
+# under 'Various Artists'. For comparison, also time the album lookups of
+# every 20th track made with the index and with the scan that it replaced.
+#
+def benchAlbums( trackCount ):
+    for albumCount in ( 250, 1000, 4000 ):
+        tracks = list( makeTracks( trackCount, 0.5, albumCount ) )
+        builder = iTunesXML.LibraryBuilder()
+        start = time()
+        for track in tracks:
+            builder.addTrack( track )
+        builder.finish()
+        elapsed = time() - start
+        various = [ artist for artist in builder.artistList
+                    if artist.getName() == 'Various Artists' ][ 0 ]
+        print( 'albums: %d tracks, %d Various Artists albums: build %.2fs '
+               '(%.1fus/track)' % ( trackCount, various.getAlbumCount(),
+                                    elapsed, elapsed * 1e6 / trackCount ) )
+
+        tracks = [ track for album in builder.albumList
+                   for track in album.tracks ]
+        lookups = [ ( track.album.artist, OrderedItem( track.albumName ) )
+                    for track in tracks[ : : 20 ] ]
+        albumIndex = builder.albumIndex
+        indexed, found = timed(
+            lambda: [ albumIndex.get( ( artist.key, albumName.key ) )
+                      for artist, albumName in lookups ] )
+        scanned, expected = timed(
+            lambda: [ scanAlbums( artist, albumName )
+                      for artist, albumName in lookups ] )
+        if found != expected:
+            print( '*** index and scan found different albums' )
+        print( '  %d lookups: index %.2fus, scan %.2fus per lookup' % (
+                len( lookups ), indexed * 1e6 / len( lookups ),
+                scanned * 1e6 / len( lookups ) ) )
+
+#
+# Obtain the peak memory use of this process in megabytes.
+#
+def getPeakMemory():
+    peak = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1048576.0     # Bytes
+    return peak / 1024.0            # Kilobytes
+
+#
+# Class with the methods of the Track class but keeping its attributes in a
+# per-instance dictionary, as Track objects did before they had __slots__.
+#
+PlainTrack = type( 'PlainTrack', ( object, ), dict(
+        [ ( name, value ) for name, value in iTunesXML.Track.__dict__.items()
+          if name not in iTunesXML.Track.__slots__ and
+          name not in ( '__slots__', '__getstate__', '__setstate__' ) ] ) )
+
+#
+# Measure the growth in peak memory use from building the library model from
+# TRACKCOUNT track records in a child process, so that each measurement starts
+# from the same peak. If PLAIN is True, the model is made the way it was before
+# it was made smaller: with PlainTrack objects that do not share the artist and
+# album names. Returns the growth in megabytes.
+#
+def measureBuild( trackCount, plain ):
+    input, output = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close( input )
+        if plain:
+            iTunesXML.Track = PlainTrack
+        gc.collect()
+        base = getPeakMemory()
+        builder = iTunesXML.LibraryBuilder()
+        if plain:
+            builder.strings = None
+        for track in makeTracks( trackCount ):
+            builder.addTrack( track )
+        builder.finish()
+        gc.collect()
+        os.write( output, repr( getPeakMemory() - base ) )
+        os._exit( 0 )
+
+    os.close( output )
+    growth = float( os.read( input, 100 ) )
+    os.close( input )
+    os.waitpid( pid, 0 )
+    return growth
+
+#
+# Compare the growth in peak memory use from building the library model from
+# TRACKCOUNT track records with that of the model before it was made smaller.
+# The records are made one at a time, so the growth is mostly the model
+# itself.
+#
+def benchMemory( trackCount ):
+    print( 'memory: %d tracks' % ( trackCount, ) )
+    for label, plain in ( ( 'before', True ), ( 'now', False ) ):
+        growth = measureBuild( trackCount, plain )
+        print( '  %-6s +%.0fMB (%.0f bytes/track)' % (
+                label, growth, growth * 1048576 / trackCount ) )
+
+#
+# Time making OrderedItem objects for the names of TRACKCOUNT tracks (names,
+# artists, albums and genres), first with the cache of keys, then without it,
+# and then for each distinct name only, and sorting them by comparison and by
+# key.
+#
+def benchKeys( trackCount ):
+    names = []
+    for track in makeTracks( trackCount ):
+        for name in ( u'Name', u'Artist', u'Album', u'Genre' ):
+            names.append( track[ name ] )
+    distinct = list( set( names ) )
+
+    OrderedItem.cache = {}
+    cached, items = timed( lambda: [ OrderedItem( name ) for name in names ] )
+    cacheSize = OrderedItem.kCacheSize
+    OrderedItem.kCacheSize = 0
+    uncached, ignored = timed( lambda: [ OrderedItem( name )
+                                         for name in names ] )
+    OrderedItem.kCacheSize = cacheSize
+    OrderedItem.cache = {}
+    cold, ignored = timed( lambda: [ OrderedItem( name )
+                                     for name in distinct ] )
+
+    random.Random( 1 ).shuffle( items )
+    compared, ignored = timed( sorted, items )
+    keyed, ignored = timed( lambda: sorted( items,
+                                            key = OrderedItem.sortKey ) )
+    print( 'keys: %d names, %d distinct\n'
+           '  build %.2fs, without cache %.2fs, distinct names only %.2fs\n'
+           '  sort() %.2fs, sort( key = OrderedItem.sortKey ) %.2fs' % (
+            len( names ), len( distinct ), cached, uncached, cold, compared,
+            keyed ) )
+
+#
+# Make ITEMCOUNT OrderedItem objects with names made of random words and
+# numbers, sorted by key like the lists of a LibrarySnapshot.
+#
+def makeItems( itemCount, seed = 3 ):
+    rand = random.Random( seed )
+    items = [ OrderedItem( u'%s %s %s %d' % ( rand.choice( kWords ),
+                                              rand.choice( kWords ).lower(),
+                                              rand.choice( kWords ),
+                                              rand.randrange( itemCount ) ) )
+              for index in xrange( itemCount ) ]
+    items.sort( key = OrderedItem.sortKey )
+    return items
+
+#
+# Compare the time to answer searches from a SubstringIndex with the time for
+# a scan of ITEMCOUNT items, and check that they find the same items.
+#
+def benchSearch( itemCount ):
+    items = makeItems( itemCount )
+    build, index = timed( SubstringIndex, items )
+    print( 'search: %d items, index built in %.2fs' % ( itemCount, build ) )
+    for label, terms in ( ( 'selective', [ 'MOON RIVER', 'HEART OF', 'XYZ',
+                                           '12345', 'ECHO 7' ] ),
+                          ( 'common', [ 'LOVE', 'GOLD' ] ),
+                          ( 'short', [ 'A', 'TI' ] ) ):
+        scanned = 0.0
+        indexed = 0.0
+        for term in terms:
+            elapsed, expected = timed(
+                lambda: [ item for item in items
+                          if item.key.find( term ) != -1 ] )
+            scanned += elapsed
+            elapsed, found = timed( index.search, term )
+            indexed += elapsed
+            if found != expected:
+                print( '*** results differ for', term )
+        print( '  %-9s terms: scan %.2fms, index %.2fms per term' % (
+                label, scanned * 1000 / len( terms ),
+                indexed * 1000 / len( terms ) ) )
+
+#
+# Syllables for making up words (see benchFuzzy()).
+#
+kSyllables = [ 'BA', 'KO', 'RI', 'TEN', 'LO', 'MAR', 'SI', 'VEL', 'DA', 'NU',
+               'GRO', 'PE', 'ZAN', 'TI', 'FO', 'LU', 'KER', 'MIN', 'SOL', 'RA',
+               'VO', 'DE', 'QUI', 'HAN' ]
+
+#
+# The average and worst times for a fuzzy search that benchFuzzy() accepts.
+#
+kFuzzyAverage = 0.005
+kFuzzyWorst = 0.020
+
+#
+# Time fuzzy searches of ITEMCOUNT items for terms with one or two typing
+# mistakes, and compare them with searches that check every candidate (no
+# kMaxCandidates limit) and with a scan of all items for a few of the terms.
+# The item names are made of a few thousand made-up words, so the pieces of
+# the terms are more common than in real names. Terms of 4 or 5 characters
+# are one of the words.
+#
+def benchFuzzy( itemCount ):
+    rand = random.Random( 5 )
+    words = [ ''.join( [ rand.choice( kSyllables )
+                         for count in xrange( rand.randrange( 2, 4 ) ) ] )
+              for index in xrange( 4000 ) ]
+    shortWords = [ word for word in words
+                   if len( word ) < SubstringIndex.kWordTermSize ]
+    items = [ OrderedItem( u' '.join( [ rand.choice( words ) for count in
+                                         xrange( rand.randrange( 1, 4 ) ) ] ) )
+              for index in xrange( itemCount ) ]
+    items.sort( key = OrderedItem.sortKey )
+    index = SubstringIndex( items )
+
+    total = 0.0
+    worst = 0.0
+    unlimited = 0.0
+    recall = 0.0
+    scanned = 0.0
+    scanCount = 4
+    for count in xrange( 40 ):
+        size = rand.randrange( 4, 12 )
+        if size < SubstringIndex.kWordTermSize:
+            term = rand.choice( shortWords )
+        else:
+            key = rand.choice( items ).key
+            start = rand.randrange( max( 1, len( key ) - size + 1 ) )
+            term = key[ start : start + size ]
+        for edit in xrange( 1 + ( len( term ) >= 9 ) ):
+            where = rand.randrange( len( term ) )
+            letter = rand.choice( 'ABCDEFGHIJKLMNOPQRSTUVWXYZ' )
+            term = term[ : where ] + letter + term[ where + 1 : ]
+        elapsed, found = timed( index.fuzzySearch, term )
+        total += elapsed
+        worst = max( worst, elapsed )
+
+        index.kMaxCandidates = None
+        elapsed, expected = timed( index.fuzzySearch, term )
+        del index.kMaxCandidates
+        unlimited += elapsed
+        kept = set( map( id, found ) )
+        if [ item for item in expected if id( item ) in kept ] != found:
+            print( '*** results differ for', term )
+        if expected:
+            recall += float( len( found ) ) / min(
+                len( expected ), SubstringIndex.kMaxCandidates )
+        else:
+            recall += 1
+
+        if scanCount and len( term ) >= SubstringIndex.kWordTermSize:
+            scanCount -= 1
+            edits = min( len( term ) / SubstringIndex.kGramSize - 1,
+                         SubstringIndex.kMaxEdits )
+            elapsed, matches = timed(
+                lambda: [ item for item in items if len( item.key ) >=
+                          len( term ) - edits and getMatchDistance(
+                        term, item.key ) <= edits ] )
+            scanned += elapsed
+            if set( map( id, matches ) ) != set( map( id, expected ) ):
+                print( '*** scan differs for', term )
+
+    print( 'fuzzy: %d items, 40 terms: average %.2fms, worst %.2fms' % (
+            itemCount, total * 1000 / 40, worst * 1000 ) )
+    print( '  every candidate: average %.2fms, %.0f%% of the matches found' %
+           ( unlimited * 1000 / 40, recall * 100 / 40 ) )
+    print( '  scan: average %.2fms' % ( scanned * 1000 / 4 ) )
+    assert total / 40 < kFuzzyAverage and worst < kFuzzyWorst, \
+        'fuzzy searches are too slow'
+
+#
+# Mapping of benchmark names to the function to run and its default size.
+#
+kBenchmarks = { 'albums': ( benchAlbums, 100000 ),
+                'fuzzy': ( benchFuzzy, 100000 ),
+                'keys': ( benchKeys, 100000 ),
+                'memory': ( benchMemory, 100000 ),
+                'search': ( benchSearch, 100000 ),
+                'snapshot': ( benchSnapshot, 20000 ) }
+
+def main( args ):
+    if len( args ) not in ( 1, 2 ) or args[ 0 ] not in kBenchmarks:
+        print( 'usage: bench.py NAME [SIZE], where NAME is one of ' +
+               ', '.join( sorted( kBenchmarks ) ) )
+        return 1
+    function, size = kBenchmarks[ args[ 0 ] ]
+    if len( args ) == 2:
+        size = int( args[ 1 ] )
+
+    #
+    # Work in a scratch directory, so that the library snapshot does not
+    # replace the real one.
+    #
+    here = os.getcwd()
+    scratch = tempfile.mkdtemp()
+    os.chdir( scratch )
+    try:
+        function( size )
+    finally:
+        os.chdir( here )
+        shutil.rmtree( scratch )
+    return 0
+
+if __name__ == '__main__':
+    sys.exit( main( sys.argv[ 1: ] ) )
@@ -17,27 +17,40 @@
 # USA.
 #
 
-import appscript, subprocess, threading, urllib
-from bisect import bisect_left
+import cPickle, copy, gc, itertools, mmap, subprocess, threading
+import urllib
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime
-from os import stat
+from operator import attrgetter
+from os import rename, stat
 from stat import *
+from time import time
 import xml.parsers.expat
+from CommandQueue import CommandQueue
+from GuardedPlayer import GuardedPlayer, PlayerNotResponding
+from JumpTable import JumpTable
+from KeypadIndex import KeypadIndex
 from OrderedItem import OrderedItem
+from PlayerBackend import PlayerError
+from PlayerStatus import PlayerStatus
+from PositionTracker import PositionTracker
+from SearchCache import SearchCache
+from SubstringIndex import SubstringIndex
 
 #
-# Obtain an AppleScript object that refers to the iTunes application
+# Queue of the commands that change iTunes. They run in a worker thread so that
+# the server loop never waits for iTunes.
 #
-def GetApp(): 
-    return appscript.app( 'iTunes' )
+kCommandQueue = CommandQueue()
 
 #
-# Obtain an AppleScript object that refers to the main iTunes library.
-# *** FIXME: make universal. I think this is only valid for US or
-# English-speaking countries.
+# Run COMMAND with the arguments ARGS in the command queue worker thread. If
+# given, DONE is called from the server loop once COMMAND has finished. If
+# given, KEY lets a waiting command of the same kind take on the arguments of
+# this one, combined by MERGE if given (see CommandQueue.put()).
 #
-def GetLibrary(): 
-    return GetApp().library_playlists[ 'Library' ]
+def RunCommand( command, args = (), done = None, key = None, merge = None ):
+    kCommandQueue.put( command, args, done, key, merge )
 
 #
 # Class for an artist. Maintains a list of albums associated with the artist.
@@ -64,7 +77,7 @@ class Artist( OrderedItem ):
     #
     def getAlbums( self ):
         if self.needSort:
-            self.albums.sort()
+            self.albums.sort( key = OrderedItem.sortKey )
             self.needSort = False
         return self.albums
 
@@ -78,13 +91,22 @@ class Artist( OrderedItem ):
     #
     def getAlbum( self, index ): return self.getAlbums()[ index ]
 
+    #
+    # Obtain the list of Track objects to play for this artist: the tracks of
+    # each album in turn.
+    #
+    def getPlaylistTracks( self ):
+        tracks = []
+        for album in self.getAlbums():
+            tracks.extend( album.getTracks() )
+        return tracks
+
     #
     # Add all of the albums associate with this artist to the PLAYLIST
     # playlist.
     #
     def addToPlaylist( self, playlist ):
-        for album in self.getAlbums():
-            album.addToPlaylist( playlist )
+        playlist.addTracks( self.getPlaylistTracks() )
 
     def __repr__( self ): return 'Artist "%s"' % ( self.getName(), )
 
@@ -108,6 +130,7 @@ class Album( OrderedItem ):
     def __init__( self, artist, name ):
         OrderedItem.__init__( self, name )
         self.artist = artist
+        self.genre = None
         self.tracks = []
 
         #
@@ -143,7 +166,7 @@ class Album( OrderedItem ):
             # Since the Track object define ordering by their index within the
             # original album, this will place them in their proper track order.
             #
-            self.tracks.sort()
+            self.tracks.sort( key = Track.sortKey )
             self.needSort = False
         return self.tracks
 
@@ -157,12 +180,16 @@ class Album( OrderedItem ):
     #
     def getTrack( self, index ): return self.getTracks()[ index ]
 
+    #
+    # Obtain the list of Track objects to play for this album
+    #
+    def getPlaylistTracks( self ): return list( self.getTracks() )
+
     #
     # Add the tracks associated with this album to the playlist PLAYLIST
     #
     def addToPlaylist( self, playlist ):
-        for track in self.getTracks():
-            track.addToPlaylist( playlist )
+        playlist.addTracks( self.getPlaylistTracks() )
 
     def __repr__( self ): return 'Album "%s"' % ( self.getName(), )
 
@@ -174,16 +201,26 @@ class Album( OrderedItem ):
 class Playlist( OrderedItem ):
 
     #
-    # Constructor. PLAYLISTOBJECT is the iTunes playlist AppleScript object to
-    # mirror, NAME is the playlist name, and CANMANIPULATE is a boolean flag
-    # indicating whether the user may manipulate the contents of the playlist
-    # (including deleting it)
+    # Maximum number of tracks to add to the iTunes playlist with one command
     #
-    def __init__( self, playlistObject, name, canManipulate ):
+    kBatchSize = 50
+
+    #
+    # Constructor. PLAYER is the PlayerBackend object that plays the playlist,
+    # PLAYLISTOBJECT is the player's object for the playlist to mirror, NAME
+    # is the playlist name, and CANMANIPULATE is a boolean flag indicating
+    # whether the user may manipulate the contents of the playlist (including
+    # deleting it)
+    #
+    def __init__( self, player, playlistObject, name, canManipulate ):
         OrderedItem.__init__( self, name )
+        self.player = player
         self.playlistObject = playlistObject
         self.canManipulate = canManipulate
         self.tracks = []
+        self.positions = {}     # Mapping of track IDs to their first index
+        self.fillCount = 0      # Tracks queued for adding to iTunes
+        self.fillDone = 0       # Tracks in fillCount that iTunes now has
 
     #
     # Obtain the list of Track objects associated with this playlist
@@ -200,70 +237,173 @@ class Playlist( OrderedItem ):
     #
     def getTrack( self, index ): return self.tracks[ index ]
 
+    #
+    # Obtain the index of the first appearance of TRACK in this playlist, or
+    # -1 if it is not there.
+    #
     def getTrackIndex( self, track ):
-        for index in range( len( self.tracks ) ):
-            if self.tracks[ index ].getID() == track.getID():
-                return index
-        return -1
+        return self.positions.get( track.getID(), -1 )
+
+    #
+    # Install TRACKS, a list of Track objects, as the contents of this
+    # playlist. Does not change the iTunes playlist.
+    #
+    def setTracks( self, tracks ):
+        self.tracks = tracks
+        positions = {}
+        for index in xrange( len( tracks ) - 1, -1, -1 ):
+            positions[ tracks[ index ].getID() ] = index
+        self.positions = positions
+
+    #
+    # Obtain a Playlist object like this one but holding TRACKS, a list of
+    # Track objects, and with the CANMANIPULATE flag. Returns this object if
+    # nothing would differ, so that library snapshots holding it keep what
+    # they had. Progress of earlier fills does not carry over to a copy.
+    #
+    def withTracks( self, tracks, canManipulate ):
+        if canManipulate == self.canManipulate and \
+                len( tracks ) == len( self.tracks ):
+            for index in xrange( len( tracks ) ):
+                if tracks[ index ] is not self.tracks[ index ]:
+                    break
+            else:
+                return self
+        playlist = copy.copy( self )
+        playlist.canManipulate = canManipulate
+        playlist.setTracks( tracks )
+        playlist.fillCount = 0
+        playlist.fillDone = 0
+        return playlist
 
     #
     # Determine if the user can manipulate this playlist
     #
     def getCanManipulate( self ): return self.canManipulate
 
+    #
+    # Changes to the contents of a playlist show up in our track list right
+    # away. The matching iTunes commands go through the command queue, in the
+    # same order, so the iTunes playlist catches up with ours. If a command
+    # fails, the two differ until the next library load.
+    #
     #
     # Clear the tracks from this playlist
     #
     def clear( self ):
         if not self.getCanManipulate():
             return
+        self.setTracks( [] )
+        RunCommand( self.deleteTracks )
 
-        #
-        # Attempt to keep our track list and iTunes in sync.
-        #
+    #
+    # Remove all tracks from the iTunes playlist. Runs in the command queue
+    # worker thread.
+    #
+    def deleteTracks( self ):
         try:
-            self.playlistObject.tracks.delete()
-            self.tracks = []
-        except appscript.reference.CommandError:
+            self.player.clearPlaylist( self.playlistObject )
+        except PlayerError:
             print( '*** failed to clear playlist', self.getName() )
-            pass
 
     #
     # Add a Track object to this playlist.
     #
     def addTrack( self, track ):
+        self.addTracks( [ track ] )
 
-        #
-        # Attempt to keep our track list and iTunes in sync.
-        #
+    #
+    # Add the Track objects in TRACKS to the end of this playlist. They go to
+    # iTunes kBatchSize tracks per command.
+    #
+    def addTracks( self, tracks ):
+        if not tracks:
+            return
+        positions = self.positions
+        offset = len( self.tracks )
+        for index in xrange( len( tracks ) ):
+            positions.setdefault( tracks[ index ].getID(), offset + index )
+        self.tracks.extend( tracks )
+
+        self.fillCount += len( tracks )
+        for start in xrange( 0, len( tracks ), self.kBatchSize ):
+            batch = tracks[ start : start + self.kBatchSize ]
+            done = lambda count = len( batch ): self.tracksAdded( count )
+            RunCommand( self.duplicateTracks, ( batch, ), done )
+
+    #
+    # Add TRACKS to the iTunes playlist. Runs in the command queue worker
+    # thread.
+    #
+    def duplicateTracks( self, tracks ):
         try:
-            GetLibrary().tracks[ 
-                appscript.its.persistent_ID == track.getID() ].duplicate(
-                to = self.playlistObject )
-            self.tracks.append( track )
-        except appscript.reference.CommandError:
-            print( '*** failed to add track', track.getName(), 'to playlist',
+            self.player.addTracks( self.playlistObject, tracks )
+        except PlayerError:
+            print( '*** failed to add', len( tracks ), 'tracks to playlist',
                    self.getName() )
-            pass
 
+    #
+    # Note that the command adding COUNT tracks to iTunes has finished.
+    #
+    def tracksAdded( self, count ):
+        self.fillDone += count
+        if self.fillDone >= self.fillCount:
+            self.fillCount = 0
+            self.fillDone = 0
+
+    #
+    # Obtain the fraction (0.0-1.0) of the tracks queued for adding to iTunes
+    # that it now has, or None if there are none waiting.
+    #
+    def getFillProgress( self ):
+        if self.fillCount == 0:
+            return None
+        return float( self.fillDone ) / self.fillCount
+
+    #
+    # Remove the track at TRACKINDEX from this playlist.
+    #
     def removeTrack( self, trackIndex ):
+        trackId = self.tracks[ trackIndex ].getID()
+        del self.tracks[ trackIndex ]
+        RunCommand( self.deleteTrack, ( trackIndex, ) )
+
+        #
+        # Only the tracks that followed the removed one have moved. Each one
+        # whose first appearance moved, or that was the removed track, has
+        # its index set by its first appearance from TRACKINDEX on.
+        #
+        positions = self.positions
+        if positions.get( trackId ) == trackIndex:
+            del positions[ trackId ]
+        tracks = self.tracks
+        for index in xrange( trackIndex, len( tracks ) ):
+            trackId = tracks[ index ].getID()
+            position = positions.get( trackId )
+            if position is None or position == index + 1:
+                positions[ trackId ] = index
+
+    #
+    # Remove the track at TRACKINDEX from the iTunes playlist. Runs in the
+    # command queue worker thread.
+    #
+    def deleteTrack( self, trackIndex ):
         try:
-            self.playlistObject.tracks[ trackIndex + 1 ].delete()
-            del self.tracks[ trackIndex ]
-        except appscript.reference.CommandError:
+            self.player.removeTrack( self.playlistObject, trackIndex )
+        except PlayerError:
             print( '*** failed to delete track', trackIndex )
-            pass
 
     #
-    # Ask iTunes to begin playing this playlist
+    # Ask iTunes to begin playing this playlist. Waits for iTunes to do so;
+    # the server loop uses iTunesXML.playPlaylist() instead.
     #
     def play( self, trackIndex = 0 ):
         if trackIndex >= self.getTrackCount():
             print( '*** invalid trackIndex:', trackIndex )
         else:
             try:
-                self.playlistObject.tracks[ trackIndex + 1 ].play()
-            except appscript.reference.CommandError:
+                self.player.playPlaylist( self.playlistObject, trackIndex )
+            except PlayerError:
                 print( '*** failed to start playing playlist', self.getName(),
                        'at track', trackIndex )
             pass
@@ -272,25 +412,25 @@ class Playlist( OrderedItem ):
     # Get the current shuffle setting for this playlist
     #
     def getShuffle( self ): 
-        return self.playlistObject.shuffle.get()
+        return self.player.getShuffle( self.playlistObject )
 
     #
     # Change the shuffle setting for this playlist
     #
     def setShuffle( self, value ): 
-        self.playlistObject.shuffle.set( value )
+        self.player.setShuffle( self.playlistObject, value )
 
     #
     # Get the current repeat mode for this playlist
     #
     def getRepeat( self ): 
-        return self.playlistObject.song_repeat.get()
+        return self.player.getRepeat( self.playlistObject )
 
     #
     # Change the repeat mode for this playlist
     #
     def setRepeat( self, value ): 
-        self.playlistObject.song_repeat.set( value )
+        self.player.setRepeat( self.playlistObject, value )
 
     def __repr__( self ): return 'Playlist "%s"' % ( self.getName(), )
 
@@ -302,27 +442,44 @@ class Playlist( OrderedItem ):
 class Track( object ):
 
     #
-    # Constructor. TRACK is either a Python dictionary containing the
-    # attributes found in the XML file for this track, or it is an AppleScript
-    # iTunes track object.
+    # There may be a great many of these, so do without a per-instance
+    # dictionary.
     #
-    def __init__( self, track ):
-        if isinstance( track, dict ):
-            self.name = OrderedItem( track.get( 'Name', '' ) )
-            self.id = str( track.get( 'Persistent ID' ) )
-            self.trackId = track.get( 'Track ID' )
-            self.index = int( track.get( 'Track Number', '-1' ) )
-            self.artistName = track.get( 'Artist', '' )
-            self.albumName = track.get( 'Album', '' )
-            self.duration = int( track.get( 'Total Time', 0 ) ) / 1000
-        else:
-            self.name = OrderedItem( track.name() )
-            self.id = track.persistent_ID()
-            self.trackId = None # !!!
-            self.index = track.track_number()
-            self.artistName = track.artist()
-            self.albumName = track.album()
-            self.duration = track.duration()
+    __slots__ = ( 'name', 'id', 'trackId', 'index', 'artistName', 'albumName',
+                  'duration', 'album', 'rating', 'albumRating' )
+
+    #
+    # Constructor. TRACK is a Python dictionary containing the attributes
+    # found in the XML file for this track (a PlayerBackend builds one for the
+    # track it is playing). If given, STRINGS is a dictionary used to share one
+    # copy of the artist and album names among all of the tracks that have
+    # them.
+    #
+    def __init__( self, track, strings = None ):
+        artistName = track.get( 'Artist', '' )
+        albumName = track.get( 'Album', '' )
+        if strings is not None:
+            artistName = strings.setdefault( artistName, artistName )
+            albumName = strings.setdefault( albumName, albumName )
+        self.name = OrderedItem( track.get( 'Name', '' ) )
+        self.id = str( track.get( 'Persistent ID' ) )
+        self.trackId = track.get( 'Track ID' )
+        self.index = int( track.get( 'Track Number', '-1' ) )
+        self.artistName = artistName
+        self.albumName = albumName
+        self.duration = int( track.get( 'Total Time', 0 ) ) / 1000
+        self.album = None
+
+        #
+        # A rating that iTunes computed from other ratings counts as 0, since
+        # the user did not give it.
+        #
+        self.rating = 0
+        if not track.get( 'Rating Computed', False ):
+            self.rating = int( track.get( 'Rating', 0 ) )
+        self.albumRating = 0
+        if not track.get( 'Album Rating Computed', False ):
+            self.albumRating = int( track.get( 'Album Rating', 0 ) )
 
     def getName( self ): return self.name.getName()
 
@@ -358,6 +515,31 @@ class Track( object ):
     #
     def getDuration( self ): return self.duration
 
+    #
+    # Obtain the rating (0-100) that the user gave this track
+    #
+    def getRating( self ): return self.rating
+
+    #
+    # Change the rating of this track. Does not change the iTunes track.
+    #
+    def setRating( self, rating ): self.rating = rating
+
+    #
+    # Obtain the rating (0-100) that the user gave the album of this track
+    #
+    def getAlbumRating( self ): return self.albumRating
+
+    #
+    # Change the album rating of this track. Does not change the iTunes track.
+    #
+    def setAlbumRating( self, rating ): self.albumRating = rating
+
+    #
+    # Obtain the list of Track objects to play for this track
+    #
+    def getPlaylistTracks( self ): return [ self ]
+
     #
     # Add the track to the PLAYLIST playlist
     #
@@ -376,6 +558,40 @@ class Track( object ):
     def __ge__( self, other ): return self.index >= other.index
     def __hash__( self ): return hash( self.index )
 
+    #
+    # The key value of the track name, which lets a Track object stand in for
+    # an OrderedItem object in searches.
+    #
+    key = property( lambda self: self.name.key )
+
+    #
+    # Key function for sorting a list of Track objects by their track index.
+    #
+    sortKey = staticmethod( attrgetter( 'index' ) )
+
+    #
+    # Key function for sorting a list of Track objects by their name.
+    #
+    nameKey = staticmethod( lambda track: track.name.key )
+
+    #
+    # Pickle support for the library snapshot (see iTunesXML.saveSnapshot()).
+    # A tuple of the attribute values, with the name inline, is much less to
+    # write and read back than the default mapping of slot names to values
+    # plus a separate OrderedItem object.
+    #
+    def __getstate__( self ):
+        return ( self.name.name, self.name.key, self.id, self.trackId,
+                 self.index, self.artistName, self.albumName, self.duration,
+                 self.album, self.rating, self.albumRating )
+
+    def __setstate__( self, state ):
+        name = OrderedItem.__new__( OrderedItem )
+        name.name, name.key, self.id, self.trackId, self.index, \
+            self.artistName, self.albumName, self.duration, self.album, \
+            self.rating, self.albumRating = state
+        self.name = name
+
     def __repr__( self ): return 'Track "%d - %s"' % ( self.index, 
                                                        self.getName(), )
 
@@ -384,7 +600,14 @@ class Track( object ):
 #
 class XMLParser( object ):
 
-    def __init__( self ):
+    #
+    # Constructor. If given, TRACKHANDLER is a callable that will receive each
+    # track <dict> found under the 'Tracks' key as soon as it is complete. Such
+    # track dictionaries are not kept in the parsed tree, so the memory used
+    # while parsing is bounded by the size of one track instead of the whole
+    # library.
+    #
+    def __init__( self, trackHandler = None ):
 
         #
         # Install XML parser hooks
@@ -398,10 +621,17 @@ class XMLParser( object ):
         # Initialize XML parser containers
         #
         self.stack = None
+        self.root = None
         self.container = None
         self.key = None
         self.value = ''
 
+        #
+        # The 'Tracks' container and the streaming hook for its contents.
+        #
+        self.tracks = None
+        self.trackHandler = trackHandler
+
     #
     # Parse the given file.
     #
@@ -420,6 +650,19 @@ class XMLParser( object ):
             pass
         return ok
 
+    #
+    # Parse the XML text in DATA.
+    #
+    def parseString( self, data ):
+        ok = False
+        try:
+            self.parser.Parse( data, True )
+            if self.stack is None:
+                ok = True
+        except:
+            pass
+        return ok
+
     #
     # XML parsing hook invoked at the start of an element.
     #
@@ -441,8 +684,18 @@ class XMLParser( object ):
         # list or add to a dictionary with the last key value.
         #
         if self.stack is None:
+            self.root = container
             self.container = container
+        elif self.container is self.tracks and self.trackHandler:
+
+            #
+            # Streaming a track record. Do not link it into the 'Tracks'
+            # container; endElement() will hand it to the track handler.
+            #
+            self.key = None
         elif self.key is not None:
+            if self.key == 'Tracks' and self.container is self.root:
+                self.tracks = container
             self.container[ self.key ] = container
             self.key = None
         else:
@@ -478,8 +731,16 @@ class XMLParser( object ):
             #
             # Container closed. Pop stack to get back previous container
             #
+            closed = self.container
             self.container, self.stack = self.stack
             self.value = ''
+
+            #
+            # If the closed container was a track record, let the track
+            # handler have it.
+            #
+            if self.container is self.tracks and self.trackHandler:
+                self.trackHandler( closed )
             return
 
         #
@@ -507,379 +768,1624 @@ class XMLParser( object ):
     def getPlaylists( self ): return self.container[ 'Playlists' ]
 
 #
-# Collection of containers of iTune artists, albums, playlists, etc. Maintains
-# an AppleScript connection with an iTunes server
-# XML element object that describes the track.
+# Remove ITEM from the list CONTAINER. Unlike list.remove(), this looks for the
+# object itself and not just one that compares equal to it.
 #
-class iTunesXML( object ):
+def removeItem( container, item ):
+    for index in range( len( container ) ):
+        if container[ index ] is item:
+            del container[ index ]
+            return
+
+#
+# Replace ITEM in the list CONTAINER with NEW, looking for the object itself as
+# removeItem() does.
+#
+def replaceItem( container, item, new ):
+    for index in range( len( container ) ):
+        if container[ index ] is item:
+            container[ index ] = new
+            return
+
+#
+# Locate ITEM in the sorted list CONTAINER, using binary search. Returns its
+# index, or -1 if it is not there.
+#
+def findSortedItem( container, item ):
+    index = bisect_left( container, item )
+    while index < len( container ) and container[ index ] == item:
+        if container[ index ] is item:
+            return index
+        index += 1
+    return -1
+
+#
+# Remove ITEM from the sorted list CONTAINER, using binary search to locate
+# it.
+#
+def removeSortedItem( container, item ):
+    index = findSortedItem( container, item )
+    if index != -1:
+        del container[ index ]
+
+#
+# Builder of the artist, album, and genre containers from the track records
+# found in the iTunes XML file. Meant to be used as the track handler of an
+# XMLParser so that each track record becomes model objects as soon as it is
+# parsed, after which the record may be discarded.
+#
+# Once a LibrarySnapshot is made from the builder (see freeze()), the snapshot
+# shares its containers and model objects, and they must not change. Changes
+# made after that go to copies: a container is copied the first time it must
+# change, as is a model object along with the containers that hold it. The
+# rest stays shared. A copied Album or Artist may be the target of back
+# references (Track.album, Album.artist and Album.genre) from objects that did
+# not need copying, so the builder always finds the current object through
+# its mappings.
+#
+class LibraryBuilder( object ):
 
     #
-    # The minimum amount of time that must elapse before we will reload the
-    # iTunes XML file.
-    #
-    kLibraryReloadInterval = 60 * 5 # 5 minutes
-    
-    #
-    # The name of the playlist we use for playback
+    # The track attributes that we use. A change to any of them in the XML
+    # file will cause the track to be rebuilt on the next reload.
     #
-    kOurPlaylistName = 'MBJB'
+    kSignatureKeys = ( 'Track Type', 'Kind', 'Album Artist', 'Compilation',
+                       'Artist', 'Album', 'Genre', 'Name', 'Track Number',
+                       'Total Time', 'Rating', 'Rating Computed',
+                       'Album Rating', 'Album Rating Computed' )
 
     #
-    # Transitions from one repeat mode to the next.
+    # The containers that a LibrarySnapshot shares with us.
     #
-    kRepeatTransitions = { appscript.k.off: appscript.k.all,
-                           appscript.k.all: appscript.k.one,
-                           appscript.k.one: appscript.k.off }
+    kSharedContainers = ( 'tracks', 'artistMap', 'artistList', 'albumList',
+                          'genreMap', 'genreList', 'albumIndex' )
+
+    def __init__( self ):
+        self.finished = False   # True once the containers have been sorted
+        self.signatures = {}    # Mapping of persistent IDs to record hashes
+        self.tracks = {}        # Mapping of track IDs to Track objects
+        self.artistMap = {}     # Mapping of names to Artist objects
+        self.artistList = []    # List of all Artist objects
+        self.albumList = []     # List of all Album objects
+        self.genreMap = {}      # Mapping of genre names to Genre objects
+        self.genreList = []     # List of all Genre objects
+        self.albumIndex = {}    # Mapping of artist and album keys to Albums
+        self.playlists = []     # Name, access, and tracks of each playlist
+        self.strings = {}       # Artist and album names shared by the tracks
+        self.shared = set()     # Names of the containers a snapshot shares
+        self.owned = None       # Model objects made since the last snapshot
 
     #
-    # Constructor.
+    # Process one track record, where TRACK is the Python dictionary holding
+    # the attributes found in the XML file for the track.
     #
-    def __init__( self ):
+    def addTrack( self, track ):
 
         #
-        # Get the location of the iTunes XML file. Apparently we can get it
-        # from the MacOS X defaults database. Look ma! No error checking!
+        # Remember what the record looked like, even if we skip it below, so
+        # that a reload can tell when it has changed.
         #
-        pipe = subprocess.Popen( ['defaults', 'read', 'com.apple.iapps',
-                                  'iTunesRecentDatabases' ], 
-                                 stdout = subprocess.PIPE )
-        content = pipe.communicate()[ 0 ]
-        lines = content.split()
-        location = eval( lines[ 1 ] )
-        print( 'location:', location )
+        id = str( track.get( 'Persistent ID' ) )
+        self.signatures[ id ] = self.makeSignature( track )
 
         #
-        # Convert the (file:) URL from above into a local file path. NOTE:
-        # strip off any 'file://localhost/' since it appears to hang when we do
-        # not have a network connection. *FIXME*
+        # For now, we only work with audio files.
         #
-        if location.find( 'file://localhost/' ) == 0:
-            location = location[ 16 : ]
+        trackType = track.get( 'Track Type', '' ).strip()
+        if trackType != 'File':
+            return
 
-        self.xmlFilePath, headers = urllib.urlretrieve( location )
-        self.backgroundLoader = None
-        self.loadedTimeStamp = None
+        kind = track.get( 'Kind', '' ).strip()
+        if not kind.endswith( 'audio file' ):
+            return
 
         #
-        # Initialize iTunes containers
+        # By default we use the 'album artist' tag instead of 'artist' so that
+        # collections of various artists remain together
         #
-        self.artistMap = {}     # Mapping of names to Artist objects
-        self.artistList = []    # List of all Artist objects
-        self.albumList = []     # List of all Album objects
-        self.genreMap = {}      # Mapping of genre names to Genre objects
-        self.genreList = []     # List of all Genre objects
-        self.playlistNames = [] # Names of the playlists found in iTunes
+        artistName = track.get( 'Album Artist', '' ).strip()
+        if len( artistName ) == 0:
+            if track.get( 'Compilation', 0 ):
+                artistName = 'Various Artists'
+            else:
+                artistName = track.get( 'Artist', '' ).strip()
+            if len( artistName ) == 0:
+                print( 'empty artist for', track )
+                return
 
-    #
-    # See if we should reload the iTunes XML file. If so, we do it in a
-    # separate thread.
-    #
-    def reloadCheck( self ):
+        artistName = OrderedItem( artistName )
 
         #
-        # See if the modified timestamp of the XML file is later than the time
-        # stamp of the last load. If not, don't continue.
+        # Get the album name
         #
-        when = datetime.fromtimestamp( stat( self.xmlFilePath )[ ST_MTIME ] )
-        if when <= self.loadedTimeStamp:
+        albumName = track.get( 'Album', '' ).strip()
+        if len( albumName ) == 0:
             return
 
         #
-        # Only reload if kLibraryReloadInterval seconds has passed since the
-        # last reload.
+        # Locate an existing Artist object for the artist name. Create new one
+        # if necessary and install.
         #
-        delta = datetime.now() - self.loadedTimeStamp
-        if delta.seconds < self.kLibraryReloadInterval:
-            return
+        artist = self.makeArtist( artistName )
 
         #
-        # See if we have a background thread running. If so, don't continue.
+        # Locate an existing album for the album name among those associated
+        # with the artist.
         #
-        if self.backgroundLoader:
-            if self.backgroundLoader.isAlive():
-                return
+        albumName = OrderedItem( albumName )
+        album = self.albumIndex.get( ( artist.key, albumName.key ) )
+
+        #
+        # If not found, create a new one and install. Otherwise, make sure we
+        # may change it.
+        #
+        if album is None:
+            artist = self.ownItem( artist, 'artistMap', 'artistList' )
+            album = self.adopt( Album( artist, albumName ) )
+            self.linkAlbum( artist, album )
+            self.addItem( 'albumList', album )
 
             #
-            # Reap the thread.
+            # Update the genre names
             #
-            self.backgroundLoader.join()
+            genreName = track.get( 'Genre', '' ).strip()
+            if len( genreName ) > 0:
+                genre = self.makeGenre( OrderedItem( genreName ) )
+                genre = self.ownItem( genre, 'genreMap', 'genreList' )
+                genre.addAlbum( album )
+                album.genre = genre
+        else:
+            album = self.ownAlbum( album )
 
         #
-        # Create a background loader thread and start it.
+        # If the 'Artist' field is different than 'Album Artist', link the
+        # album to the an entry for the 'Artist'.
+        #
+        aliasName = track.get( 'Artist', '' ).strip()
+        if len( aliasName ) > 0 and aliasName != artistName.getName():
+            alias = self.makeArtist( OrderedItem( aliasName ) )
+            if ( alias.key, albumName.key ) not in self.albumIndex:
+                self.linkAlbum( alias, album )
+
         #
-        self.backgroundLoader = threading.Thread( target = self.load )
-        self.backgroundLoader.start()
+        # Add the track to the album. Place it under its persistent ID as well
+        # as its track ID. The former is more stable, while the latter is still
+        # used for playlists.
+        #
+        track = Track( track, self.strings )
+        tracks = self.own( 'tracks' )
+        tracks[ track.getID() ] = track
+        tracks[ track.getTrackId() ] = track
+        track.album = album
+        album.addTrack( track )
+
+    #
+    # Obtain a value that will change if any of the attributes we use from the
+    # XML record TRACK change. NOTE: the hash of None differs from one run to
+    # the next, so missing attributes must not show up as None.
+    #
+    def makeSignature( self, track ):
+        return hash( tuple( [ track.get( key, '' ) for key in
+                              self.kSignatureKeys ] ) )
+
+    #
+    # Obtain the container held under the attribute NAME, ready to change.
+    # If a snapshot shares it, it is replaced by a copy first.
+    #
+    def own( self, name ):
+        container = getattr( self, name )
+        if name in self.shared:
+            container = copy.copy( container )
+            setattr( self, name, container )
+            self.shared.remove( name )
+        return container
+
+    #
+    # Note that ITEM, a new model object, is not shared by any snapshot, so it
+    # may change in place. Returns ITEM.
+    #
+    def adopt( self, item ):
+        if self.owned is not None:
+            self.owned[ id( item ) ] = item
+        return item
+
+    #
+    # Obtain ITEM, an Artist or Genre object held by the mapping and the
+    # sorted list under the attributes MAPNAME and LISTNAME, ready to change.
+    # If a snapshot shares it, it is replaced by a copy first.
+    #
+    def ownItem( self, item, mapName, listName ):
+        if self.owned is None or id( item ) in self.owned:
+            return item
+        clone = self.adopt( copy.copy( item ) )
+        clone.albums = list( item.albums )
+        mapping = self.own( mapName )
+        del mapping[ item ]
+        mapping[ clone ] = clone
+        container = self.own( listName )
+        container[ findSortedItem( container, item ) ] = clone
+        return clone
+
+    #
+    # Obtain ALBUM, an Album object of the library, ready to change. If a
+    # snapshot shares it, it is replaced by a copy first, everywhere that it
+    # appears.
+    #
+    def ownAlbum( self, album ):
+        if self.owned is None or id( album ) in self.owned:
+            return album
+        clone = self.adopt( copy.copy( album ) )
+        clone.tracks = list( album.tracks )
+        albumList = self.own( 'albumList' )
+        albumList[ findSortedItem( albumList, album ) ] = clone
+
+        #
+        # Besides its own artist, an album is linked to the ones named by the
+        # 'Artist' field of its tracks.
+        #
+        names = [ album.artist ]
+        for track in album.tracks:
+            name = track.getArtistName().strip()
+            if len( name ) > 0:
+                names.append( OrderedItem( name ) )
+        for name in names:
+            key = ( name.key, album.key )
+            if self.albumIndex.get( key ) is album:
+                self.own( 'albumIndex' )[ key ] = clone
+                artist = self.ownItem( self.artistMap[ name ], 'artistMap',
+                                       'artistList' )
+                replaceItem( artist.albums, album, clone )
+        clone.artist = self.artistMap[ album.artist ]
+
+        if album.genre is not None:
+            genre = self.ownItem( self.genreMap[ album.genre ], 'genreMap',
+                                  'genreList' )
+            replaceItem( genre.albums, album, clone )
+            clone.genre = genre
+        return clone
+
+    #
+    # Locate the Artist object for NAME, an OrderedItem. Creates and installs
+    # a new one if necessary.
+    #
+    def makeArtist( self, name ):
+        artist = self.artistMap.get( name )
+        if artist is None:
+            artist = self.adopt( Artist( name ) )
+            self.own( 'artistMap' )[ name ] = artist
+            self.addItem( 'artistList', artist )
+        return artist
 
     #
-    # Load the iTunes XML file. NOTE: this may execute in a separate thread, so
-    # we keep all collections local until the very end, where we install them
-    # as the new values.
+    # Locate the Genre object for NAME, an OrderedItem. Creates and installs a
+    # new one if necessary.
     #
-    def load( self ):
+    def makeGenre( self, name ):
+        genre = self.genreMap.get( name )
+        if genre is None:
+            genre = self.adopt( Genre( name ) )
+            self.own( 'genreMap' )[ name ] = genre
+            self.addItem( 'genreList', genre )
+        return genre
 
-        print( '... loading XML file', self.xmlFilePath )
-        startTime = datetime.now()
+    #
+    # Associate the Album object ALBUM with the Artist object ARTIST.
+    #
+    def linkAlbum( self, artist, album ):
+        artist = self.ownItem( artist, 'artistMap', 'artistList' )
+        artist.addAlbum( album )
+        self.own( 'albumIndex' )[ ( artist.key, album.key ) ] = album
 
-        #
-        # Create an XML parser and parse the file. Don't continue if the
-        # parsing failed.
-        #
-        parser = XMLParser()
-        if not parser.parseFile(  self.xmlFilePath ):
-            print( '*** failed to parse XML file ***' )
-            return
+    #
+    # Undo the association made by linkAlbum(). ARTIST may be an earlier copy
+    # of the Artist object. Returns the current one.
+    #
+    def unlinkAlbum( self, artist, album ):
+        artist = self.ownItem( self.artistMap[ artist ], 'artistMap',
+                               'artistList' )
+        removeItem( artist.albums, album )
+        key = ( artist.key, album.key )
+        if self.albumIndex.get( key ) is album:
+            del self.own( 'albumIndex' )[ key ]
+        return artist
 
-        rawTracks = parser.getTracks()
+    #
+    # Add ITEM to the list held under the attribute NAME. Once the containers
+    # are sorted, keep them that way.
+    #
+    def addItem( self, name, item ):
+        container = self.own( name )
+        if self.finished:
+            insort( container, item )
+        else:
+            container.append( item )
 
-        tracks = {}
-        artistMap = {}
-        artistList = []
-        albumList = []
-        genreMap = {}
-        genreList = []
+    #
+    # Forget about the track record with the persistent ID ID, removing the
+    # Track object made from it if there is one.
+    #
+    def removeRecord( self, id ):
+        del self.signatures[ id ]
+        track = self.tracks.get( id )
+        if track is not None:
+            self.removeTrack( track )
+
+    #
+    # Remove the Track object TRACK from the library. Removes its album, artist
+    # and genre as well if they no longer hold anything.
+    #
+    def removeTrack( self, track ):
+        tracks = self.own( 'tracks' )
+        del tracks[ track.getID() ]
+        if tracks.get( track.getTrackId() ) is track:
+            del tracks[ track.getTrackId() ]
 
         #
-        # Visit all of the tracks found in the 'Tracks' <dict>
+        # An album is always found under its own artist, so this locates the
+        # current one even if TRACK refers to an earlier copy.
         #
-        for track in rawTracks.values():
-
-            #
-            # For now, we only work with audio files.
-            #
-            trackType = track.get( 'Track Type', '' ).strip()
-            if trackType != 'File':
-                continue
-
-            kind = track.get( 'Kind', '' ).strip()
-            if not kind.endswith( 'audio file' ):
-                continue
+        album = track.album
+        album = self.albumIndex[ ( album.artist.key, album.key ) ]
+        album = self.ownAlbum( album )
+        removeItem( album.tracks, track )
 
-            #
-            # By default we use the 'album artist' tag instead of 'artist' so
-            # that collections of various artists remain together
-            #
-            artistName = track.get( 'Album Artist', '' ).strip()
-            if len( artistName ) == 0:
-                if track.get( 'Compilation', 0 ):
-                    artistName = 'Various Artists'
+        #
+        # If the track's 'Artist' entry was linked to the album, unlink it
+        # unless another track of the album still refers to it.
+        #
+        aliasName = track.getArtistName().strip()
+        if len( aliasName ) > 0:
+            alias = self.artistMap.get( OrderedItem( aliasName ) )
+            if alias is not None and alias != album.artist:
+                for each in album.tracks:
+                    name = each.getArtistName().strip()
+                    if len( name ) > 0 and alias == OrderedItem( name ):
+                        break
                 else:
-                    artistName = track.get( 'Artist', '' ).strip()
-                if len( artistName ) == 0:
-                    print( 'empty artist for', track )
-                    continue
-
-            artistName = OrderedItem( artistName )
-
-            #
-            # Get the album name
-            #
-            albumName = track.get( 'Album', '' ).strip()
-            if len( albumName ) == 0:
-                continue
-
-            #
-            # Locate an existing Artist object for the artist name. Create new
-            # one if necessary and install.
-            #
-            artist = artistMap.get( artistName )
-            if artist is None:
-                artist = Artist( artistName )
-                artistMap[ artistName ] = artist
-                artistList.append( artist )
+                    if self.albumIndex.get( ( alias.key, album.key ) ) \
+                            is album:
+                        alias = self.unlinkAlbum( alias, album )
+                        self.removeArtistIfEmpty( alias )
 
-            #
-            # Locate an existing album for the album name. Look first inside
-            # the artist. NOTE: do not use the getter methods to fetch albums,
-            # since we do not want to cause a sort on the held albums yet.
-            #
-            albumName = OrderedItem( albumName )
-            album = None
-            if len( artist.albums ):
-                for index in range( artist.getAlbumCount() - 1, -1, -1 ):
-                    album = artist.albums[ index ]
-                    if album == albumName:
-                        break
-                if album != albumName:
-                    album = None
+        if len( album.tracks ) == 0:
+            self.removeAlbum( album )
 
-            #
-            # If not found, create a new one and install.
-            #
-            if album is None:
-                album = Album( artist, albumName )
-                artist.addAlbum( album )
-                albumList.append( album )
+    #
+    # Remove the empty Album object ALBUM from the library.
+    #
+    def removeAlbum( self, album ):
+        removeSortedItem( self.own( 'albumList' ), album )
+        artist = self.unlinkAlbum( album.artist, album )
+        self.removeArtistIfEmpty( artist )
 
-                #
-                # Update the genre names
-                #
-                genreName = track.get( 'Genre', '' ).strip()
-                if len( genreName ) > 0:
-                    genreName = OrderedItem( genreName )
-                    genre = genreMap.get( genreName )
-                    if genre is None:
-                        genre = Genre( genreName )
-                        genreMap[ genreName ] = genre
-                        genreList.append( genre )
-                    genre.addAlbum( album )
+        if album.genre is not None:
+            genre = self.ownItem( self.genreMap[ album.genre ], 'genreMap',
+                                  'genreList' )
+            removeItem( genre.albums, album )
+            if len( genre.albums ) == 0:
+                del self.own( 'genreMap' )[ genre ]
+                removeSortedItem( self.own( 'genreList' ), genre )
 
-            #
-            # If the 'Artist' field is different than 'Album Artist', link the
-            # album to the an entry for the 'Artist'.
-            #
-            aliasName = track.get( 'Artist', '' ).strip()
-            if len( aliasName ) > 0 and aliasName != artistName.getName():
-                aliasName = OrderedItem( aliasName )
-                alias = artistMap.get( aliasName )
-                if alias is None:
-                    alias = Artist( aliasName )
-                    artistMap[ aliasName ] = alias
-                    artistList.append( alias )
-                found = None
+    #
+    # Remove the Artist object ARTIST from the library if it no longer has any
+    # albums.
+    #
+    def removeArtistIfEmpty( self, artist ):
+        if len( artist.albums ) == 0:
+            del self.own( 'artistMap' )[ artist ]
+            removeSortedItem( self.own( 'artistList' ), artist )
 
-                #
-                # NOTE: do not use the getter methods to fetch albums, since we
-                # do not want to cause a sort on the held albums yet.
-                #
-                for index in range( alias.getAlbumCount() ):
-                    tmp = alias.albums[ index ]
-                    if tmp == albumName:
-                        found = tmp
-                        break
-                if found is None:
-                    alias.addAlbum( album )
+    #
+    # Bring the library up to date with the changes found by the LibraryDiffer
+    # object DIFFER. Only the tracks that were removed or changed are visited.
+    # Returns True if the library is any different afterwards.
+    #
+    def applyChanges( self, differ ):
+        before = self.getPlaylistRecords()
+        for id in differ.removed:
+            self.removeRecord( id )
 
-            #
-            # Add the track to the album. Place it under its persistent ID as
-            # well as its track ID. The former is more stable, while the latter
-            # is still used for playlists.
-            #
-            track = Track( track )
-            tracks[ track.getID() ] = track
-            tracks[ track.getTrackId() ] = track
-            album.addTrack( track )
+        for track in differ.changed:
+            id = str( track.get( 'Persistent ID' ) )
+            if id in self.signatures:
+                self.removeRecord( id )
+            self.addTrack( track )
 
         #
-        # Done processing the tracks. Sort the artists and albums by their
-        # keys.
+        # Playlists are small compared to the set of tracks, so just rebuild
+        # them. NOTE: track IDs may change between versions of the XML file,
+        # so resolve them with the mapping from the new version.
         #
-        artistList.sort()
-        albumList.sort()
-        genreList.sort()
+        self.playlists = []
+        for each in differ.playlists:
+            self.addPlaylist( each, differ.trackIds )
 
-        #
-        # Validate the load.
-        #
-        if 0:
-            library = GetLibrary()
-            print( '...validating loaded track IDs' )
-            for artist in artistList:
-                for album in artist.getAlbums():
-                    for track in album.getTracks():
-                        if library.tracks[ appscript.its.persistent_ID ==
-                                           track.getID() ].name()[0] != \
-                                           track.getName():
-                            print( '*** track ID mismatch', track.getID(),
-                                   track.getName() )
+        return bool( differ.removed or differ.changed or
+                     self.getPlaylistRecords() != before )
 
-        if len( artistList ) < len( self.artistList ) / 2:
-            print( '*** ignoring sudden drop in artist count ***' )
-            return
+    #
+    # Obtain a comparable description of our playlists: the name, the
+    # manipulation flag and the identities of the Track objects of each one.
+    #
+    def getPlaylistRecords( self ):
+        return [ ( name, canManipulate, [ id( track ) for track in tracks ] )
+                 for name, canManipulate, tracks in self.playlists ]
 
-        if len( albumList ) < len( self.albumList ) / 2:
-            print( '*** ignoring sudden drop in album count ***' )
-            return
+    #
+    # Fold in the contents of OTHER, a LibraryBuilder that processed a
+    # different set of track records. Albums of OTHER that we already have give
+    # up their tracks to ours; the rest are adopted along with new artists and
+    # genres. Must be called before finish().
+    #
+    def merge( self, other ):
+        self.signatures.update( other.signatures )
+        self.tracks.update( other.tracks )
 
         #
-        # Now install the new data structures.
+        # First place every album of OTHER under the artist that owns it.
+        # Remember where each one ended up for the artist links below.
         #
-        self.artistMap = artistMap
-        self.artistList = artistList
-        self.albumList = albumList
+        merged = {}
+        for album in other.albumList:
+            artist = self.makeArtist( album.artist )
+            existing = self.albumIndex.get( ( artist.key, album.key ) )
+            if existing is None:
+                album.artist = artist
+                self.linkAlbum( artist, album )
+                self.addItem( 'albumList', album )
+                if album.genre is not None:
+                    album.genre = self.makeGenre( album.genre )
+                    album.genre.addAlbum( album )
+                existing = album
+            else:
+                for track in album.tracks:
+                    track.album = existing
+                    existing.addTrack( track )
+            merged[ id( album ) ] = existing
 
         #
-        # Obtain a sorted list of genre names.
+        # Now recreate the links between artists and the albums they appear
+        # on.
         #
-        self.genreMap = genreMap
-        self.genreList = genreList
+        for each in other.artistList:
+            artist = self.makeArtist( each )
+            for album in each.albums:
+                album = merged[ id( album ) ]
+                if ( artist.key, album.key ) not in self.albumIndex:
+                    self.linkAlbum( artist, album )
+
+    #
+    # Process one playlist record, where PLAYLIST is the Python dictionary
+    # holding the attributes found in the XML file for the playlist. Must be
+    # called after all of the tracks have been added. If given, TRACKIDS maps
+    # the track IDs used by the playlist to persistent IDs.
+    #
+    def addPlaylist( self, playlist, trackIds = None ):
 
         #
-        # Create Playlist objects to represent meaningful playlists.
+        # Playlists to ignore
         #
-        playlistList = []
-        for each in parser.getPlaylists():
-            
+        if playlist.get( 'Master', False ): return
+        if playlist.get( 'Folder', False ): return
+
+        #
+        # Determine if this playlist is one that the user may manipulate.
+        #
+        canManipulate = True
+        if playlist.get( 'Smart Info', False ): canManipulate = False
+        if playlist.get( 'Distinguished Kind', False ): canManipulate = False
+
+        tracks = []
+        for item in playlist.get( 'Playlist Items', [] ):
+
             #
-            # Playlists to ignore
+            # NOTE: playlists references tracks by its 'Track ID' element, not
+            # by their 'Persistent ID' element.
             #
-            if each.get( 'Master', False ): continue
-            if each.get( 'Folder', False ): continue
+            trackId = item[ 'Track ID' ]
+            if trackIds is not None:
+                trackId = trackIds.get( trackId )
+            track = self.tracks.get( trackId )
 
             #
-            # Obtain the iTunes playlist object with the same name
+            # This should always be true...
             #
-            name = each.get( 'Name' )
-            
+            if track:
+                tracks.append( track )
+
+        self.playlists.append( ( playlist.get( 'Name' ), canManipulate,
+                                 tracks ) )
+
+    #
+    # Pickle support for the library snapshot. The mappings only speed up
+    # lookups of what the lists already hold, so leave them out and make them
+    # again from the lists afterwards. A restored builder is not shared with
+    # any snapshot.
+    #
+    kDerivedState = ( 'tracks', 'artistMap', 'genreMap', 'albumIndex',
+                      'strings', 'shared', 'owned' )
+
+    def __getstate__( self ):
+        state = dict( self.__dict__ )
+        for name in self.kDerivedState:
+            del state[ name ]
+        return state
+
+    def __setstate__( self, state ):
+        self.__dict__.update( state )
+        self.shared = set()
+        self.owned = None
+        self.artistMap = dict( [ ( artist, artist )
+                                 for artist in self.artistList ] )
+        self.genreMap = dict( [ ( genre, genre )
+                                for genre in self.genreList ] )
+        albumIndex = {}
+        for artist in self.artistList:
+            for album in artist.albums:
+                albumIndex[ ( artist.key, album.key ) ] = album
+        self.albumIndex = albumIndex
+
+        tracks = {}
+        strings = {}
+        for album in self.albumList:
+            for track in album.tracks:
+                tracks[ track.id ] = track
+                tracks[ track.trackId ] = track
+                strings[ track.artistName ] = track.artistName
+                strings[ track.albumName ] = track.albumName
+        self.tracks = tracks
+        self.strings = strings
+
+    #
+    # Done processing the tracks. Sort the artists and albums by their keys.
+    #
+    def finish( self ):
+        self.artistList.sort( key = OrderedItem.sortKey )
+        self.albumList.sort( key = OrderedItem.sortKey )
+        self.genreList.sort( key = OrderedItem.sortKey )
+        self.finished = True
+
+    #
+    # Note that a LibrarySnapshot now shares our containers and model objects.
+    # Sorts the albums of each artist and the tracks of each album that we
+    # changed, since the browsers must not have to do it in place.
+    #
+    def freeze( self ):
+        if self.owned is None:
+            items = itertools.chain( self.artistList, self.genreList,
+                                     self.albumList )
+        else:
+            items = self.owned.itervalues()
+        for item in items:
+            if isinstance( item, Album ):
+                item.getTracks()
+            else:
+                item.getAlbums()
+        self.shared = set( self.kSharedContainers )
+        self.owned = {}
+
+#
+# Track handler for an XMLParser that compares the track records of the XML
+# file against the library held by a LibraryBuilder object. Does not change
+# the library; LibraryBuilder.applyChanges() does that with the results.
+#
+class LibraryDiffer( object ):
+
+    def __init__( self, builder ):
+        self.builder = builder
+        self.startTime = datetime.now()
+        self.stamp = None       # getFileStamp() value of the XML file
+        self.seen = set()       # Persistent IDs found in the XML file
+        self.trackIds = {}      # Mapping of track IDs to persistent IDs
+        self.changed = []       # Track records that are new or different
+        self.removed = []       # Persistent IDs no longer in the XML file
+        self.playlists = []     # Playlist records from the XML file
+
+    #
+    # Process one track record, where TRACK is the Python dictionary holding
+    # the attributes found in the XML file for the track.
+    #
+    def addTrack( self, track ):
+        id = str( track.get( 'Persistent ID' ) )
+        self.seen.add( id )
+        self.trackIds[ track.get( 'Track ID' ) ] = id
+        if self.builder.signatures.get( id ) != \
+                self.builder.makeSignature( track ):
+            self.changed.append( track )
+
+    #
+    # Done processing the tracks. Determine which tracks have gone away, and
+    # hold on to the PLAYLISTS records.
+    #
+    def finish( self, playlists ):
+        for id in self.builder.signatures:
+            if id not in self.seen:
+                self.removed.append( id )
+        self.seen = None
+        self.playlists = playlists
+
+    #
+    # Fold in what another LibraryDiffer found for a different set of track
+    # records: SEEN, TRACKIDS and CHANGED are the contents of its seen,
+    # trackIds and changed attributes. Must be called before finish().
+    #
+    def merge( self, seen, trackIds, changed ):
+        self.seen.update( seen )
+        self.trackIds.update( trackIds )
+        self.changed.extend( changed )
+
+    #
+    # Pickle support for the changes kept with the library snapshot (see
+    # iTunesXML.saveChanges()). The library compared against is not part of
+    # them, and only the track IDs used by the playlists are.
+    #
+    def __getstate__( self ):
+        state = dict( self.__dict__ )
+        state[ 'builder' ] = None
+        trackIds = {}
+        for playlist in self.playlists:
+            for item in playlist.get( 'Playlist Items', [] ):
+                trackId = item[ 'Track ID' ]
+                if trackId in self.trackIds:
+                    trackIds[ trackId ] = self.trackIds[ trackId ]
+        state[ 'trackIds' ] = trackIds
+        return state
+
+#
+# Determine if the lists of OrderedItem objects ITEMS and OTHER hold items
+# with the same keys in the same order.
+#
+def haveSameKeys( items, other ):
+    if items is other:
+        return True
+    if len( items ) != len( other ):
+        return False
+    for index in xrange( len( items ) ):
+        if items[ index ].key != other[ index ].key:
+            return False
+    return True
+
+#
+# The contents of the library at one point in time: the artist, album, genre,
+# and playlist containers that the browsers work with. Neither the containers
+# nor the model objects in them change once the snapshot is made, so a new
+# library is installed with a single assignment and no one sees a mix of old
+# and new contents. The snapshot shares them with the LibraryBuilder that made
+# them, which copies whatever it must change afterwards (see
+# LibraryBuilder.freeze()). The only things added to a snapshot later are
+# derived from its contents when first asked for: the track list, the search
+# indices and the jump tables.
+#
+# Each snapshot has a generation number that increases with every change.
+# Anything derived from the library contents may hold on to the generation
+# number it was made from to know when it is out of date.
+#
+class LibrarySnapshot( object ):
+
+    #
+    # Constructor. GENERATION is the generation number of the new snapshot.
+    # If given, BUILDER is the LibraryBuilder object to take the containers
+    # from, and PLAYLISTLIST is the list of Playlist objects to use.
+    #
+    def __init__( self, generation, builder = None, playlistList = None ):
+        self.generation = generation
+        if builder is None:
+            self.tracks = {}
+            self.artistMap = {}
+            self.artistList = []
+            self.albumList = []
+            self.albumIndex = {}
+            self.genreMap = {}
+            self.genreList = []
+        else:
+            builder.freeze()
+            self.tracks = builder.tracks
+            self.artistMap = builder.artistMap
+            self.artistList = builder.artistList
+            self.albumList = builder.albumList
+            self.albumIndex = builder.albumIndex
+            self.genreMap = builder.genreMap
+            self.genreList = builder.genreList
+        if playlistList is None:
+            playlistList = []
+        self.setPlaylists( playlistList )
+        self.trackList = None
+        self.searchIndices = {}
+        self.keypadIndices = {}
+        self.jumpTables = {}
+
+        #
+        # The indices may be made in a separate thread (see
+        # iTunesXML.prepareIndices()) while the browsers ask for them.
+        #
+        self.indexLock = threading.Lock()
+
+    #
+    # Install PLAYLISTLIST, a sorted list of Playlist objects, as the
+    # playlists of this snapshot, along with mappings for finding them by
+    # name. Like genreMap, the first mapping is keyed by OrderedItem, so names
+    # match by their key values. The second one is keyed by the names
+    # themselves.
+    #
+    def setPlaylists( self, playlistList ):
+        self.playlistList = playlistList
+        self.playlistMap = dict( [ ( playlist, playlist )
+                                   for playlist in playlistList ] )
+        self.playlistNames = dict( [ ( playlist.getName(), playlist )
+                                     for playlist in playlistList ] )
+
+    #
+    # Obtain the Playlist object whose name matches NAME, or None if there is
+    # none. The same name is asked for on every display refresh, so look for
+    # it as is before making an OrderedItem for it.
+    #
+    def getPlaylist( self, name ):
+        playlist = self.playlistNames.get( name )
+        if playlist is None:
+            playlist = self.playlistMap.get( OrderedItem( name ) )
+        return playlist
+
+    #
+    # Obtain the list of all Track objects, ordered by track name. Made the
+    # first time it is asked for.
+    #
+    def getTrackList( self ):
+        if self.trackList is None:
+            trackList = []
+            for album in self.albumList:
+                trackList.extend( album.tracks )
+            trackList.sort( key = Track.nameKey )
+            self.trackList = trackList
+        return self.trackList
+
+    #
+    # Make our list of all Track objects from the one held by PREVIOUS, an
+    # earlier LibrarySnapshot, which is mostly in order already.
+    #
+    def updateTrackList( self, previous ):
+        tracks = self.tracks
+        trackList = [ track for track in previous.trackList
+                      if tracks.get( track.id ) is track ]
+        keys = [ track.name.key for track in trackList ]
+        before = previous.tracks
+        for key, track in tracks.iteritems():
+            if key == track.id and before.get( key ) is not track:
+                index = bisect_right( keys, track.name.key )
+                keys.insert( index, track.name.key )
+                trackList.insert( index, track )
+        return trackList
+
+    #
+    # Obtain the list of albums (KIND is 'album'), artists (KIND is 'artist')
+    # or tracks (KIND is 'track') of this snapshot.
+    #
+    def getItems( self, kind ):
+        if kind == 'album':
+            return self.albumList
+        elif kind == 'artist':
+            return self.artistList
+        return self.getTrackList()
+
+    #
+    # Obtain the SubstringIndex object for searching the items of KIND (see
+    # getItems()). The index is made the first time it is asked for.
+    #
+    def getSearchIndex( self, kind ):
+        return self.getIndex( self.searchIndices, SubstringIndex, kind )
+
+    #
+    # Obtain the KeypadIndex object for the items of KIND (see getItems()).
+    # The index is made the first time it is asked for.
+    #
+    def getKeypadIndex( self, kind ):
+        return self.getIndex( self.keypadIndices, KeypadIndex, kind )
+
+    #
+    # Obtain the index held in INDICES for the items of KIND, making it with
+    # FACTORY if there is none yet. Only one thread makes a given index; any
+    # other that asks for it meanwhile waits for the result.
+    #
+    def getIndex( self, indices, factory, kind ):
+        index = indices.get( kind )
+        if index is None:
+            self.indexLock.acquire()
             try:
-                playlistObject = GetApp().user_playlists[ name ].get()
-            except appscript.reference.CommandError:
-                print( 'failed to get playlist', name )
+                index = indices.get( kind )
+                if index is None:
+                    index = factory( self.getItems( kind ) )
+                    indices[ kind ] = index
+            finally:
+                self.indexLock.release()
+        return index
+
+    #
+    # Obtain the JumpTable object for ITEMS. For the lists held by this
+    # snapshot, the table is made the first time it is asked for and then
+    # kept. Any other list gets a new one.
+    #
+    def getJumpTable( self, items ):
+        table = self.jumpTables.get( id( items ) )
+        if table is None:
+            table = JumpTable( items, self.generation )
+            for value in ( self.albumList, self.artistList, self.genreList,
+                           self.playlistList, self.trackList ):
+                if items is value:
+                    self.jumpTables[ id( items ) ] = table
+                    break
+        return table
+
+    #
+    # Take on the indices of PREVIOUS, an earlier LibrarySnapshot, for the
+    # lists whose keys are the same in both, so that only the lists that a
+    # reload changed need new ones. The track list is the same if no track
+    # changed.
+    #
+    def reuseIndices( self, previous ):
+        if self.tracks is previous.tracks:
+            self.trackList = previous.trackList
+        elif previous.trackList is not None:
+            self.trackList = self.updateTrackList( previous )
+        for kind in ( 'album', 'artist', 'track' ):
+            found = [ ( indices, before[ kind ] ) for indices, before in
+                      ( ( self.searchIndices, previous.searchIndices ),
+                        ( self.keypadIndices, previous.keypadIndices ) )
+                      if kind in before ]
+            if not found:
+                continue
+            items = self.getItems( kind )
+            if not haveSameKeys( items, previous.getItems( kind ) ):
                 continue
+            for indices, index in found:
+                if index.items is not items:
+                    index = index.withItems( items )
+                indices[ kind ] = index
+
+    #
+    # Obtain the generation number of this snapshot.
+    #
+    def getGeneration( self ): return self.generation
+
+    #
+    # Obtain a new snapshot with generation number GENERATION that has the
+    # same contents as this one, but with PLAYLISTLIST for its playlists.
+    #
+    def withPlaylists( self, generation, playlistList ):
+        snapshot = copy.copy( self )
+        snapshot.generation = generation
+        snapshot.setPlaylists( playlistList )
+        snapshot.jumpTables = {}
+        return snapshot
+
+#
+# Locate the track records in DATA, the contents of an iTunes XML file, and
+# divide them into at most COUNT slices of about the same size. Returns the
+# offsets of the 'Tracks' contents and a list of ( start, end ) offsets, one
+# for each slice. Each slice holds whole track records, which do not contain
+# any other <dict> elements. Returns None values if the 'Tracks' dictionary
+# was not found.
+#
+def findTrackSlices( data, count ):
+    start = data.find( '<key>Tracks</key>' )
+    if start == -1:
+        return None, None
+    start = data.find( '<dict>', start )
+    if start == -1:
+        return None, None
+    start += len( '<dict>' )
+
+    end = data.find( '<key>Playlists</key>', start )
+    if end == -1:
+        end = len( data )
+    end = data.rfind( '</dict>', start, end )
+    if end == -1:
+        return None, None
+
+    slices = []
+    sliceStart = start
+    for index in range( 1, count ):
+        sliceEnd = data.find( '</dict>', start + ( end - start ) * index / count,
+                              end )
+        if sliceEnd == -1:
+            break
+        sliceEnd += len( '</dict>' )
+        if sliceEnd > sliceStart:
+            slices.append( ( sliceStart, sliceEnd ) )
+            sliceStart = sliceEnd
+    slices.append( ( sliceStart, end ) )
+    return ( start, end ), slices
+
+#
+# Worker process function that builds the model objects for one slice of the
+# track records in an iTunes XML file. ARGS holds the path of the file and the
+# offsets of the slice as found by findTrackSlices(). Returns the
+# LibraryBuilder object that holds the results, or None if the parsing failed.
+#
+def buildTrackSlice( args ):
+    path, start, end = args
+    input = open( path, 'rb' )
+    try:
+        input.seek( start )
+        data = input.read( end - start )
+    finally:
+        input.close()
+
+    builder = LibraryBuilder()
+    parser = XMLParser( builder.addTrack )
+    if not parser.parseString( '<plist><dict><key>Tracks</key><dict>' + data +
+                               '</dict></dict></plist>' ):
+        return None
+    return builder
+
+#
+# The LibraryBuilder object that diffTrackSlice() compares against. Set in
+# each worker process by setDiffBuilder().
+#
+diffBuilder = None
+
+#
+# Worker process initializer that installs BUILDER for diffTrackSlice(). The
+# worker processes are forked, so BUILDER is not copied to get there.
+#
+def setDiffBuilder( builder ):
+    global diffBuilder
+    diffBuilder = builder
+
+#
+# Worker process function that compares one slice of the track records in an
+# iTunes XML file against the library held by diffBuilder. ARGS is as for
+# buildTrackSlice(). Returns the seen, trackIds and changed attributes of the
+# LibraryDiffer object that did the comparing (see LibraryDiffer.merge()), or
+# None if the parsing failed.
+#
+def diffTrackSlice( args ):
+    path, start, end = args
+    input = open( path, 'rb' )
+    try:
+        input.seek( start )
+        data = input.read( end - start )
+    finally:
+        input.close()
+
+    differ = LibraryDiffer( diffBuilder )
+    parser = XMLParser( differ.addTrack )
+    if not parser.parseString( '<plist><dict><key>Tracks</key><dict>' + data +
+                               '</dict></dict></plist>' ):
+        return None
+    return differ.seen, differ.trackIds, differ.changed
+
+#
+# Obtain the number of processors of this host, or 1 if it is not known.
+#
+def getProcessorCount():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except ( ImportError, NotImplementedError ):
+        return 1
+
+#
+# Collection of containers of iTune artists, albums, playlists, etc. Maintains
+# an AppleScript connection with an iTunes server
+# XML element object that describes the track.
+#
+class iTunesXML( object ):
+
+    #
+    # The minimum amount of time that must elapse before we will reload the
+    # iTunes XML file.
+    #
+    kLibraryReloadInterval = 60 * 5 # 5 minutes
+    
+    #
+    # The name of the playlist we use for playback
+    #
+    kOurPlaylistName = 'MBJB'
+
+    #
+    # Location of the snapshot of the last library load, kept next to the
+    # client settings file (pyslimp3.pkl). Change kSnapshotVersion whenever
+    # the model classes change so that older snapshots are ignored.
+    #
+    kSnapshotPath = 'pyslimp3-library.pkl'
+    kSnapshotVersion = 7
+
+    #
+    # Number of sets of changes that may be added to the snapshot file (see
+    # saveChanges()) before it is written out in full again.
+    #
+    kSnapshotChangeLimit = 10
+
+    #
+    # Number of worker processes to use when parsing the XML file, both for a
+    # full load and when looking for changes. Each one handles a slice of the
+    # track records, and we then merge the results together. Parsing in
+    # separate processes keeps the GIL free for the display updates, and it
+    # finishes sooner on multi-core hosts. A value below 2 parses everything
+    # in the loading thread, as happens on a single processor.
+    #
+    kParseProcesses = getProcessorCount()
+
+    #
+    # Transitions from one repeat mode to the next.
+    #
+    kRepeatTransitions = { 'off': 'all', 'all': 'one', 'one': 'off' }
+
+    #
+    # Player state values to show if iTunes does not answer before we have
+    # ever heard from it (see PlayerStatus).
+    #
+    kStatusDefaults = { 'state': 'stopped', 'position': 0, 'volume': 0,
+                        'mute': False, 'playlist': kOurPlaylistName,
+                        'track': None, 'shuffle': False, 'repeat': 'off' }
+
+    #
+    # Constructor. PLAYER is the PlayerBackend object to control. If not
+    # given, we control iTunes with an AppscriptPlayer object. XMLFILEPATH is
+    # the location of the library XML file to load. If not given, we ask the
+    # system for the one that iTunes uses.
+    #
+    # All requests to the player go through a GuardedPlayer, so a player that
+    # hangs cannot hang the server with it.
+    #
+    def __init__( self, player = None, xmlFilePath = None ):
+        if player is None:
+            from AppscriptPlayer import AppscriptPlayer
+            player = AppscriptPlayer()
+        self.player = GuardedPlayer( player )
+
+        if xmlFilePath is None:
 
             #
-            # Determine if this playlist is one that the user may manipulate.
+            # Get the location of the iTunes XML file. Apparently we can get
+            # it from the MacOS X defaults database. Look ma! No error
+            # checking!
             #
-            canManipulate = True
-            if each.get( 'Smart Info', False ): canManipulate = False
-            if each.get( 'Distinguished Kind', False ): canManipulate = False
+            pipe = subprocess.Popen( ['defaults', 'read', 'com.apple.iapps',
+                                      'iTunesRecentDatabases' ], 
+                                     stdout = subprocess.PIPE )
+            content = pipe.communicate()[ 0 ]
+            lines = content.split()
+            location = eval( lines[ 1 ] )
+            print( 'location:', location )
 
             #
-            # Create a new Playlist object and add Track objects to it.
+            # Convert the (file:) URL from above into a local file path. NOTE:
+            # strip off any 'file://localhost/' since it appears to hang when
+            # we do not have a network connection. *FIXME*
             #
-            playlist = Playlist( playlistObject, name, canManipulate )
-            playlistList.append( playlist )
+            if location.find( 'file://localhost/' ) == 0:
+                location = location[ 16 : ]
 
-            items = each.get( 'Playlist Items', [] )
-            for item in items:
-                
-                #
-                # NOTE: playlists references tracks by its 'Track ID' element,
-                # not by their 'Persistent ID' element.
-                #
-                trackId = item[ 'Track ID' ]
-                track = tracks.get( trackId )
-                
-                #
-                # This should always be true...
-                #
-                if track:
-                    playlist.tracks.append( track )
+            xmlFilePath, headers = urllib.urlretrieve( location )
+
+        self.xmlFilePath = xmlFilePath
+        self.backgroundLoader = None
+        self.loadedTimeStamp = None
+        self.builder = None           # LibraryBuilder of the installed library
+        self.pendingChanges = None    # LibraryDiffer from a background reload
+        self.pendingLibrary = None    # LibrarySnapshot made for the changes
+        self.snapshotChanges = None   # Sets of changes in the snapshot file
 
         #
-        # Order the available playlists and install
+        # Initialize iTunes containers. Always replace the LibrarySnapshot
+        # object as a whole, never change it.
         #
-        playlistList.sort()
-        self.playlistList = playlistList
+        self.generations = itertools.count( 1 )
+        self.library = LibrarySnapshot( 0 )
+        self.searchCache = SearchCache()
+
+        #
+        # Player state shared by all clients for the current refresh tick,
+        # and counts of the calls made to iTunes for it.
+        #
+        self.status = PlayerStatus( None, dict( self.kStatusDefaults ) )
+        self.statusTicks = 0
+        self.statusCalls = 0
+        self.statusLastCalls = 0
+        self.statusMaxCalls = 0
+
+        #
+        # Track object made for the last current track that was not in the
+        # library (see fetchCurrentTrack()).
+        #
+        self.otherTrack = None
+
+        #
+        # Estimate of the playback position, so that iTunes need not be asked
+        # for it on every refresh tick.
+        #
+        self.positionTracker = PositionTracker()
+
+    #
+    # See if we should reload the iTunes XML file. If so, we look for changes
+    # in a separate thread, and install the library it makes here once it is
+    # done.
+    #
+    def reloadCheck( self ):
+
+        #
+        # See if we have a background thread running. If so, don't continue.
+        #
+        if self.backgroundLoader:
+            if self.backgroundLoader.isAlive():
+                return
+
+            #
+            # Reap the thread and install what it found.
+            #
+            self.backgroundLoader.join()
+            self.backgroundLoader = None
+            differ = self.pendingChanges
+            if differ is not None:
+                self.pendingChanges = None
+                self.loadedTimeStamp = differ.startTime
+            library = self.pendingLibrary
+            if library is not None:
+                self.pendingLibrary = None
+                self.library = library.withPlaylists(
+                    self.generations.next(),
+                    self.makePlaylists( self.builder ) )
+            return
+
+        #
+        # If the library never loaded, there is nothing to bring up to date.
+        #
+        if self.loadedTimeStamp is None:
+            return
+
+        #
+        # See if the modified timestamp of the XML file is later than the time
+        # stamp of the last load. If not, don't continue.
+        #
+        when = datetime.fromtimestamp( stat( self.xmlFilePath )[ ST_MTIME ] )
+        if when <= self.loadedTimeStamp:
+            return
+
+        #
+        # Only reload if kLibraryReloadInterval seconds has passed since the
+        # last reload.
+        #
+        delta = datetime.now() - self.loadedTimeStamp
+        if delta.seconds < self.kLibraryReloadInterval:
+            return
+
+        #
+        # Create a background loader thread and start it.
+        #
+        self.backgroundLoader = threading.Thread( target = self.reload )
+        self.backgroundLoader.start()
+
+    #
+    # Load the iTunes XML file. Only does what it must before the library can
+    # be used; the rest happens in a separate thread (see finishLoad()).
+    #
+    def load( self ):
+
+        print( '... loading XML file', self.xmlFilePath )
+        start = time()
+
+        #
+        # Start from the snapshot of a previous load if there is one, and only
+        # parse the whole file if there is not. A snapshot made from an older
+        # version of the XML file is used as is until the changes found in the
+        # file have been applied.
+        #
+        stamp = self.getFileStamp()
+        builder, snapshotStamp = self.restoreSnapshot()
+        parsed = builder is None
+        if parsed:
+            builder = self.parse()
+            if builder is None:
+                return
+
+        if len( builder.artistList ) < len( self.library.artistList ) / 2:
+            print( '*** ignoring sudden drop in artist count ***' )
+            return
+
+        if len( builder.albumList ) < len( self.library.albumList ) / 2:
+            print( '*** ignoring sudden drop in album count ***' )
+            return
+
+        #
+        # Create Playlist objects to represent meaningful playlists, and then
+        # install the new data structures in one go.
+        #
+        library = self.makeLibrary( builder, self.makePlaylists( builder ) )
+        self.builder = builder
+        self.library = library
 
         #
         # Update the loaded timestamp so we can detect when the XML file
         # changes in the future.
         #
         self.loadedTimeStamp = datetime.now()
-        duration = self.loadedTimeStamp - startTime
+        print( '... finished in %.2f seconds' % ( time() - start, ) )
+
+        #
+        # Make the search indices, save a new snapshot if we had to parse the
+        # XML file, and look for the changes that the snapshot is missing.
+        # reloadCheck() applies whatever changes are found.
+        #
+        self.backgroundLoader = threading.Thread(
+            target = self.finishLoad,
+            args = ( library, stamp, builder, parsed,
+                     not parsed and snapshotStamp != stamp ) )
+        self.backgroundLoader.start()
+
+    #
+    # Finish what load() started for LIBRARY, made from BUILDER: make its
+    # search indices, save a snapshot of BUILDER for the XML file with STAMP
+    # if SAVE is True, and look for changes in the XML file if STALE is True.
+    # Runs in a separate thread.
+    #
+    def finishLoad( self, library, stamp, builder, save, stale ):
+        self.prepareIndices( library )
+        if save:
+            self.saveSnapshot( stamp, builder )
+        if stale:
+            self.reload()
 
-        print( '... finished in', duration.seconds, 'seconds' )
+    #
+    # Create a new LibrarySnapshot for BUILDER and PLAYLISTLIST. Returns the
+    # new LibrarySnapshot object. Its search indices are made when first
+    # asked for, unless prepareIndices() gets to them first.
+    #
+    def makeLibrary( self, builder, playlistList ):
+        return LibrarySnapshot( self.generations.next(), builder,
+                                playlistList )
+
+    #
+    # Make the search indices of LIBRARY, a LibrarySnapshot object, so that
+    # the browsers do not have to wait for them. Runs in a separate thread.
+    # Reports the time taken and the size of each pair of indices; those
+    # carried over from an earlier snapshot take no time.
+    #
+    def prepareIndices( self, library ):
+        for kind in ( 'album', 'artist', 'track' ):
+            start = time()
+            search = library.getSearchIndex( kind )
+            keypad = library.getKeypadIndex( kind )
+            print( '... %s indices in %.2fs: %r, %r' % (
+                    kind, time() - start, search, keypad ) )
+
+    #
+    # Look for changes in the iTunes XML file since the last load, and apply
+    # them. Runs in a separate thread, so the installed LibrarySnapshot keeps
+    # its contents while the changes go to copies of the containers and model
+    # objects that they affect (see LibraryBuilder). If anything changed, the
+    # new snapshot is left for reloadCheck() to install, with the indices of
+    # the lists that did not change carried over and the rest made here.
+    # Only the changes are added to the snapshot file.
+    #
+    def reload( self ):
+        print( '... checking XML file for changes', self.xmlFilePath )
+        builder = self.builder
+        differ = self.diff( builder )
+        if differ is None:
+            return
+
+        print( '... applying', len( differ.changed ), 'changed and',
+               len( differ.removed ), 'removed tracks' )
+        if builder.applyChanges( differ ):
+            library = LibrarySnapshot( 0, builder )
+            library.reuseIndices( self.library )
+            self.prepareIndices( library )
+            self.pendingLibrary = library
+
+        #
+        # Save the changes even if they were empty so that the next startup
+        # knows the snapshot is current.
+        #
+        self.saveChanges( differ, builder )
+        self.pendingChanges = differ
+
+    #
+    # Create Playlist objects for the playlists held by BUILDER. Reuses our
+    # existing Playlist objects when possible to avoid asking iTunes for them
+    # again. Returns the new list of Playlist objects, sorted by name.
+    #
+    def makePlaylists( self, builder ):
+        existing = {}
+        for playlist in self.library.playlistList:
+            existing[ playlist.getName() ] = playlist
+
+        playlistList = []
+        for name, canManipulate, tracks in builder.playlists:
+            playlist = existing.get( name )
+            if playlist is not None:
+                playlistList.append(
+                    playlist.withTracks( list( tracks ), canManipulate ) )
+                continue
+
+            #
+            # Obtain the player's playlist object with the same name
+            #
+            try:
+                playlistObject = self.player.findPlaylist( name, tracks )
+            except PlayerError:
+                playlistObject = None
+            if playlistObject is None:
+                print( 'failed to get playlist', name )
+                continue
+            playlist = Playlist( self.player, playlistObject, name,
+                                 canManipulate )
+            playlist.setTracks( list( tracks ) )
+            playlistList.append( playlist )
+
+        playlistList.sort( key = OrderedItem.sortKey )
+        return playlistList
+
+    #
+    # Parse the iTunes XML file. Returns a LibraryBuilder object holding the
+    # library contents, or None if the parsing failed.
+    #
+    def parse( self ):
+
+        #
+        # Build the model objects as each track record is parsed, either here
+        # or in worker processes. Don't continue if the parsing failed.
+        #
+        builder = LibraryBuilder()
+        multiprocessing = self.getMultiprocessing()
+        if multiprocessing is not None:
+            parser = self.parseInParallel( multiprocessing, buildTrackSlice,
+                                           builder.merge )
+        else:
+            parser = self.parseFile( builder.addTrack )
+        if parser is None:
+            return None
+
+        for each in parser.getPlaylists():
+            builder.addPlaylist( each )
+        builder.finish()
+        return builder
+
+    #
+    # Obtain the multiprocessing module if the XML file is to be parsed by
+    # worker processes, or None if it is to be parsed in this one.
+    #
+    def getMultiprocessing( self ):
+        if self.kParseProcesses < 2:
+            return None
+        try:
+            import multiprocessing
+        except ImportError:
+            return None
+        return multiprocessing
+
+    #
+    # Parse the iTunes XML file in this process, giving each track record to
+    # TRACKHANDLER. Returns the XMLParser object that did the parsing, or None
+    # if the parsing failed.
+    #
+    def parseFile( self, trackHandler ):
+        parser = XMLParser( trackHandler )
+        if not parser.parseFile( self.xmlFilePath ):
+            print( '*** failed to parse XML file ***' )
+            return None
+        return parser
+
+    #
+    # Parse the iTunes XML file using a pool of kParseProcesses worker
+    # processes from the MULTIPROCESSING module. Each worker runs INITIALIZER
+    # with INITARGS when it starts, if given. WORKER is called in a worker
+    # with the path of the file and the offsets of a slice of the track
+    # records, and MERGE is called here with each result in file order.
+    # Returns the XMLParser object holding the playlists, or None if the
+    # parsing failed.
+    #
+    def parseInParallel( self, multiprocessing, worker, merge,
+                         initializer = None, initargs = () ):
+        input = open( self.xmlFilePath, 'rb' )
+        try:
+            data = mmap.mmap( input.fileno(), 0, access = mmap.ACCESS_READ )
+            try:
+                bounds, slices = findTrackSlices( data, self.kParseProcesses )
+                if bounds is None:
+                    print( '*** failed to locate tracks in XML file ***' )
+                    return None
+
+                #
+                # Parse what surrounds the track records for the playlists.
+                #
+                parser = XMLParser()
+                if not parser.parseString( data[ : bounds[ 0 ] ] +
+                                           data[ bounds[ 1 ] : ] ):
+                    print( '*** failed to parse XML file ***' )
+                    return None
+            finally:
+                data.close()
+        finally:
+            input.close()
+
+        #
+        # Have the workers handle the track records. Merge the results in file
+        # order as they arrive.
+        #
+        pool = multiprocessing.Pool( self.kParseProcesses, initializer,
+                                     initargs )
+        try:
+            for part in pool.imap( worker, [ ( self.xmlFilePath, start, end )
+                                             for start, end in slices ] ):
+                if part is None:
+                    print( '*** failed to parse XML file ***' )
+                    return None
+                merge( part )
+        finally:
+            pool.terminate()
+            pool.join()
+        return parser
+
+    #
+    # Obtain the value that identifies the current contents of the XML file:
+    # its modification time and its size.
+    #
+    def getFileStamp( self ):
+        info = stat( self.xmlFilePath )
+        return ( info[ ST_MTIME ], info[ ST_SIZE ] )
+
+    #
+    # Compare the iTunes XML file against the library held by BUILDER. Returns
+    # a LibraryDiffer object holding the differences, or None if the parsing
+    # failed.
+    #
+    def diff( self, builder ):
+        differ = LibraryDiffer( builder )
+        differ.stamp = self.getFileStamp()
+        multiprocessing = self.getMultiprocessing()
+        if multiprocessing is not None:
+            parser = self.parseInParallel(
+                multiprocessing, diffTrackSlice,
+                lambda part: differ.merge( *part ), setDiffBuilder,
+                ( builder, ) )
+        else:
+            parser = self.parseFile( differ.addTrack )
+        if parser is None:
+            return None
+        differ.finish( parser.getPlaylists() )
+        return differ
+
+    #
+    # Write the contents of BUILDER to the snapshot file, tagged with STAMP,
+    # the value from getFileStamp() for the XML file that was parsed. The file
+    # holds two pickles: a small header to validate, followed by the library.
+    # saveChanges() may add more after them.
+    #
+    def saveSnapshot( self, stamp, builder ):
+        print( '... saving library snapshot', self.kSnapshotPath )
+        self.snapshotChanges = None
+        path = self.kSnapshotPath + '.tmp'
+        try:
+            output = open( path, 'wb' )
+            cPickle.dump( ( self.kSnapshotVersion, stamp ), output,
+                          cPickle.HIGHEST_PROTOCOL )
+            cPickle.dump( builder, output, cPickle.HIGHEST_PROTOCOL )
+            output.close()
+
+            #
+            # Only replace an existing snapshot once the new one is complete.
+            #
+            rename( path, self.kSnapshotPath )
+            self.snapshotChanges = 0
+        except Exception, err:
+            print( '*** failed to save library snapshot:', err )
+
+    #
+    # Add the changes found by the LibraryDiffer object DIFFER to the end of
+    # the snapshot file, so that the next startup does not have to find them
+    # again. Once there are kSnapshotChangeLimit sets of changes in the file,
+    # or if the file is not known to be good, write out BUILDER in full
+    # instead.
+    #
+    def saveChanges( self, differ, builder ):
+        if self.snapshotChanges is None or \
+                self.snapshotChanges >= self.kSnapshotChangeLimit:
+            self.saveSnapshot( differ.stamp, builder )
+            return
+
+        print( '... saving library changes', self.kSnapshotPath )
+        try:
+            output = open( self.kSnapshotPath, 'ab' )
+            try:
+                cPickle.dump( differ, output, cPickle.HIGHEST_PROTOCOL )
+            finally:
+                output.close()
+            self.snapshotChanges += 1
+        except Exception, err:
+            self.snapshotChanges = None
+            print( '*** failed to save library changes:', err )
+
+    #
+    # Read the library saved by saveSnapshot(). Returns the restored
+    # LibraryBuilder object and the stamp of the XML file it was made from, or
+    # None values if there is no usable snapshot.
+    #
+    # NOTE: the garbage collector is kept out of the way while the snapshot is
+    # read. Otherwise it runs over and over as the many model objects are made,
+    # and finds nothing to collect.
+    #
+    def restoreSnapshot( self ):
+        try:
+            input = open( self.kSnapshotPath, 'rb' )
+        except IOError:
+            return None, None
+
+        builder = None
+        stamp = None
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            try:
+                version, stamp = cPickle.load( input )
+                if version == self.kSnapshotVersion:
+                    builder = cPickle.load( input )
+                    print( '... restored library snapshot',
+                           self.kSnapshotPath )
+                    stamp = self.restoreChanges( input, builder, stamp )
+            except Exception, err:
+                print( '*** failed to restore library snapshot:', err )
+        finally:
+            input.close()
+            if collecting:
+                gc.enable()
+        return builder, stamp
+
+    #
+    # Apply the sets of changes that saveChanges() added to the snapshot file
+    # INPUT to BUILDER, the library read from it, which was made for the XML
+    # file with STAMP. Returns the stamp of the XML file that the last set of
+    # changes came from. A damaged set of changes ends the search, leaving
+    # the rest for the next reload to find again.
+    #
+    def restoreChanges( self, input, builder, stamp ):
+        count = 0
+        while True:
+            try:
+                differ = cPickle.load( input )
+            except EOFError:
+                break
+            except Exception, err:
+                print( '*** failed to restore library changes:', err )
+                return stamp
+            builder.applyChanges( differ )
+            stamp = differ.stamp
+            count += 1
+        print( '... restored', count, 'sets of library changes' )
+        self.snapshotChanges = count
+        return stamp
+
+    #
+    # Obtain the LibrarySnapshot object holding the current library contents.
+    #
+    def getLibrary( self ): return self.library
+
+    #
+    # Obtain the PlayerBackend object that we control.
+    #
+    def getPlayer( self ): return self.player
+
+    #
+    # Determine if the player is answering our requests. If not, the player
+    # state shown is the last one we know of.
+    #
+    def isPlayerResponding( self ): return self.player.isResponding()
+
+    #
+    # Obtain the generation number of the current library contents. Changes
+    # whenever the library does.
+    #
+    def getGeneration( self ): return self.library.generation
 
     #
     # Obtain the names of the genres in the iTunes library, as found during the
     # last XML load.
     #
-    def getGenreList( self ): return self.genreList
+    def getGenreList( self ): return self.library.genreList
 
     #
     # Obtain the number of genres in the iTunes library
     #
-    def getGenreCount( self ): return len( self.genreList )
+    def getGenreCount( self ): return len( self.library.genreList )
 
     #
     # Obtain the Genre object for a given key, where KEY may be an integer
@@ -887,7 +2393,7 @@ class iTunesXML( object ):
     #
     def getGenre( self, key ):
         if isinstance( key, int ):
-            genre = self.genreLists[ key ]
+            genre = self.library.genreList[ key ]
         else:
             
             #
@@ -896,27 +2402,28 @@ class iTunesXML( object ):
             if not isinstance( key, OrderedItem ):
                 key = OrderedItem( key )
 
-            genre = self.genreMap.get( key )
+            genre = self.library.genreMap.get( key )
         return genre
 
     #
     # Get the list of playlists in the iTunes library, as found during the last
     # XML load.
     #
-    def getPlaylistList( self ): return self.playlistList
+    def getPlaylistList( self ): return self.library.playlistList
     
     #
     # Obtain the number of playlists in the iTunes library
     #
-    def getPlaylistCount( self ): return len( self.playlistList )
+    def getPlaylistCount( self ): return len( self.library.playlistList )
     
     #
     # Obtain the Playlist object for a given key, where KEY may be an integer
     # index or a string name. NOTE: may return None
     #
     def getPlaylist( self, key, createIfMissing = False ):
+        playlistList = self.library.playlistList
         if isinstance( key, int ):
-            playlist = self.playlistList[ key ]
+            playlist = playlistList[ key ]
         else:
             
             #
@@ -925,14 +2432,7 @@ class iTunesXML( object ):
             if key == '':
                 key = self.kOurPlaylistName
 
-            #
-            # Search the sorted list for the given key name.
-            #
-            key2 = OrderedItem( key )
-            pos = bisect_left( self.playlistList, key2 )
-            playlist = self.playlistList[ pos ]
-            if playlist != key2:
-                playlist = None
+            playlist = self.library.getPlaylist( key )
 
         #
         # If not found, but creation is allowed, create it.
@@ -943,42 +2443,47 @@ class iTunesXML( object ):
         return playlist
 
     #
-    # Create a new playlist in iTunes under the given name NAME. Add to our
-    # internal list of playlists and reorder it.
+    # Create a new playlist in iTunes under the given name NAME. Install a new
+    # library snapshot with the playlist added to it.
     #
     def createPlaylist( self, name ):
         try:
-            playlist = GetApp().make( 
-                new = appscript.k.user_playlist,
-                with_properties = { appscript.k.name: name } )
-            playlist = Playlist( playlist, name, True )
-            self.playlistList.append( playlist )
-            self.playlistList.sort()
-        except appscript.reference.CommandError:
+            playlist = self.player.makePlaylist( name )
+            playlist = Playlist( self.player, playlist, name, True )
+            playlistList = self.library.playlistList + [ playlist ]
+            playlistList.sort( key = OrderedItem.sortKey )
+            self.library = self.library.withPlaylists(
+                self.generations.next(), playlistList )
+        except PlayerError:
             playlist = None
 
         return playlist
 
     #
     # Delete a playlist from iTunes, where PLAYLIST is an Playlist object.
+    # Returns True if iTunes deleted it.
     #
     def deletePlaylist( self, playlist ):
         try:
-            GetApp().playlists[ playlist.getName() ].delete()
-            self.playlistList.remove( playlist)
-        except appscript.reference.CommandError:
-            pass
+            self.player.deletePlaylist( playlist.playlistObject )
+        except PlayerError:
+            return False
+        playlistList = list( self.library.playlistList )
+        playlistList.remove( playlist )
+        self.library = self.library.withPlaylists(
+            self.generations.next(), playlistList )
+        return True
 
     #
     # Get the list of artists in the iTunes library, as found during the last
     # XML load.
     #
-    def getArtistList( self ): return self.artistList
+    def getArtistList( self ): return self.library.artistList
     
     #
     # Obtain the number of artists in the iTunes library
     #
-    def getArtistCount( self ): return len( self.artistList )
+    def getArtistCount( self ): return len( self.library.artistList )
 
     #
     # Obtain the Artist object for a given key, where KEY may be an integer
@@ -986,7 +2491,7 @@ class iTunesXML( object ):
     #
     def getArtist( self, key ):
         if isinstance( key, int ):
-            artist = self.artistList[ key ]
+            artist = self.library.artistList[ key ]
         else:
             
             #
@@ -995,27 +2500,28 @@ class iTunesXML( object ):
             if not isinstance( key, OrderedItem ):
                 key = OrderedItem( key )
 
-            artist = self.artistMap.get( key )
+            artist = self.library.artistMap.get( key )
         return artist
 
     #
     # Get the list of albums in the iTunes library, as found during the last
     # XML load.
     #
-    def getAlbumList( self ): return self.albumList
+    def getAlbumList( self ): return self.library.albumList
 
     #
     # Obtain the number of albums in the iTunes library
     #
-    def getAlbumCount( self ): return len( self.albumList )
+    def getAlbumCount( self ): return len( self.library.albumList )
 
     #
     # Obtain the Album object for a given key. where KEY may be an integer
     # index, an OrderedItem instance, or a string value. NOTE: may return None
     #
     def getAlbum( self, key ):
+        albumList = self.library.albumList
         if isinstance( key, int ):
-            album = self.albumList[ key ]
+            album = albumList[ key ]
         else:
 
             #
@@ -1024,75 +2530,211 @@ class iTunesXML( object ):
             #
             if not isinstance( key, OrderedItem ):
                 key = OrderedItem( key )
-            pos = bisect_left( self.albumList, key )
-            album = self.albumList[ pos ]
+            pos = bisect_left( albumList, key )
+            album = albumList[ pos ]
             if album != key:
                 album = None
         return album
 
+    #
+    # Obtain the Album object with the name ALBUMNAME among those associated
+    # with the artist named ARTISTNAME. NOTE: may return None
+    #
+    def getArtistAlbum( self, artistName, albumName ):
+        try:
+            key = ( OrderedItem( artistName ).getKey(),
+                    OrderedItem( albumName ).getKey() )
+        except ValueError:
+            return None
+        return self.library.albumIndex.get( key )
+
     #
     # Obtain a list of Album objects matching a given search term.
     #
     def searchForAlbum( self, term ):
-        return self.searchFor( self.albumList, term )
+        return self.searchLibrary( 'album', term )
 
     #
     # Obtain a list of Artist objects for those matching a given search term.
     #
     def searchForArtist( self, term ):
-        return self.searchFor( self.artistList, term )
+        return self.searchLibrary( 'artist', term )
 
     #
-    # Scan a container for elements containing a given search term, returning a
-    # list of matches.
+    # Obtain a list of the albums (KIND is 'album') or artists (KIND is
+    # 'artist') that come close to matching a given search term, closest ones
+    # first. For use when searchLibrary() finds nothing.
+    #
+    def fuzzySearchLibrary( self, kind, term ):
+        return self.library.getSearchIndex( kind ).fuzzySearch( term )
+
+    #
+    # Obtain a list of Track objects for those matching a given search term,
+    # best matches first.
+    #
+    def searchForTrack( self, term ):
+        found = self.searchLibrary( 'track', term )
+        return self.library.getSearchIndex( 'track' ).rank( found, term )
+
     #
-    def searchFor( self, container, term ):
+    # Obtain a list of the albums (KIND is 'album'), artists (KIND is
+    # 'artist') or tracks (KIND is 'track') matching a given search term.
+    # Recent results are kept in the search cache until the library changes.
+    #
+    def searchLibrary( self, kind, term ):
+        library = self.library
         term = term.upper()
-        found = []
-        for each in container:
-            if each.key.find( term ) != -1:
-                found.append( each )
+        found = self.searchCache.get( library.generation, kind, term )
+        if found is None:
+            found = library.getSearchIndex( kind ).search( term )
+            self.searchCache.put( library.generation, kind, term, found )
         return found
 
+    #
+    # Obtain the SearchCache object that holds recent search results.
+    #
+    def getSearchCache( self ): return self.searchCache
+
+    #
+    # Start a new refresh tick: record the number of calls made to iTunes for
+    # the last PlayerStatus object, and install a new one. Fetches the player
+    # state right away, since every client asks for it.
+    #
+    def refreshStatus( self ):
+        calls = self.status.getCallCount()
+        self.statusTicks += 1
+        self.statusCalls += calls
+        self.statusLastCalls = calls
+        self.statusMaxCalls = max( self.statusMaxCalls, calls )
+
+        #
+        # Until iTunes has carried out the commands sent to it, keep showing
+        # the values they are expected to produce.
+        #
+        expected = None
+        if kCommandQueue.getPendingCount():
+            expected = self.status.getExpected()
+        self.status = PlayerStatus( expected, self.status.getKnown() )
+        self.getPlayerState()
+
+    #
+    # Forget the player state of the current tick, so that the next request
+    # for each value asks iTunes for it.
+    #
+    def invalidateStatus( self ): self.status.clear()
+
+    #
+    # Obtain the PlayerStatus object for the current refresh tick.
+    #
+    def getStatus( self ): return self.status
+
+    #
+    # Obtain the number of calls made to iTunes for player state during the
+    # last refresh tick, the average over all ticks, and the most made in one
+    # tick.
+    #
+    def getStatusCallsPerTick( self ):
+        average = 0.0
+        if self.statusTicks:
+            average = float( self.statusCalls ) / self.statusTicks
+        return self.statusLastCalls, average, self.statusMaxCalls
+
+    #
+    # Send a command to iTunes without waiting for it to finish. COMMAND is
+    # called with the arguments ARGS in the command queue worker thread, so it
+    # must not change anything that the server loop uses. Once all of the
+    # commands sent have finished, the player state is fetched again.
+    #
+    def sendCommand( self, command, *args ):
+        RunCommand( command, args, self.commandDone )
+
+    #
+    # Like sendCommand(), but if the last command sent had the same KEY and is
+    # still waiting to run, let it do the work instead: it takes on ARGS, or
+    # MERGE( its arguments, ARGS ) if MERGE is given.
+    #
+    def sendLatestCommand( self, key, command, args, merge = None ):
+        RunCommand( command, args, self.commandDone, key, merge )
+
+    #
+    # Completion callback for the commands sent by sendCommand().
+    #
+    def commandDone( self ):
+        if kCommandQueue.getPendingCount() == 0:
+            self.positionTracker.reset()
+            self.invalidateStatus()
+
+    #
+    # Run the completion callbacks of the commands that have finished. Called
+    # from the server loop.
+    #
+    def processCompletions( self ):
+        kCommandQueue.processCompletions()
+
     #
     # Obtain the current iTunes volume setting.
     #
     def getVolume( self ): 
-        return int( GetApp().sound_volume.get() )
+        return self.status.get( 'volume',
+                                self.player.getVolume )
 
     #
     # Change the iTunes volume settiing, where VALUE is an integer from 0 to
     # 100.
     #
     def setVolume( self, value ):
-        GetApp().sound_volume.set( value )
+        self.requestVolume( value, 0 )
 
     #
     # Adjust the volume by a given DELTA value.
     #
     def adjustVolume( self, delta ): 
-        adjustment = delta
         old = self.getVolume()
         if ( old == 0 and delta < 0 ) or ( old == 100 and delta > 0 ):
             return
+        value = min( max( old + delta, 0 ), 100 )
+        self.requestVolume( value, delta )
 
-        #
-        # NOTE: some changes in volume apparently do not work. So, we add
-        # multiples of DELTA until the volume from iTunes indicates a change.
-        #
-        while old == self.getVolume():
-            self.setVolume( old + delta )
-            delta += adjustment
+    #
+    # Ask for the iTunes volume to become VALUE, reached by steps of
+    # ADJUSTMENT (see changeVolume()). The new value shows up right away.
+    # Requests made before iTunes gets to them collapse into the last one.
+    #
+    def requestVolume( self, value, adjustment ):
+        self.status.expect( 'volume', value )
+        self.sendLatestCommand( 'volume', self.changeVolume,
+                                ( value, adjustment ) )
+
+    #
+    # Set the iTunes volume to VALUE, reached by steps of ADJUSTMENT. Runs in
+    # the command queue worker thread.
+    #
+    # NOTE: some changes in volume apparently do not work. So, if the
+    # adjustment is not zero, we keep adding it until the volume from iTunes
+    # indicates a change.
+    #
+    def changeVolume( self, value, adjustment ):
+        player = self.player
+        old = player.getVolume()
+        while value != old:
+            player.setVolume( value )
+            if adjustment == 0 or value in ( 0, 100 ) or \
+                    old != player.getVolume():
+                break
+            value = min( max( value + adjustment, 0 ), 100 )
 
     #
     # Obtain the current iTunes mute setting.
     #
-    def getMute( self ): return GetApp().mute.get()
+    def getMute( self ):
+        return self.status.get( 'mute', self.player.getMute )
 
     #
     # Change the iTunes mute setting, where VALUE is 1 or 0
     #
-    def setMute( self, value ): GetApp().mute.set( value )
+    def setMute( self, value ):
+        self.status.expect( 'mute', value )
+        self.sendCommand( self.player.setMute, value )
 
     #
     # Toggle the iTunes mute setting.
@@ -1102,26 +2744,51 @@ class iTunesXML( object ):
     #
     # Get the current playlist. If there is not one, then use our playlist
     # (MBJB). This allows us to show what the user is playing via iTunes (or
-    # the Remote iPhone application). Returns a Playlist object
+    # the Remote iPhone application). Returns a Playlist object, or None if
+    # the playlist is missing and iTunes could not create it.
     #
     def getActivePlaylist( self ):
-        try:
-            name = GetApp().current_playlist.name.get()
-        except appscript.reference.CommandError:
+        return self.getPlaylist( self.status.get( 'playlist',
+                                                  self.fetchPlaylistName ),
+                                 True )
+
+    #
+    # Obtain the name of the current iTunes playlist, or our playlist name if
+    # there is not one.
+    #
+    def fetchPlaylistName( self ):
+        name = self.player.getCurrentPlaylistName()
+        if name is None:
             name = self.kOurPlaylistName
-        return self.getPlaylist( name, True )
+        return name
+
+    #
+    # Obtain the active playlist for a request to iTunes. Raises
+    # PlayerNotResponding if there is none, so that the last known value
+    # stands in.
+    #
+    def getRequestPlaylist( self ):
+        playlist = self.getActivePlaylist()
+        if playlist is None:
+            raise PlayerNotResponding, 'no active playlist'
+        return playlist
 
     #
     # Get the shuffle setting for the active playlist.
     #
     def getShuffle( self ): 
-        return self.getActivePlaylist().getShuffle()
+        return self.status.get(
+            'shuffle', lambda: self.getRequestPlaylist().getShuffle() )
     
     #
     # Set the shuffle setting for the active playlist
     #
     def setShuffle( self, value ): 
-        self.getActivePlaylist().setShuffle( value )
+        playlist = self.getActivePlaylist()
+        if playlist is None:
+            return
+        self.status.expect( 'shuffle', value )
+        self.sendCommand( playlist.setShuffle, value )
 
     #
     # Toggle the shuffle setting for the active playlist
@@ -1133,20 +2800,25 @@ class iTunesXML( object ):
     # Get the current repeat mode for the active playlist
     #
     def getRepeat( self ): 
-        return self.getActivePlaylist().getRepeat()
+        return self.status.get(
+            'repeat', lambda: self.getRequestPlaylist().getRepeat() )
 
     #
     # Set the repeat mode for the active playlist, where VALUE is one of
-    #  - appscript.k.off
-    #  - appscript.k.all
-    #  - appscript.k.one
+    #  - 'off'
+    #  - 'all'
+    #  - 'one'
     #
     def setRepeat( self, value ): 
-        self.getActivePlaylist().setRepeat( value )
+        playlist = self.getActivePlaylist()
+        if playlist is None:
+            return
+        self.status.expect( 'repeat', value )
+        self.sendCommand( playlist.setRepeat, value )
 
     #
     # Change the repeat mode of the active playlist to the next value in the
-    # cycle ( appscript.k.off, appscript.k.all, appscript.k.one )
+    # cycle ( 'off', 'all', 'one' )
     #
     def toggleRepeat( self ):
         self.setRepeat( self.kRepeatTransitions[ self.getRepeat() ] )
@@ -1156,100 +2828,190 @@ class iTunesXML( object ):
     # that was seen.
     #
     def getCurrentTrack( self ):
-        try:
-            track = Track( GetApp().current_track.get() )
-        except appscript.reference.CommandError:
+        track = self.status.get( 'track', self.fetchCurrentTrack )
+        if track is None:
             playlist = self.getActivePlaylist()
-            if playlist.getTrackCount():
+            if playlist is not None and playlist.getTrackCount():
                 track = playlist.getTrack( 0 )
-            else:
-                track = None
         return track
 
     #
-    # Get the current state of the iTunes player (playing, paused, stopped )
+    # Obtain the Track object for the current iTunes track, or None if there
+    # is none. Only the persistent ID comes from iTunes, and it locates the
+    # Track object of the loaded library. For a track that is not in the
+    # library, iTunes must supply all of the track's attributes, so hold on
+    # to the Track object made from them until the track changes.
+    #
+    def fetchCurrentTrack( self ):
+        id = self.player.getCurrentTrackID()
+        if id is None:
+            return None
+        track = self.library.tracks.get( id )
+        if track is not None:
+            return track
+        track = self.otherTrack
+        if track is None or track.getID() != id:
+            track = self.player.getCurrentTrack()
+            self.otherTrack = track
+        return track
+
+    #
+    # Get the current state of the iTunes player (see PlayerBackend.kStates)
     #
-    def getPlayerState( self ): return str( GetApp().player_state.get() )
+    def getPlayerState( self ):
+        return self.status.get( 'state', self.player.getPlayerState )
 
     #
     # Determine if iTunes is currently playing
     #
-    def isPlaying( self ): return self.getPlayerState() == 'k.playing'
+    def isPlaying( self ): return self.getPlayerState() == 'playing'
 
     #
     # Determine if iTunes is currently paused
     #
-    def isPaused( self ): return self.getPlayerState() == 'k.paused'
+    def isPaused( self ): return self.getPlayerState() == 'paused'
 
     #
     # Get the current position (seconds) of the iTunes player
     #
     def getPlayerPosition( self ): 
-        try:
-            return int( GetApp().player_position.get() )
-        except TypeError:
-            return 0
+        return self.status.get( 'position', self.trackPlayerPosition )
+
+    #
+    # Obtain the position (seconds) of the iTunes player from the position
+    # tracker, which only asks iTunes now and then.
+    #
+    def trackPlayerPosition( self ):
+        return self.positionTracker.getPosition( self.getCurrentTrack(),
+                                                 self.getPlayerState(),
+                                                 self.player.getPlayerPosition )
 
     #
     # Stop the iTunes player
     #
-    def stop( self ): GetApp().stop()
+    def stop( self ):
+        self.status.expect( 'state', 'stopped' )
+        self.sendCommand( self.player.stop )
     
     #
     # Start the iTunes player at the beginning of the current track
     #
-    def play( self ): GetApp().play()
+    def play( self ):
+        self.status.expect( 'state', 'playing' )
+        self.sendCommand( self.player.play )
     
     #
     # Clear the 'MBJB' playlist, add the Track object(s) of the given OBJECT
     # object to the PLAYLIST playlist and commence playback at the indicated
-    # track
+    # track. Returns False if there is no 'MBJB' playlist and iTunes could
+    # not create it.
     #
     def playObject( self, object, trackIndex = 0 ):
         playlist = self.getPlaylist( self.kOurPlaylistName, True )
+        if playlist is None:
+            return False
         playlist.clear()
 
         #
-        # Ask the object to add its Track objects to the MBJB playlist
+        # Add the object's Track objects to the MBJB playlist. Playback starts
+        # as soon as iTunes has the track to play, and the rest follow.
         #
-        object.addToPlaylist( playlist )
-        playlist.play( trackIndex )
+        tracks = object.getPlaylistTracks()
+        playlist.addTracks( tracks[ : trackIndex + 1 ] )
+        self.playPlaylist( playlist, trackIndex )
+        playlist.addTracks( tracks[ trackIndex + 1 : ] )
+        return True
+
+    #
+    # Ask iTunes to begin playing PLAYLIST at the track at TRACKINDEX. Shows
+    # the track as the current one right away.
+    #
+    def playPlaylist( self, playlist, trackIndex = 0 ):
+        if trackIndex < playlist.getTrackCount():
+            self.status.expect( 'state', 'playing' )
+            self.status.expect( 'playlist', playlist.getName() )
+            self.status.expect( 'track', playlist.getTrack( trackIndex ) )
+            self.status.expect( 'position', 0 )
+        self.sendCommand( playlist.play, trackIndex )
 
     #
     # Pause the iTunes player
     #
-    def pause( self ): GetApp().pause()
+    def pause( self ):
+        self.status.expect( 'state', 'paused' )
+        self.sendCommand( self.player.pause )
 
     #
     # Move the player to the beginning of the current track.
     #
-    def beginTrack( self ): GetApp().back_track()
+    def beginTrack( self ):
+        self.status.expect( 'position', 0 )
+        self.sendCommand( self.player.backTrack )
 
     #
     # Move the player to the previous track in the playlist
     #
-    def previousTrack( self ): GetApp().previous_track()
+    def previousTrack( self ):
+        self.skipTracks( -1 )
     
     #
     # Move the player to the next track in the playlist
     #
-    def nextTrack( self ): GetApp().next_track()
+    def nextTrack( self ):
+        self.skipTracks( 1 )
+
+    #
+    # Move the player OFFSET tracks through the playlist. Presses made before
+    # iTunes gets to them add up, so that one command moves by all of them.
+    #
+    def skipTracks( self, offset ):
+        self.sendLatestCommand( 'skip', self.moveTracks, ( offset, ),
+                                lambda old, new: ( old[ 0 ] + new[ 0 ], ) )
+
+    #
+    # Move the player OFFSET tracks through the playlist. Runs in the command
+    # queue worker thread.
+    #
+    def moveTracks( self, offset ):
+        while offset > 0:
+            self.player.nextTrack()
+            offset -= 1
+        while offset < 0:
+            self.player.previousTrack()
+            offset += 1
     
     #
     # Move the player backwards over the current track
     #
-    def rewind( self ): GetApp().rewind()
+    def rewind( self ):
+        self.sendCommand( self.player.rewind )
 
     #
     # Move the player fast-forward over the current track
     #
-    def fastForward( self ): GetApp().fast_forward()
+    def fastForward( self ):
+        self.sendCommand( self.player.fastForward )
     
     #
     # Resume normal playback of the current track (after rewind() or
     # fastForward())
     #
-    def resume( self ): GetApp().resume()
+    def resume( self ):
+        self.sendCommand( self.player.resume )
+
+    #
+    # Obtain the Track object of the loaded library that has the same
+    # persistent ID as TRACK, or TRACK itself if there is none (eg. the
+    # library is not loaded yet).
+    #
+    def getLibraryTrack( self, track ):
+        return self.library.tracks.get( track.getID(), track )
+
+    #
+    # Ratings come from the XML file, and we keep them up to date with the
+    # changes made here. A change shows up right away, and the matching
+    # iTunes command goes through the command queue.
+    #
 
     #
     # Obtain the current rating for the given ALBUM Album object.
@@ -1263,32 +3025,10 @@ class iTunesXML( object ):
             return 0
 
         #
-        # Get the first track for this album
+        # The album rating is kept with each track of the album, so use the
+        # one of the first track.
         #
-        track = album.getTrack( 0 )
-
-        #
-        # Get the iTunes track object for the first Track object.
-        #
-        id = track.getID()
-        track = GetLibrary().tracks[ 
-            appscript.its.persistent_ID == id ].get()[ 0 ]
-        
-        #
-        # Get the rating and its type for the first track
-        #
-        rating = track.album_rating.get()
-        ratingKind = track.album_rating_kind.get()
-
-        #
-        # If the user's album rating is 0, iTunes may return to us a computed
-        # value based on ratings of the album's tracks. We want to ignore such
-        # a rating for our purposes.
-        #
-        if repr( ratingKind ) == 'k.computed':
-            rating = 0
-
-        return rating
+        return album.getTrack( 0 ).getAlbumRating()
 
     #
     # Set a new rating for the given ALBUM Album object, where RATING is an
@@ -1302,43 +3042,21 @@ class iTunesXML( object ):
         if album.getTrackCount() == 0:
             return
 
-        id = album.getTrack( 0 ).getID()
-        GetLibrary().tracks[ 
-            appscript.its.persistent_ID == id ].album_rating.set( rating )
+        for track in album.getTracks():
+            track.setAlbumRating( rating )
+        RunCommand( self.player.setAlbumRating, ( album.getTrack( 0 ),
+                                                  rating ) )
 
     #
-    # Obtain the current rating for the given track AND the current rating for
-    # the track's album
+    # Obtain the current rating for the given track
     #
     def getTrackRating( self, track ):
-        
-        #
-        # Get the iTunes track object for the given Track object
-        #
-        id = track.getID()
-        track = GetLibrary().tracks[ 
-            appscript.its.persistent_ID == id ].get()[ 0 ]
-
-        #
-        # Get the rating and its type for the track
-        #
-        rating = track.rating.get()
-        ratingKind = track.rating_kind.get()
-
-        #
-        # If the user's track rating is 0, iTunes may return to us the rating
-        # value assigned to the track's album. We want to ignore such a rating
-        # for our purposes.
-        #
-        if repr( ratingKind ) == 'k.computed':
-            rating = 0
-
-        return rating
+        return self.getLibraryTrack( track ).getRating()
 
     #
     # Set a new rating for the given track
     #
     def setTrackRating( self, track, rating ):
-        id = track.getID()
-        GetLibrary().tracks[ 
-            appscript.its.persistent_ID == id ].rating.set( rating )
+        track = self.getLibraryTrack( track )
+        track.setRating( rating )
+        RunCommand( self.player.setTrackRating, ( track, rating ) )
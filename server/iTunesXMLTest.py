@@ -0,0 +1,172 @@
+#
+# Copyright (C) 2009, 2010, 2012 Brad Howes.
+#
+# This file is part of Pyslimp3.
+#
+# Pyslimp3 is free software; you can redistribute it and/or modify it under the
+# terms of the GNU General Public License as published by the Free Software
+# Foundation; either version 3, or (at your option) any later version.
+#
+# Pyslimp3 is distributed in the hope that it will be useful, but WITHOUT ANY
+# WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR
+# A PARTICULAR PURPOSE. See the GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with
+# Pyslimp3; see the file COPYING. If not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301,
+# USA.
+#
+
+
+import os, shutil, tempfile, unittest
+import iTunesXML
+from bench import makeTracks, writeLibrary
+from SimulatedPlayer import SimulatedPlayer
+
+#
+# Obtain a comparable description of the contents of LIBRARY, a
+# LibrarySnapshot object or a LibraryBuilder object that made one. Artists
+# appear with the names of their albums in the order kept by the library.
+#
+def describe( library ):
+    albums = sorted( [ ( album.getName(), album.getArtistName(),
+                         sorted( [ ( track.index, track.getID(),
+                                     track.getName(), track.rating )
+                                   for track in album.tracks ] ) )
+                       for album in library.albumList ] )
+    artists = [ ( artist.getName(),
+                  [ album.getName() for album in artist.albums ] )
+                for artist in library.artistList ]
+    genres = [ ( genre.getName(),
+                 sorted( [ album.getName() for album in genre.albums ] ) )
+               for genre in library.genreList ]
+    index = sorted( [ ( key, album.getName() ) for key, album in
+                      library.albumIndex.items() ] )
+    return albums, artists, genres, index
+
+#
+# Tests of loading and reloading the library from an iTunes XML file. Each
+# test writes a synthetic XML file (see bench.py) to a scratch directory.
+# Run with 'python -m unittest iTunesXMLTest'.
+#
+class iTunesXMLTest( unittest.TestCase ):
+
+    def setUp( self ):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join( self.directory, 'library.xml' )
+        self.tracks = list( makeTracks( 600 ) )
+        writeLibrary( self.path, self.tracks )
+        self.model = iTunesXML.iTunesXML( SimulatedPlayer(), self.path )
+        self.model.kSnapshotPath = os.path.join( self.directory,
+                                                 'library.pkl' )
+
+    def tearDown( self ):
+        shutil.rmtree( self.directory )
+
+    #
+    # Parse the XML file. Returns a new LibrarySnapshot of its contents.
+    #
+    def parse( self ):
+        return iTunesXML.LibrarySnapshot( 0, self.model.parse() )
+
+    #
+    # Change the XML file: rename, rate, move and remove a few tracks, and
+    # add one to an album of its own.
+    #
+    def changeLibrary( self ):
+        tracks = self.tracks
+        tracks[ 3 ] = dict( tracks[ 3 ], Name = u'Renamed' )
+        tracks[ 10 ] = dict( tracks[ 10 ], Rating = 80 )
+        tracks[ 20 ] = dict( tracks[ 20 ], Album = tracks[ 30 ][ u'Album' ],
+                             Artist = tracks[ 30 ][ u'Artist' ] )
+        del tracks[ 40 ]
+        added = dict( tracks[ 50 ], Album = u'Brand New' )
+        added[ u'Track ID' ] = 9999
+        added[ u'Persistent ID' ] = u'00000000DEADBEEF'
+        tracks.append( added )
+        writeLibrary( self.path, tracks )
+
+    #
+    # Applying changes to a builder leaves the snapshot made from it as it
+    # was, and gives the same contents as parsing the changed file.
+    #
+    def testApplyChangesCopiesOnWrite( self ):
+        builder = self.model.parse()
+        before = iTunesXML.LibrarySnapshot( 1, builder )
+        expected = describe( before )
+
+        self.changeLibrary()
+        differ = self.model.diff( builder )
+        self.assertEqual( len( differ.changed ), 4 )
+        self.assertEqual( len( differ.removed ), 1 )
+        self.failUnless( builder.applyChanges( differ ) )
+        after = iTunesXML.LibrarySnapshot( 2, builder )
+
+        self.assertEqual( describe( before ), expected )
+        self.assertEqual( describe( after ), describe( self.parse() ) )
+        self.assertNotEqual( describe( after ), expected )
+
+    #
+    # Indices of lists whose keys did not change carry over to the next
+    # snapshot.
+    #
+    def testReuseIndices( self ):
+        builder = self.model.parse()
+        before = iTunesXML.LibrarySnapshot( 1, builder )
+        self.model.prepareIndices( before )
+
+        self.tracks[ 10 ] = dict( self.tracks[ 10 ], Rating = 80 )
+        writeLibrary( self.path, self.tracks )
+        self.failUnless( builder.applyChanges( self.model.diff( builder ) ) )
+        after = iTunesXML.LibrarySnapshot( 2, builder )
+        after.reuseIndices( before )
+        for kind in ( 'album', 'artist', 'track' ):
+            index = after.getSearchIndex( kind )
+            self.failUnless( index.postings is
+                             before.getSearchIndex( kind ).postings )
+            self.failUnless( index.items is after.getItems( kind ) )
+        self.assertEqual( len( after.getTrackList() ), len( self.tracks ) )
+
+    #
+    # Changes added to the snapshot file are applied when it is restored.
+    #
+    def testRestoreChanges( self ):
+        builder = self.model.parse()
+        self.model.saveSnapshot( self.model.getFileStamp(), builder )
+        self.changeLibrary()
+        differ = self.model.diff( builder )
+        builder.applyChanges( differ )
+        self.model.saveChanges( differ, builder )
+        self.assertEqual( self.model.snapshotChanges, 1 )
+
+        restored, stamp = self.model.restoreSnapshot()
+        self.assertEqual( stamp, differ.stamp )
+        self.assertEqual( describe( restored ), describe( builder ) )
+
+    #
+    # Parsing and comparing the XML file in worker processes gives the same
+    # results as doing it in this one.
+    #
+    def testParallelParse( self ):
+        self.model.kParseProcesses = 1
+        builder = self.model.parse()
+        expected = describe( iTunesXML.LibrarySnapshot( 0, builder ) )
+        self.model.kParseProcesses = 3
+        parallel = self.model.parse()
+        self.assertEqual( describe( iTunesXML.LibrarySnapshot( 0,
+                                                               parallel ) ),
+                          expected )
+        self.assertEqual( parallel.signatures, builder.signatures )
+        self.assertEqual( [ ( name, [ track.getID() for track in tracks ] )
+                            for name, ignored, tracks in parallel.playlists ],
+                          [ ( name, [ track.getID() for track in tracks ] )
+                            for name, ignored, tracks in builder.playlists ] )
+
+        self.changeLibrary()
+        differ = self.model.diff( builder )
+        self.model.kParseProcesses = 1
+        expected = self.model.diff( builder )
+        self.assertEqual( differ.changed, expected.changed )
+        self.assertEqual( differ.removed, expected.removed )
+        self.assertEqual( differ.trackIds, expected.trackIds )
+        self.assertEqual( differ.playlists, expected.playlists )